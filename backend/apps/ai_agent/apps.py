@@ -3,4 +3,4 @@ from django.apps import AppConfig
 
 class AiAgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'ai_agent'
+    name = 'apps.ai_agent'
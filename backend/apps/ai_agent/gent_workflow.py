@@ -3,8 +3,8 @@ from langchain.llms import OpenAI
 from langchain.prompts import StringPromptTemplate
 from typing import List, Union
 import json
-from apps.nodes.models import Node, NodeEvent
-from apps.telemetry.models import NodeMetric
+from apps.nodes.models import Node, NodeEvent, NodeMetric
+from apps.telemetry.rollups import summarize_series
 from django.utils import timezone
 from datetime import timedelta
 
@@ -32,10 +32,14 @@ class AgenticWorkflow:
         issues = []
         recommendations = []
         
+        # CPU and memory averages come from the 1-minute rollups
+        window_end = timezone.now()
+        window_start = window_end - timedelta(minutes=30)
+        
         # CPU analysis
-        cpu_metrics = recent_metrics.filter(metric_type='cpu')
-        if cpu_metrics.exists():
-            avg_cpu = cpu_metrics.aggregate(Avg('data__overall_percent'))['avg']
+        cpu = summarize_series(node.id, 'cpu_percent', window_start, window_end)
+        if cpu is not None:
+            avg_cpu = cpu['avg']
             if avg_cpu > 85:
                 issues.append({
                     'type': 'cpu',
@@ -49,9 +53,9 @@ class AgenticWorkflow:
                 })
         
         # Memory analysis
-        memory_metrics = recent_metrics.filter(metric_type='memory')
-        if memory_metrics.exists():
-            avg_memory = memory_metrics.aggregate(Avg('data__percent_used'))['avg']
+        memory = summarize_series(node.id, 'memory_percent', window_start, window_end)
+        if memory is not None:
+            avg_memory = memory['avg']
             if avg_memory > 90:
                 issues.append({
                     'type': 'memory',
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import AlertRule
 
-# Register your models here.
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'organization', 'metric_type', 'path', 'comparator', 'threshold', 'duration', 'severity', 'is_active')
+    list_filter = ('is_active', 'metric_type', 'severity')
+    search_fields = ('name', 'path')
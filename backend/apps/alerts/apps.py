@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class AlertsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'alerts'
+    name = 'apps.alerts'
+    
+    def ready(self):
+        from . import engine  # noqa: F401, connects the rule change receivers
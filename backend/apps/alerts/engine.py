@@ -0,0 +1,205 @@
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+import uuid
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from apps.nodes.models import NodeEvent
+from apps.telemetry.series import LABEL_FIELDS, lookup
+from .models import AlertRule
+
+# Bumped whenever a rule changes; every process recompiles on a new version
+VERSION_KEY = 'alerts:rules:version'
+
+COMPARATORS = {
+    'gt': np.greater,
+    'gte': np.greater_equal,
+    'lt': np.less,
+    'lte': np.less_equal,
+    'eq': np.equal,
+    'ne': np.not_equal,
+}
+
+_compiled = {'version': None, 'index': {}}
+
+def state_key(node_id):
+    return f'alerts:state:{node_id}'
+
+def parse_path(path):
+    """Dotted metric path as lookup keys, digits index into lists"""
+    return tuple(int(key) if key.isdigit() else key for key in path.split('.'))
+
+class RuleGroup:
+    """Active rules of one organization on one metric path, as arrays
+
+    A value read once from the metric data is compared against every rule
+    of the group in a few vectorised operations, one per comparator.
+    """
+
+    def __init__(self, metric_type, path, rules):
+        self.key = f'{metric_type}:{path}'
+        self.path = parse_path(path)
+        self.rules = rules
+        self.position = {str(rule.id): i for i, rule in enumerate(rules)}
+        self.thresholds = np.array([rule.threshold for rule in rules], dtype=np.float64)
+        self.durations = np.array([rule.duration.total_seconds() for rule in rules])
+        self.labels = np.array([rule.label for rule in rules], dtype=object)
+        self.tags = [frozenset(rule.tags) for rule in rules]
+
+        comparators = np.array([rule.comparator for rule in rules])
+        self.comparators = [
+            (COMPARATORS[name], np.flatnonzero(comparators == name))
+            for name in set(comparators.tolist())
+        ]
+        self._scopes = {}
+
+    def scope(self, tags):
+        """Mask of the rules applying to a node with these tags, cached per tag set"""
+        tags = frozenset(tags)
+        if tags not in self._scopes:
+            self._scopes[tags] = np.array([required <= tags for required in self.tags], dtype=bool)
+        return self._scopes[tags]
+
+    def evaluate(self, value, label, tags):
+        """Masks of the rules applying to a sample and of those whose condition holds"""
+        holds = np.zeros(len(self.rules), dtype=bool)
+        for compare, idx in self.comparators:
+            holds[idx] = compare(value, self.thresholds[idx])
+
+        applies = self.scope(tags) & ((self.labels == '') | (self.labels == label))
+        return applies, applies & holds
+
+def compile_rules():
+    """Index of the active rules: (organization_id, metric_type) -> [RuleGroup]"""
+    by_path = defaultdict(list)
+    for rule in AlertRule.objects.filter(is_active=True).order_by('created_at'):
+        by_path[(rule.organization_id, rule.metric_type, rule.path)].append(rule)
+
+    index = defaultdict(list)
+    for (organization_id, metric_type, path), rules in by_path.items():
+        index[(organization_id, metric_type)].append(RuleGroup(metric_type, path, rules))
+    return dict(index)
+
+def get_index():
+    """Compiled rules of this process, recompiled when any rule changed"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+
+    if version != _compiled['version']:
+        _compiled['index'] = compile_rules()
+        _compiled['version'] = version
+    return _compiled['index']
+
+def evaluate(entries):
+    """Check the samples of many nodes against the alert rules
+
+    entries are ``(node, metrics)`` pairs, metrics as ``(timestamp,
+    metric_type, data)`` tuples. Each metric row is only checked against
+    the rule groups of its node's organization and metric type, so the cost
+    grows with the number of distinct metric paths in use, not with the
+    number of rules. A rule fires once its condition held for its duration
+    and resolves when it stops holding; samples older than the last one
+    seen for a node (spool replays) are skipped.
+
+    Returns ``(events, resolutions)`` like anomaly.detect: unsaved
+    NodeEvents of rules that fired and ``(node_id, rule_id, label,
+    timestamp)`` of those that resolved, for resolve_alerts. States are
+    saved once the current transaction commits; callers hold
+    lock_node_states across that transaction.
+    """
+    index = get_index()
+    entries = [
+        (node, metrics) for node, metrics in entries
+        if any((node.organization_id, metric_type) in index for _, metric_type, _ in metrics)
+    ]
+
+    events = []
+    resolutions = []
+    if not entries:
+        return events, resolutions
+
+    stored = cache.get_many([state_key(node.pk) for node, _ in entries])
+    states = {}
+
+    for node, metrics in entries:
+        state = states.get(state_key(node.pk)) or stored.get(state_key(node.pk)) or {'last': 0, 'groups': {}}
+        states[state_key(node.pk)] = state
+
+        for timestamp, metric_type, data in sorted(metrics, key=lambda metric: metric[0]):
+            t = timestamp.timestamp()
+            if t < state['last']:
+                continue
+            state['last'] = t
+
+            label = data.get(LABEL_FIELDS[metric_type], '') if metric_type in LABEL_FIELDS else ''
+            for group in index.get((node.organization_id, metric_type), ()):
+                value = lookup(data, group.path)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+
+                applies, holds = group.evaluate(value, label, node.tags)
+                active = state['groups'].setdefault(group.key, {})
+
+                # Conditions that stopped holding, or whose rule is gone or
+                # no longer applies to the node (tags changed)
+                for key in list(active):
+                    rule_id, key_label = key.split('|', 1)
+                    i = group.position.get(rule_id)
+                    if key_label != label or (i is not None and holds[i]):
+                        continue
+                    _, firing = active.pop(key)
+                    if firing:
+                        resolutions.append((node.pk, rule_id, label, timestamp))
+
+                for i in np.flatnonzero(holds):
+                    rule = group.rules[i]
+                    condition = active.setdefault(f'{rule.id}|{label}', [t, False])
+                    if not condition[1] and t - condition[0] >= group.durations[i]:
+                        condition[1] = True
+                        events.append(alert_event(node, rule, label, value, condition[0]))
+
+        state['groups'] = {key: active for key, active in state['groups'].items() if active}
+
+    transaction.on_commit(lambda: cache.set_many(states, timeout=None))
+    return events, resolutions
+
+def alert_event(node, rule, label, value, since):
+    """Unsaved NodeEvent for a rule that just fired"""
+    subject = f'{rule.metric_type}.{rule.path}' + (f' on {label}' if label else '')
+    return NodeEvent(
+        node=node,
+        severity=rule.severity,
+        title=rule.name,
+        message=f'{subject} is {value:g}, {rule.get_comparator_display()} {rule.threshold:g}',
+        data={
+            'rule': str(rule.id),
+            'metric_type': rule.metric_type,
+            'path': rule.path,
+            'label': label,
+            'value': value,
+            'threshold': rule.threshold,
+            'started_at': datetime.fromtimestamp(since, dt_timezone.utc).isoformat(),
+        }
+    )
+
+def resolve_alerts(resolutions):
+    """Close the open events of rules whose condition stopped holding"""
+    for node_id, rule_id, label, timestamp in resolutions:
+        NodeEvent.objects.filter(
+            node_id=node_id, resolved_at__isnull=True, data__rule=rule_id, data__label=label
+        ).update(resolved_at=timestamp)
+
+@receiver([post_save, post_delete], sender=AlertRule)
+def rules_changed(sender, instance, **kwargs):
+    """Make every process recompile, and close events of removed rules"""
+    if kwargs.get('signal') is post_delete or not instance.is_active:
+        NodeEvent.objects.filter(
+            resolved_at__isnull=True, data__rule=str(instance.id)
+        ).update(resolved_at=timezone.now())
+
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
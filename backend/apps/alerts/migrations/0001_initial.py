@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:02
+
+import datetime
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('metric_type', models.CharField(choices=[('cpu', 'CPU'), ('memory', 'Memory'), ('disk', 'Disk'), ('network', 'Network'), ('process', 'Process'), ('security', 'Security'), ('kernel', 'Kernel'), ('container', 'Container'), ('service', 'Service'), ('aggregate', 'Aggregate'), ('agent', 'Agent')], max_length=20)),
+                ('path', models.CharField(max_length=255)),
+                ('label', models.CharField(blank=True, default='', max_length=255)),
+                ('comparator', models.CharField(choices=[('gt', '>'), ('gte', '>='), ('lt', '<'), ('lte', '<='), ('eq', '=='), ('ne', '!=')], max_length=3)),
+                ('threshold', models.FloatField()),
+                ('duration', models.DurationField(default=datetime.timedelta(0))),
+                ('severity', models.CharField(choices=[('info', 'Info'), ('warning', 'Warning'), ('error', 'Error'), ('critical', 'Critical')], default='warning', max_length=20)),
+                ('tags', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None)),
+                ('is_active', models.BooleanField(default=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='core.organization')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'is_active'], name='alerts_aler_organiz_4aa380_idx')],
+            },
+        ),
+    ]
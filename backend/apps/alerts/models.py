@@ -1,3 +1,39 @@
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from apps.core.models import TimeStampedModel, Organization
+from apps.nodes.models import NodeMetric, NodeEvent
+from datetime import timedelta
+import uuid
 
-# Create your models here.
+class AlertRule(TimeStampedModel):
+    COMPARATOR_CHOICES = (
+        ('gt', '>'),
+        ('gte', '>='),
+        ('lt', '<'),
+        ('lte', '<='),
+        ('eq', '=='),
+        ('ne', '!='),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='alert_rules')
+    name = models.CharField(max_length=255)
+    
+    metric_type = models.CharField(max_length=20, choices=NodeMetric.METRIC_TYPES)
+    path = models.CharField(max_length=255)  # dotted path into the metric data, e.g. load_avg.0
+    label = models.CharField(max_length=255, blank=True, default='')  # mount point / interface, '' for all
+    comparator = models.CharField(max_length=3, choices=COMPARATOR_CHOICES)
+    threshold = models.FloatField()
+    duration = models.DurationField(default=timedelta(0))  # how long the condition must hold
+    severity = models.CharField(max_length=20, choices=NodeEvent.SEVERITY_CHOICES, default='warning')
+    
+    tags = ArrayField(models.CharField(max_length=100), default=list, blank=True)  # nodes must have all
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['organization', 'is_active']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.metric_type}.{self.path} {self.get_comparator_display()} {self.threshold:g})"
@@ -1,3 +1,130 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+import uuid
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from apps.nodes.models import Node, NodeEvent
+from apps.telemetry.tests import LOCAL_CACHE, create_node
+from .engine import RuleGroup, evaluate, resolve_alerts
+from .models import AlertRule
 
-# Create your tests here.
+START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+class RuleGroupTests(SimpleTestCase):
+    def test_rules_are_checked_with_their_own_comparator(self):
+        group = RuleGroup('cpu', 'overall_percent', [
+            AlertRule(comparator='gt', threshold=80),
+            AlertRule(comparator='lte', threshold=10),
+            AlertRule(comparator='gt', threshold=95, label='/'),
+            AlertRule(comparator='gt', threshold=50, tags=['db']),
+        ])
+
+        applies, holds = group.evaluate(90.0, '', ['web'])
+
+        self.assertEqual(applies.tolist(), [True, True, False, False])
+        self.assertEqual(holds.tolist(), [True, False, False, False])
+
+@override_settings(CACHES=LOCAL_CACHE)
+class EvaluateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = create_node(tags=['db'])
+        cls.rule = AlertRule.objects.create(
+            organization=cls.node.organization, name='CPU high', metric_type='cpu',
+            path='overall_percent', comparator='gt', threshold=80, duration=timedelta(seconds=60),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def run_samples(self, *samples, node=None):
+        """Evaluate (seconds after START, metric_type, data) samples of one node"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return evaluate([(node or self.node, [
+                (START + timedelta(seconds=seconds), metric_type, data)
+                for seconds, metric_type, data in samples
+            ])])
+
+    def test_rule_fires_once_condition_held_for_its_duration(self):
+        events, _ = self.run_samples((0, 'cpu', {'overall_percent': 90}), (30, 'cpu', {'overall_percent': 91}))
+        self.assertEqual(events, [])
+
+        events, _ = self.run_samples((60, 'cpu', {'overall_percent': 92}))
+        event, = events
+        self.assertEqual(event.data['rule'], str(self.rule.id))
+        self.assertEqual(event.data['started_at'], START.isoformat())
+
+        events, _ = self.run_samples((90, 'cpu', {'overall_percent': 93}))
+        self.assertEqual(events, [])
+
+    def test_interrupted_condition_starts_over(self):
+        events, resolutions = self.run_samples(
+            (0, 'cpu', {'overall_percent': 90}),
+            (30, 'cpu', {'overall_percent': 20}),
+            (60, 'cpu', {'overall_percent': 90}),
+        )
+
+        self.assertEqual(events, [])
+        self.assertEqual(resolutions, [])
+
+    def test_rule_resolves_when_condition_stops_holding(self):
+        self.run_samples((0, 'cpu', {'overall_percent': 90}), (60, 'cpu', {'overall_percent': 90}))
+        _, resolutions = self.run_samples((90, 'cpu', {'overall_percent': 20}))
+
+        self.assertEqual(resolutions, [
+            (self.node.pk, str(self.rule.id), '', START + timedelta(seconds=90))
+        ])
+
+    def test_older_samples_are_skipped(self):
+        self.run_samples((0, 'cpu', {'overall_percent': 90}), (60, 'cpu', {'overall_percent': 90}))
+        _, resolutions = self.run_samples((30, 'cpu', {'overall_percent': 20}))
+
+        self.assertEqual(resolutions, [])
+
+    def test_label_restricts_rule_to_one_item(self):
+        AlertRule.objects.create(
+            organization=self.node.organization, name='Root full', metric_type='disk',
+            path='percent_used', label='/', comparator='gt', threshold=90,
+        )
+
+        events, _ = self.run_samples(
+            (0, 'disk', {'mount_point': '/data', 'percent_used': 95}),
+            (0, 'disk', {'mount_point': '/', 'percent_used': 96}),
+        )
+
+        event, = events
+        self.assertEqual(event.data['label'], '/')
+
+    def test_rule_only_applies_to_nodes_with_its_tags(self):
+        self.rule.tags = ['db', 'prod']
+        self.rule.save()
+
+        samples = [(0, 'cpu', {'overall_percent': 90}), (60, 'cpu', {'overall_percent': 90})]
+        events, _ = self.run_samples(*samples)
+        self.assertEqual(events, [])
+
+        node = Node(id=uuid.uuid4(), organization=self.node.organization, tags=['db', 'prod', 'eu'])
+        events, _ = self.run_samples(*samples, node=node)
+        self.assertEqual(len(events), 1)
+
+    def test_rule_resolves_when_it_stops_applying(self):
+        self.rule.tags = ['db']
+        self.rule.save()
+
+        self.run_samples((0, 'cpu', {'overall_percent': 90}), (60, 'cpu', {'overall_percent': 90}))
+
+        self.node.tags = []
+        _, resolutions = self.run_samples((90, 'cpu', {'overall_percent': 90}))
+
+        self.assertEqual(resolutions, [
+            (self.node.pk, str(self.rule.id), '', START + timedelta(seconds=90))
+        ])
+
+    def test_resolve_alerts_closes_open_event(self):
+        events, _ = self.run_samples((0, 'cpu', {'overall_percent': 90}), (60, 'cpu', {'overall_percent': 90}))
+        NodeEvent.objects.bulk_create(events)
+
+        _, resolutions = self.run_samples((90, 'cpu', {'overall_percent': 20}))
+        resolve_alerts(resolutions)
+
+        event = NodeEvent.objects.get()
+        self.assertEqual(event.resolved_at, START + timedelta(seconds=90))
@@ -1,7 +1,11 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from apps.nodes.models import Node
+from apps.telemetry.ingestion import decrypt_payload, ingest_samples
+from apps.telemetry.pipeline import QueueFull, TRANSIENT_ERRORS, is_queued, check_backlog
 
 class TelemetryConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -39,6 +43,104 @@ class TelemetryConsumer(AsyncWebsocketConsumer):
         # Send message to WebSocket
         await self.send(text_data=json.dumps(event['data']))
 
+class AgentStreamConsumer(AsyncWebsocketConsumer):
+    """Persistent upload channel for node agents
+    
+    The agent authenticates once with its X-Node-API-Key header, then streams
+    ``{'seq', 'data', 'compression'}`` frames, each holding one encrypted
+    upload. Every frame is acknowledged with its sequence number. The last
+    acknowledged sequence is sent on connect so a reconnecting agent can
+    resume, and frames at or below it are acknowledged without being stored
+    again. The sequence is also checked and moved forward in the transaction
+    storing the rows (Node.stream_seq), so a frame resent while its first
+    copy is still being stored is not stored twice either. Frames refused
+    while the ingest queue is full, or Redis or the database is down, are
+    nacked with a ``retry_after`` in seconds, like the HTTP endpoint's 429
+    and 503 responses.
+    """
+    
+    async def connect(self):
+        headers = dict(self.scope['headers'])
+        api_key = headers.get(b'x-node-api-key', b'').decode()
+        
+        self.node = await self.get_node(api_key) if api_key else None
+        if self.node is None:
+            await self.close(code=4401)
+            return
+        
+        self.seq_key = f'telemetry:stream:{self.node.pk}:seq'
+        # Queued frames are acked before the writers move stream_seq forward
+        acked = await database_sync_to_async(cache.get)(self.seq_key, 0)
+        self.last_seq = max(acked, self.node.stream_seq)
+        
+        await self.accept()
+        await self.send(text_data=json.dumps({'type': 'hello', 'last_seq': self.last_seq}))
+    
+    @database_sync_to_async
+    def get_node(self, api_key):
+        try:
+            return Node.objects.get(api_key=api_key)
+        except Node.DoesNotExist:
+            return None
+    
+    @database_sync_to_async
+    def ingest(self, frame):
+        # Shed load before decrypting when the writers are behind
+        if is_queued():
+            check_backlog()
+        
+        data = decrypt_payload(frame['data'], compression=frame.get('compression'))
+        return ingest_samples(self.node, data, seq=frame.get('seq'))
+    
+    async def receive(self, text_data):
+        frame = json.loads(text_data)
+        seq = frame.get('seq', 0)
+        
+        # Resent after a reconnect, but already stored
+        if seq <= self.last_seq:
+            await self.send(text_data=json.dumps({'type': 'ack', 'seq': seq, 'duplicate': True}))
+            return
+        
+        try:
+            result = await self.ingest(frame)
+        except QueueFull:
+            await self.nack_retry(seq, 'Ingest queue is full')
+            return
+        except TRANSIENT_ERRORS:
+            await self.nack_retry(seq, 'Ingest unavailable')
+            return
+        except Exception as e:
+            await self.send(text_data=json.dumps({'type': 'nack', 'seq': seq, 'error': str(e)}))
+            return
+        
+        if not result['received']:
+            await self.send(text_data=json.dumps({'type': 'nack', 'seq': seq, 'error': result['errors']}))
+            return
+        
+        if result['duplicate']:
+            await self.send(text_data=json.dumps({'type': 'ack', 'seq': seq, 'duplicate': True}))
+            return
+        
+        self.last_seq = seq
+        await database_sync_to_async(cache.set)(self.seq_key, seq, None)
+        
+        await self.send(text_data=json.dumps({
+            'type': 'ack',
+            'seq': seq,
+            'received': result['received'],
+            'rejected': result['rejected'],
+            'resync': result['resync']
+        }))
+    
+    async def nack_retry(self, seq, error):
+        """Refuse a frame while shedding load, telling the agent when to retry"""
+        await self.send(text_data=json.dumps({
+            'type': 'nack',
+            'seq': seq,
+            'error': error,
+            'retry_after': settings.TELEMETRY_QUEUE_RETRY_AFTER
+        }))
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope['user']
@@ -1,7 +1,8 @@
 from django.urls import re_path
-from .consumers import TelemetryConsumer, NotificationConsumer
+from .consumers import TelemetryConsumer, AgentStreamConsumer, NotificationConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/telemetry/(?P<node_id>[^/]+)/$', TelemetryConsumer.as_asgi()),
+    re_path(r'ws/agent/$', AgentStreamConsumer.as_asgi()),
     re_path(r'ws/notifications/$', NotificationConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.nodes.timescale import HYPERTABLES, apply_policies
+from apps.telemetry.rollups import apply_rollup_policies
+
+class Command(BaseCommand):
+    help = 'Re-apply hypertable and rollup chunk, compression, refresh and retention policies from settings'
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            for model in HYPERTABLES:
+                apply_policies(cursor, model)
+                self.stdout.write(f'Applied policies to {model}')
+            apply_rollup_policies(cursor)
+            self.stdout.write('Applied rollup policies')
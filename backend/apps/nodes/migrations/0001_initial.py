@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:51
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Node',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('hostname', models.CharField(max_length=255)),
+                ('ip_address', models.GenericIPAddressField()),
+                ('mac_address', models.CharField(max_length=17)),
+                ('os_type', models.CharField(choices=[('linux', 'Linux'), ('windows', 'Windows'), ('macos', 'macOS'), ('raspbian', 'Raspbian')], max_length=20)),
+                ('os_version', models.CharField(max_length=100)),
+                ('kernel_version', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('healthy', 'Healthy'), ('warning', 'Warning'), ('critical', 'Critical'), ('offline', 'Offline'), ('maintenance', 'Maintenance')], default='offline', max_length=20)),
+                ('api_key', models.CharField(max_length=255, unique=True)),
+                ('last_heartbeat', models.DateTimeField(blank=True, null=True)),
+                ('tags', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), default=list, size=None)),
+                ('cpu_cores', models.IntegerField(default=0)),
+                ('total_memory', models.BigIntegerField(default=0)),
+                ('total_disk', models.BigIntegerField(default=0)),
+                ('transmission_interval', models.IntegerField(default=30)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nodes', to='core.organization')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NodeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('severity', models.CharField(choices=[('info', 'Info'), ('warning', 'Warning'), ('error', 'Error'), ('critical', 'Critical')], max_length=20)),
+                ('title', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('data', models.JSONField(default=dict)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='nodes.node')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NodeMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('metric_type', models.CharField(choices=[('cpu', 'CPU'), ('memory', 'Memory'), ('disk', 'Disk'), ('network', 'Network'), ('process', 'Process'), ('security', 'Security'), ('kernel', 'Kernel'), ('container', 'Container'), ('service', 'Service'), ('aggregate', 'Aggregate'), ('agent', 'Agent')], max_length=20)),
+                ('data', models.JSONField()),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metrics', to='nodes.node')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NodeProcess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('pid', models.IntegerField()),
+                ('ppid', models.IntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('cpu_percent', models.FloatField()),
+                ('memory_percent', models.FloatField()),
+                ('status', models.CharField(max_length=50)),
+                ('command', models.TextField()),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='processes', to='nodes.node')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['organization', 'status'], name='nodes_node_organiz_67a9d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['last_heartbeat'], name='nodes_node_last_he_a892b6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodeevent',
+            index=models.Index(fields=['node', 'timestamp'], name='nodes_nodee_node_id_3896ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodeevent',
+            index=models.Index(fields=['severity', 'timestamp'], name='nodes_nodee_severit_c09177_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodemetric',
+            index=models.Index(fields=['node', 'timestamp'], name='nodes_nodem_node_id_1b6f15_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodemetric',
+            index=models.Index(fields=['metric_type', 'timestamp'], name='nodes_nodem_metric__fd657a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodeprocess',
+            index=models.Index(fields=['node', 'timestamp'], name='nodes_nodep_node_id_36437e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodeprocess',
+            index=models.Index(fields=['cpu_percent'], name='nodes_nodep_cpu_per_1be5df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodeprocess',
+            index=models.Index(fields=['memory_percent'], name='nodes_nodep_memory__22d96d_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db import migrations
+
+# Frozen: the hypertable layout as of this migration (table -> compression
+# segmentby columns). Later changes to apps.nodes.timescale need a
+# migration of their own; chunk interval, compression and retention are
+# still read from TELEMETRY_HYPERTABLES at migrate time.
+HYPERTABLES = {
+    'nodemetric': ('node_id', 'metric_type'),
+    'nodeevent': ('node_id',),
+    'nodeprocess': ('node_id',),
+}
+
+def create_hypertable(cursor, table, segmentby, interval):
+    cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_pkey')
+    cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, timestamp)')
+    cursor.execute(
+        f"SELECT create_hypertable('{table}', 'timestamp', "
+        f"chunk_time_interval => INTERVAL %s, migrate_data => true)",
+        [interval]
+    )
+    cursor.execute(
+        f"ALTER TABLE {table} SET (timescaledb.compress, "
+        f"timescaledb.compress_segmentby = '{', '.join(segmentby)}', "
+        f"timescaledb.compress_orderby = 'timestamp DESC')"
+    )
+
+def add_policies(cursor, table, config):
+    if config['compress_after']:
+        cursor.execute(f"SELECT add_compression_policy('{table}', INTERVAL %s)", [config['compress_after']])
+    if config['retention']:
+        cursor.execute(f"SELECT add_retention_policy('{table}', INTERVAL %s)", [config['retention']])
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS timescaledb')
+        for model, segmentby in HYPERTABLES.items():
+            config = settings.TELEMETRY_HYPERTABLES[model]
+            create_hypertable(cursor, f'nodes_{model}', segmentby, config['chunk_interval'])
+            add_policies(cursor, f'nodes_{model}', config)
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('nodes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copies of the apps.nodes.timescale helpers as of this migration
+SEGMENTBY = ('node_id', 'series')
+
+
+def create_hypertable(cursor, table, segmentby, interval):
+    cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_pkey')
+    cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, timestamp)')
+    cursor.execute(
+        f"SELECT create_hypertable('{table}', 'timestamp', "
+        f"chunk_time_interval => INTERVAL %s, migrate_data => true)",
+        [interval]
+    )
+    cursor.execute(
+        f"ALTER TABLE {table} SET (timescaledb.compress, "
+        f"timescaledb.compress_segmentby = '{', '.join(segmentby)}', "
+        f"timescaledb.compress_orderby = 'timestamp DESC')"
+    )
+
+
+def add_policies(cursor, table, config):
+    if config['compress_after']:
+        cursor.execute(f"SELECT add_compression_policy('{table}', INTERVAL %s)", [config['compress_after']])
+    if config['retention']:
+        cursor.execute(f"SELECT add_retention_policy('{table}', INTERVAL %s)", [config['retention']])
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    config = settings.TELEMETRY_HYPERTABLES['nodemetricvalue']
+    with schema_editor.connection.cursor() as cursor:
+        create_hypertable(cursor, 'nodes_nodemetricvalue', SEGMENTBY, config['chunk_interval'])
+        add_policies(cursor, 'nodes_nodemetricvalue', config)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0002_hypertables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeMetricValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('series', models.CharField(max_length=32)),
+                ('label', models.CharField(blank=True, default='', max_length=255)),
+                ('value', models.FloatField()),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_values', to='nodes.node')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['node', 'series', 'timestamp'], name='nodes_nodem_node_id_afe045_idx')],
+            },
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0003_nodemetricvalue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nodeevent',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nodes', '0004_nodeevent_resolved_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='stream_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
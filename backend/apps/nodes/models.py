@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
 from apps.core.models import TimeStampedModel, Organization
 import uuid
@@ -33,6 +34,7 @@ class Node(TimeStampedModel):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='offline')
     api_key = models.CharField(max_length=255, unique=True)
     last_heartbeat = models.DateTimeField(null=True, blank=True)
+    stream_seq = models.BigIntegerField(default=0)  # last agent stream frame stored, for dedupe
     
     tags = ArrayField(models.CharField(max_length=100), default=list)
     
@@ -62,10 +64,12 @@ class NodeMetric(TimeStampedModel):
         ('kernel', 'Kernel'),
         ('container', 'Container'),
         ('service', 'Service'),
+        ('aggregate', 'Aggregate'),
+        ('agent', 'Agent'),
     )
     
     node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='metrics')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # sample time, may be replayed late
     metric_type = models.CharField(max_length=20, choices=METRIC_TYPES)
     data = models.JSONField()
     
@@ -75,6 +79,23 @@ class NodeMetric(TimeStampedModel):
             models.Index(fields=['metric_type', 'timestamp']),
         ]
 
+class NodeMetricValue(models.Model):
+    """One numeric value of a hot series, extracted from a NodeMetric at ingest
+    
+    Kept narrow (no created/updated timestamps) so aggregations scan compact
+    rows; the full sample stays in NodeMetric.data.
+    """
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='metric_values')
+    timestamp = models.DateTimeField()
+    series = models.CharField(max_length=32)
+    label = models.CharField(max_length=255, blank=True, default='')  # mount point / interface
+    value = models.FloatField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['node', 'series', 'timestamp']),
+        ]
+
 class NodeEvent(TimeStampedModel):
     SEVERITY_CHOICES = (
         ('info', 'Info'),
@@ -89,6 +110,7 @@ class NodeEvent(TimeStampedModel):
     title = models.CharField(max_length=255)
     message = models.TextField()
     data = models.JSONField(default=dict)
+    resolved_at = models.DateTimeField(null=True, blank=True)  # None while still open
     
     class Meta:
         indexes = [
@@ -0,0 +1,54 @@
+from django.conf import settings
+
+# model name -> compression segmentby columns
+HYPERTABLES = {
+    'nodemetric': ('node_id', 'metric_type'),
+    'nodeevent': ('node_id',),
+    'nodeprocess': ('node_id',),
+    'nodemetricvalue': ('node_id', 'series'),
+}
+
+def table_name(model):
+    return f'nodes_{model}'
+
+def create_hypertable(cursor, model):
+    """Convert a plain table into a hypertable partitioned on timestamp
+
+    Unique constraints of a hypertable must include the partitioning
+    column, so the primary key becomes (id, timestamp); ids still come
+    from the table's sequence.
+    """
+    table = table_name(model)
+    interval = settings.TELEMETRY_HYPERTABLES[model]['chunk_interval']
+    segmentby = ', '.join(HYPERTABLES[model])
+
+    cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_pkey')
+    cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, timestamp)')
+    cursor.execute(
+        f"SELECT create_hypertable('{table}', 'timestamp', "
+        f"chunk_time_interval => INTERVAL %s, migrate_data => true)",
+        [interval]
+    )
+    cursor.execute(
+        f"ALTER TABLE {table} SET (timescaledb.compress, "
+        f"timescaledb.compress_segmentby = '{segmentby}', "
+        f"timescaledb.compress_orderby = 'timestamp DESC')"
+    )
+
+def apply_policies(cursor, model):
+    """(Re)apply chunk interval, compression and retention from settings
+
+    A policy set to None in TELEMETRY_HYPERTABLES is removed.
+    """
+    table = table_name(model)
+    config = settings.TELEMETRY_HYPERTABLES[model]
+
+    cursor.execute(f"SELECT set_chunk_time_interval('{table}', INTERVAL %s)", [config['chunk_interval']])
+
+    cursor.execute(f"SELECT remove_compression_policy('{table}', if_exists => true)")
+    if config['compress_after']:
+        cursor.execute(f"SELECT add_compression_policy('{table}', INTERVAL %s)", [config['compress_after']])
+
+    cursor.execute(f"SELECT remove_retention_policy('{table}', if_exists => true)")
+    if config['retention']:
+        cursor.execute(f"SELECT add_retention_policy('{table}', INTERVAL %s)", [config['retention']])
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import FleetViewSet
+
+router = DefaultRouter()
+router.register('fleet', FleetViewSet, basename='fleet')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
@@ -1,3 +1,47 @@
-from django.shortcuts import render
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from apps.core.models import Organization
+from apps.telemetry.latest import read_latest
 
-# Create your views here.
+class FleetViewSet(viewsets.ViewSet):
+    """Latest known state of every node of an organization
+    
+    Summaries come from the per-node Redis hashes written at ingest, read in
+    one pipelined round trip, so the cost does not depend on stored history.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    STALE_INTERVALS = 3  # missed uploads before a node is reported stale
+    
+    def list(self, request):
+        organization_id = request.query_params.get('organization')
+        if not organization_id:
+            raise ValidationError({'organization': 'This parameter is required.'})
+        
+        try:
+            organization = Organization.objects.get(pk=organization_id, members=request.user)
+        except (Organization.DoesNotExist, DjangoValidationError):
+            raise NotFound('Organization not found')
+        
+        nodes = list(organization.nodes.values(
+            'id', 'name', 'hostname', 'status', 'os_type', 'transmission_interval'
+        ))
+        latest = read_latest(node['id'] for node in nodes)
+        now = timezone.now().timestamp()
+        
+        for node in nodes:
+            summary = latest[node['id']]
+            heartbeat = summary.pop('heartbeat', None)
+            node['last_heartbeat'] = heartbeat
+            node['stale'] = heartbeat is None or now - heartbeat > self.STALE_INTERVALS * node['transmission_interval']
+            node['latest'] = summary
+        
+        return Response({
+            'organization': organization.pk,
+            'count': len(nodes),
+            'nodes': nodes
+        })
@@ -0,0 +1,203 @@
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from apps.nodes.models import NodeEvent
+from .series import extract_values
+
+# Columns of a per-series state row: last sample time (epoch), samples
+# seen, EWMA level, EWMA variance of the residual, open event flag,
+# consecutive samples towards opening/closing, then the hour-of-day
+# seasonal offsets from the level
+LAST, COUNT, LEVEL, VAR, ACTIVE, STREAK = range(6)
+SEASON = 6
+WIDTH = SEASON + 24
+
+# Smallest standard deviation assumed per series, so flat series do not
+# alert on jitter; other series only get the relative floor
+MIN_STD = {
+    'cpu_percent': 2.0,
+    'load_1m': 0.2,
+    'memory_percent': 1.0,
+    'swap_percent': 1.0,
+    'disk_percent': 0.5,
+}
+
+def state_key(node_id):
+    return f'telemetry:anomaly:{node_id}'
+
+def step(state, x, hour, limit, min_std, config):
+    """Feed one sample per row into the detector state, in place
+
+    state holds one row per series (see the column layout above); x, hour,
+    limit and min_std are arrays with one entry per row. Every row is
+    updated in O(1), so one call evaluates any number of series of any
+    number of nodes at once.
+
+    Returns ``(opened, closed, baseline, z)`` arrays.
+    """
+    rows = np.arange(len(x))
+    first = state[:, COUNT] == 0
+    level = np.where(first, x, state[:, LEVEL])
+    season = state[rows, SEASON + hour]
+
+    baseline = level + season
+    residual = x - baseline
+    std = np.maximum(np.sqrt(state[:, VAR]), min_std + config['relative_std'] * np.abs(baseline))
+    z = np.abs(residual) / np.maximum(std, 1e-9)
+
+    # Statistical deviations only count once the baseline warmed up;
+    # fixed limits always do
+    warm = state[:, COUNT] >= config['warmup']
+    hot = (warm & (z > config['open_z'])) | (x > limit)
+    cool = (~warm | (z < config['close_z'])) & (x <= limit - config['limit_margin'])
+
+    # Hysteresis: several consecutive samples are needed to change state
+    active = state[:, ACTIVE] > 0
+    streak = np.where(np.where(active, cool, hot), state[:, STREAK] + 1, 0)
+    opened = ~active & (streak >= config['open_after'])
+    closed = active & (streak >= config['close_after'])
+    state[:, ACTIVE] = np.where(opened, 1, np.where(closed, 0, state[:, ACTIVE]))
+    state[:, STREAK] = np.where(opened | closed, 0, streak)
+
+    # Outliers are clipped before they update the baseline, so a spike does
+    # not inflate the variance and hide itself; level shifts still adapt
+    residual = np.where(warm, np.clip(residual, -config['open_z'] * std, config['open_z'] * std), residual)
+    alpha = config['alpha']
+    state[:, VAR] = np.where(first, 0, (1 - alpha) * (state[:, VAR] + alpha * residual ** 2))
+    state[:, LEVEL] = level + alpha * residual
+    state[rows, SEASON + hour] = season + config['seasonal_alpha'] * (baseline + residual - state[:, LEVEL] - season)
+    state[:, COUNT] += 1
+
+    return opened, closed, baseline, z
+
+def observations(metrics):
+    """(timestamp, series, label, value) of every hot series in metric rows
+
+    metrics are ``(timestamp, metric_type, data)`` tuples.
+    """
+    return [
+        (timestamp, series, label, value)
+        for timestamp, metric_type, data in metrics
+        for series, label, value in extract_values(metric_type, data)
+    ]
+
+def detect(entries):
+    """Run the detector over the samples of many nodes in vectorised rounds
+
+    entries are ``(node_id, metrics)`` pairs, metrics as for observations.
+    Samples are fed oldest first: round r evaluates the r-th sample of
+    every series at once. Samples not newer than the state of their series
+    (spool replays) are skipped.
+
+    Returns ``(events, resolutions)``: unsaved NodeEvents for anomalies
+    that opened, and ``(node_id, series, label, timestamp)`` of the ones
+    that closed, for resolve_events. States are saved once the current
+    transaction commits, so a failed write replays against the old state;
+    callers hold lock_node_states across that transaction.
+    """
+    config = settings.TELEMETRY_ANOMALY
+    node_ids = list({str(node_id) for node_id, _ in entries})
+    stored = cache.get_many([state_key(node_id) for node_id in node_ids])
+
+    keys = []
+    index = {}
+    rows = []
+    obs_key, obs_time, obs_value = [], [], []
+    for node_id, metrics in entries:
+        node_id = str(node_id)
+        node_state = stored.get(state_key(node_id), {})
+        for timestamp, series, label, value in observations(metrics):
+            key = (node_id, series, label)
+            if key not in index:
+                index[key] = len(keys)
+                keys.append(key)
+                rows.append(node_state.get(f'{series}|{label}') or [0.0] * WIDTH)
+            obs_key.append(index[key])
+            obs_time.append(timestamp.timestamp())
+            obs_value.append(value)
+
+    events = []
+    resolutions = []
+    if not keys:
+        return events, resolutions
+
+    state = np.array(rows, dtype=np.float64)
+    obs_key = np.array(obs_key)
+    obs_time = np.array(obs_time)
+    obs_value = np.array(obs_value)
+    limits = config['limits']
+    limit = np.array([limits.get(series, np.inf) for _, series, _ in keys], dtype=np.float64)
+    min_std = np.array([MIN_STD.get(series, 0.0) for _, series, _ in keys])
+
+    # Rank of every observation within its series, oldest first
+    order = np.lexsort((obs_time, obs_key))
+    sorted_keys = obs_key[order]
+    starts = np.searchsorted(sorted_keys, sorted_keys)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts
+
+    for r in range(rank.max() + 1):
+        picked = np.flatnonzero(rank == r)
+        picked = picked[obs_time[picked] > state[obs_key[picked], LAST]]
+        if not len(picked):
+            continue
+
+        idx = obs_key[picked]
+        t = obs_time[picked]
+        x = obs_value[picked]
+        hour = ((t // 3600) % 24).astype(np.int64)
+
+        rows = state[idx]
+        opened, closed, baseline, z = step(rows, x, hour, limit[idx], min_std[idx], config)
+        rows[:, LAST] = t
+        state[idx] = rows
+
+        for i in np.flatnonzero(opened):
+            node_id, series, label = keys[idx[i]]
+            events.append(anomaly_event(
+                node_id, series, label, x[i], baseline[i], z[i], limit[idx[i]], t[i]
+            ))
+        for i in np.flatnonzero(closed):
+            node_id, series, label = keys[idx[i]]
+            resolutions.append((node_id, series, label, datetime.fromtimestamp(t[i], dt_timezone.utc)))
+
+    states = {state_key(node_id): stored.get(state_key(node_id), {}) for node_id in node_ids}
+    for (node_id, series, label), row in zip(keys, state.tolist()):
+        states[state_key(node_id)][f'{series}|{label}'] = row
+    transaction.on_commit(lambda: cache.set_many(states, timeout=None))
+
+    return events, resolutions
+
+def anomaly_event(node_id, series, label, value, baseline, z, limit, t):
+    """Unsaved NodeEvent for an anomaly that just opened"""
+    subject = f'{series} on {label}' if label else series
+    if value > limit:
+        severity = 'critical'
+        message = f'{subject} is at {value:.1f}, above the limit of {limit:g}'
+    else:
+        severity = 'warning'
+        message = f'{subject} is at {value:.1f}, expected about {baseline:.1f}'
+
+    return NodeEvent(
+        node_id=node_id,
+        severity=severity,
+        title=f'Anomalous {subject}',
+        message=message,
+        data={
+            'series': series,
+            'label': label,
+            'value': float(value),
+            'baseline': float(baseline),
+            'zscore': float(z),
+            'started_at': datetime.fromtimestamp(t, dt_timezone.utc).isoformat(),
+        }
+    )
+
+def resolve_events(resolutions):
+    """Close the open anomaly events of series that went back to normal"""
+    for node_id, series, label, timestamp in resolutions:
+        NodeEvent.objects.filter(
+            node_id=node_id, resolved_at__isnull=True, data__series=series, data__label=label
+        ).update(resolved_at=timestamp)
@@ -3,4 +3,4 @@ from django.apps import AppConfig
 
 class TelemetryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'telemetry'
+    name = 'apps.telemetry'
@@ -0,0 +1,106 @@
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+
+# Mirrors DeltaEncoder.INVENTORY_FIELDS in the node agent:
+# section: (lists holding the items, item key, static fields)
+INVENTORY_FIELDS = {
+    'kernel': (None, None, ('kernel_version', 'boot_time')),
+    'disk': ((), 'mount_point', ('device', 'fs_type')),
+    'network': (('interfaces',), 'interface', ('speed', 'ip_addresses')),
+    'services': (('services', 'failed', 'running'), 'name', ('load', 'description')),
+}
+META_FIELDS = ('timestamp', 'node_id', 'stale', 'degraded', 'keyframe', 'delta')
+
+def state_key(node, section):
+    return f'telemetry:state:{node.pk}:{section}'
+
+def merge_inventory(sample, inventory):
+    """Put the static fields of an inventory back into the sections of sample"""
+    sample = dict(sample)
+    for field, value in inventory.get('node', {}).items():
+        sample.setdefault(field, value)
+
+    for section, (lists, key, fields) in INVENTORY_FIELDS.items():
+        if section not in sample:
+            continue
+
+        static = inventory.get(section, {})
+
+        def restore(item):
+            return {**static.get(item.get(key), {}), **item}
+
+        value = sample[section]
+        if lists is None:
+            value = {**static, **value}
+        elif lists == ():
+            value = [restore(item) for item in value]
+        else:
+            value = dict(value)
+            for name in lists:
+                value[name] = [restore(item) for item in value.get(name, [])]
+        sample[section] = value
+
+    return sample
+
+def expand_sample(node, sample):
+    """Rebuild the sections an agent keyframe or delta left out
+
+    Deltas drop the sections that did not change since the server last
+    acknowledged them and list them in ``unchanged``; static inventory
+    fields arrive separately, each inventory subsection only when it
+    changed. The last value of every section is cached under its own key,
+    so a delta only reads the sections it needs and only writes the ones
+    it carries. Sections that were not collected for this sample stay out
+    of it. Samples without either marker (replayed from the agent spool, or
+    sent by older agents) are already complete and are returned as they
+    are.
+
+    Returns ``(sample, resync)``; ``resync`` is True when a delta relies on
+    state the server does not have, so the agent must send a keyframe.
+    Sections that could not be rebuilt are left out of the sample.
+    """
+    if not (sample.get('keyframe') or sample.get('delta')):
+        return sample, False
+
+    sample = dict(sample)
+    unchanged = [section for section in sample.pop('unchanged', ()) if section not in sample]
+    carried = [k for k in sample if k not in META_FIELDS and k != 'inventory']
+    keys = {section: state_key(node, section) for section in (*carried, *unchanged, 'inventory')}
+    stored = cache.get_many(list(keys.values()))
+
+    # Replayed or reordered samples must not roll the cached state back
+    timestamp = parse_datetime(sample['timestamp'])
+
+    def newer(section):
+        entry = stored.get(keys[section])
+        return entry is None or parse_datetime(entry['timestamp']) <= timestamp
+
+    updates = {}
+
+    def keep(section, value):
+        if newer(section):
+            updates[keys[section]] = {'timestamp': sample['timestamp'], 'value': value}
+
+    inventory = stored.get(keys['inventory'], {}).get('value', {})
+    if 'inventory' in sample:
+        inventory = {**inventory, **sample.pop('inventory')}
+        keep('inventory', inventory)
+
+    missing = [
+        section for section in carried
+        if section in INVENTORY_FIELDS and section not in inventory
+    ]
+    for section in unchanged:
+        entry = stored.get(keys[section])
+        if entry is None:
+            missing.append(section)
+        else:
+            sample[section] = entry['value']
+
+    for section in carried:
+        keep(section, sample[section])
+    if updates:
+        cache.set_many(updates, timeout=None)
+
+    resync = bool(sample.get('delta') and (missing or 'node' not in inventory))
+    return merge_inventory(sample, inventory), resync
@@ -0,0 +1,61 @@
+import numpy as np
+
+def lttb(t, v, threshold):
+    """Largest-Triangle-Three-Buckets downsampling
+
+    Returns the indices of at most threshold points of (t, v) that keep the
+    visual shape of the series: the first and last points, plus from every
+    bucket the point forming the largest triangle with the point chosen in
+    the previous bucket and the average of the next bucket.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    n = len(t)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:max(threshold, 0)], dtype=np.int64)
+
+    # Bucket edges over the points between the first and the last one
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_t = t[next_start:next_end].mean()
+        avg_v = v[next_start:next_end].mean()
+
+        # Twice the triangle areas, the factor does not change the argmax
+        area = np.abs(
+            (t[a] - avg_t) * (v[start:end] - v[a]) - (t[a] - t[start:end]) * (avg_v - v[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+
+    return selected
+
+def minmax(t, v, buckets):
+    """Per-bucket minimum and maximum, as (t, min, max) arrays
+
+    Buckets split the time range evenly; empty buckets are dropped.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    if len(t) == 0:
+        return t, v, v
+
+    edges = np.linspace(t[0], t[-1], buckets + 1)
+    index = np.clip(np.searchsorted(edges, t, side='right') - 1, 0, buckets - 1)
+
+    low = np.full(buckets, np.inf)
+    high = np.full(buckets, -np.inf)
+    np.minimum.at(low, index, v)
+    np.maximum.at(high, index, v)
+
+    filled = np.isfinite(low)
+    return edges[:-1][filled], low[filled], high[filled]
@@ -0,0 +1,212 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from cryptography.fernet import Fernet
+import base64
+import hashlib
+import json
+import logging
+import zlib
+from redis.exceptions import RedisError
+from apps.nodes.models import Node, NodeMetric, NodeMetricValue, NodeEvent
+from .serializers import NodeMetricBatchSerializer
+from .delta import expand_sample
+from .series import extract_values
+from .pipeline import is_queued, enqueue_rows
+from .latest import write_latest
+from .anomaly import detect, resolve_events
+from .locks import lock_node_states
+from apps.alerts.engine import evaluate, resolve_alerts
+
+logger = logging.getLogger(__name__)
+
+def get_encryption_key():
+    """Derive Fernet key from fixed password"""
+    key = hashlib.sha256(settings.NODE_ENCRYPTION_KEY.encode()).digest()
+    return base64.urlsafe_b64encode(key)
+
+def decrypt_payload(encrypted_data, compression=None):
+    """Decrypt (and decompress) node agent data"""
+    fernet = Fernet(get_encryption_key())
+    decrypted = fernet.decrypt(encrypted_data.encode())
+    
+    if compression == 'zlib':
+        decrypted = zlib.decompress(decrypted)
+    elif compression == 'zstd':
+        import zstandard
+        decrypted = zstandard.ZstdDecompressor().decompress(decrypted)
+    elif compression:
+        raise ValueError(f'Unsupported compression: {compression}')
+    
+    return json.loads(decrypted)
+
+def unpack_samples(data):
+    """Split an agent upload into one flat payload per metric sample
+    
+    Agents send ``{'node_id', 'samples': [...]}`` where each sample is a
+    full collection cycle. A single ``{'node_id', 'timestamp', 'data'}``
+    payload is still accepted.
+    """
+    if 'samples' in data:
+        samples = data['samples']
+    else:
+        samples = [data.get('data', data)]
+    
+    return [{**sample, 'node_id': data.get('node_id')} for sample in samples]
+
+# Sample section -> NodeMetric.metric_type, for sections stored as one row
+METRIC_SECTIONS = (
+    ('cpu', 'cpu'),
+    ('memory', 'memory'),
+    ('processes', 'process'),
+    ('security', 'security'),
+    ('kernel', 'kernel'),
+    ('containers', 'container'),
+    ('services', 'service'),
+    ('aggregates', 'aggregate'),
+    ('agent', 'agent'),
+)
+
+def ingest_samples(node, data, seq=None):
+    """Validate and store every sample of a decrypted agent upload
+    
+    Shared by the HTTP ingest endpoint and the agent WebSocket stream.
+    Rows for all samples are built in memory and written, together with the
+    heartbeat, in a single transaction; in queued mode they are pushed to
+    the ingest stream for the writers instead. Either way the node's latest
+    summary is refreshed in Redis for the fleet overview. Stream frames pass
+    their seq, so a frame resent after a lost ack is not stored twice (see
+    store_rows). Returns a dict with the number of samples received and
+    rejected, the validation errors, whether the agent has to resync its
+    delta state, whether rows were queued and whether the upload was a
+    duplicate.
+    """
+    received = 0
+    errors = []
+    resync = False
+    metrics = []
+    
+    for payload in unpack_samples(data):
+        # Agents only send sections that changed, rebuild the rest
+        payload, needs_resync = expand_sample(node, payload)
+        resync = resync or needs_resync
+        
+        serializer = NodeMetricBatchSerializer(data=payload)
+        if not serializer.is_valid():
+            errors.append(serializer.errors)
+            continue
+        
+        metrics.extend(build_metrics(node, serializer.validated_data))
+        received += 1
+    
+    queued = is_queued()
+    duplicate = False
+    if received:
+        if queued:
+            enqueue_rows(node, metrics, seq)
+        else:
+            duplicate = not store_rows(node, metrics, seq)
+    
+    if received and not duplicate:
+        try:
+            write_latest(node, metrics, timezone.now())
+        except RedisError as e:
+            # The overview catches up with the next upload, the rows are stored
+            logger.warning(f'Failed to update latest summary of node {node.pk}: {e}')
+    
+    return {
+        'received': received,
+        'rejected': len(errors),
+        'errors': errors,
+        'resync': resync,
+        'queued': queued,
+        'duplicate': duplicate
+    }
+
+def store_rows(node, metrics, seq=None):
+    """Write metric and value rows, anomaly and alert events and the heartbeat atomically
+    
+    With a stream frame's seq, the node's stream_seq is moved forward in
+    the same transaction; a frame at or below it was stored already and is
+    skipped. Returns whether the rows were written.
+    """
+    now = timezone.now()
+    
+    with lock_node_states([node.pk]), transaction.atomic():
+        if seq is not None and not Node.objects.filter(pk=node.pk, stream_seq__lt=seq).update(stream_seq=seq):
+            return False
+        NodeMetric.objects.bulk_create(metrics)
+        NodeMetricValue.objects.bulk_create(build_values(metrics))
+        samples = [(m.timestamp, m.metric_type, m.data) for m in metrics]
+        events, resolutions = detect([(node.pk, samples)])
+        alerts, resolved_alerts = evaluate([(node, samples)])
+        events.extend(alerts)
+        if events:
+            NodeEvent.objects.bulk_create(events)
+        resolve_events(resolutions)
+        resolve_alerts(resolved_alerts)
+        Node.objects.filter(pk=node.pk).update(last_heartbeat=now)
+    
+    node.last_heartbeat = now
+    return True
+
+def build_metrics(node, validated_data):
+    """Unsaved NodeMetric rows for one validated metrics sample
+    
+    Stale sections repeat a value that was already stored when it was
+    collected, so they are skipped; the stale and degraded markers are kept
+    on the sample's agent row.
+    """
+    timestamp = validated_data['timestamp']
+    stale = validated_data.get('stale', {})
+    metrics = []
+    
+    def add(metric_type, data):
+        metrics.append(NodeMetric(node=node, timestamp=timestamp, metric_type=metric_type, data=data))
+    
+    sections = {
+        section: validated_data[section] for section, _ in METRIC_SECTIONS
+        if section in validated_data and section not in stale
+    }
+    if 'kernel' in sections:
+        sections['kernel'] = with_uptime(sections['kernel'], timestamp)
+    markers = {key: validated_data[key] for key in ('stale', 'degraded') if key in validated_data}
+    if markers:
+        sections['agent'] = {**sections.get('agent', {}), **markers}
+    
+    for section, metric_type in METRIC_SECTIONS:
+        if section in sections:
+            add(metric_type, sections[section])
+    
+    # Disks and interfaces get one row each
+    if 'disk' not in stale:
+        for disk_data in validated_data.get('disk', []):
+            add('disk', disk_data)
+    
+    if 'network' in validated_data and 'network' not in stale:
+        for net_data in validated_data['network']['interfaces']:
+            add('network', net_data)
+    
+    return metrics
+
+def with_uptime(kernel, timestamp):
+    """Kernel data with system_uptime derived from boot_time
+    
+    Agents leave the uptime out: it changes with every sample and would
+    keep the kernel section from ever being suppressed as unchanged. Older
+    agents still send it, with a boot_time in local time.
+    """
+    boot_time = kernel.get('boot_time')
+    boot_time = parse_datetime(boot_time) if isinstance(boot_time, str) else None
+    if 'system_uptime' in kernel or boot_time is None or boot_time.tzinfo is None:
+        return kernel
+    return {**kernel, 'system_uptime': (timestamp - boot_time).total_seconds()}
+
+def build_values(metrics):
+    """Unsaved typed NodeMetricValue rows of the hot series in metrics"""
+    return [
+        NodeMetricValue(node=m.node, timestamp=m.timestamp, series=series, label=label, value=value)
+        for m in metrics
+        for series, label, value in extract_values(m.metric_type, m.data)
+    ]
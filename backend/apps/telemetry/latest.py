@@ -0,0 +1,99 @@
+from django_redis import get_redis_connection
+from .series import extract_values
+
+# Summary field: (series, how values of several labels are combined)
+SUMMARY_FIELDS = {
+    'cpu_percent': ('cpu_percent', max),
+    'load_1m': ('load_1m', max),
+    'memory_percent': ('memory_percent', max),
+    'swap_percent': ('swap_percent', max),
+    'disk_percent_max': ('disk_percent', max),
+    'net_rx_bps': ('net_rx_bps', sum),
+    'net_tx_bps': ('net_tx_bps', sum),
+}
+
+# Collectors run on their own intervals, so a sample rarely carries every
+# field: each value keeps the sample time it was measured at in
+# <field>_ts and is only replaced by a newer measurement, which also keeps
+# spool replays from rolling it back. The heartbeat and the time of the
+# newest sample only move forward.
+# ARGV: heartbeat, newest sample time, then (field, sample time, value)
+WRITE_IF_NEWER = """
+local function forward(field, value)
+    if tonumber(value) > tonumber(redis.call('HGET', KEYS[1], field) or '0') then
+        redis.call('HSET', KEYS[1], field, value)
+    end
+end
+forward('heartbeat', ARGV[1])
+forward('timestamp', ARGV[2])
+for i = 3, #ARGV, 3 do
+    local field, measured = ARGV[i], ARGV[i + 1]
+    if tonumber(measured) >= tonumber(redis.call('HGET', KEYS[1], field .. '_ts') or '0') then
+        redis.call('HSET', KEYS[1], field, ARGV[i + 2], field .. '_ts', measured)
+    end
+end
+"""
+
+def latest_key(node_id):
+    return f'telemetry:latest:{node_id}'
+
+def summarize(metrics):
+    """Newest value of every summary field among unsaved NodeMetric rows
+
+    Values of several labels (disks, interfaces) are combined per sample;
+    ``degraded_level`` is the resource governor level of the newest sample.
+    Returns ``(newest sample time, {field: (sample time, value)})``, or
+    None without metrics.
+    """
+    if not metrics:
+        return None
+
+    values = {}
+    for m in metrics:
+        for series, _, value in extract_values(m.metric_type, m.data):
+            values.setdefault(series, {}).setdefault(m.timestamp, []).append(value)
+
+    fields = {}
+    for field, (series, combine) in SUMMARY_FIELDS.items():
+        if series in values:
+            measured = max(values[series])
+            fields[field] = (measured, combine(values[series][measured]))
+
+    # Every sample tells whether the agent is degraded: the marker sits on
+    # its agent row and is absent at level 0
+    newest = max(m.timestamp for m in metrics)
+    fields['degraded_level'] = (newest, max(
+        (m.data.get('degraded', {}).get('level', 0)
+         for m in metrics if m.timestamp == newest and m.metric_type == 'agent'),
+        default=0
+    ))
+    return newest, fields
+
+def write_latest(node, metrics, heartbeat):
+    """Merge the newest values of an upload into the node's Redis hash"""
+    summary = summarize(metrics)
+    if summary is None:
+        return
+
+    newest, fields = summary
+    args = [heartbeat.timestamp(), newest.timestamp()]
+    for field, (measured, value) in fields.items():
+        args += [field, measured.timestamp(), value]
+    get_redis_connection('default').eval(WRITE_IF_NEWER, 1, latest_key(node.pk), *args)
+
+def read_latest(node_ids):
+    """Latest summaries of many nodes in one pipelined round trip
+
+    Returns ``{node_id: {field: float}}``, with the sample time of each
+    value in ``<field>_ts``; nodes that never reported map to an empty
+    dict.
+    """
+    node_ids = list(node_ids)
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for node_id in node_ids:
+        pipe.hgetall(latest_key(node_id))
+
+    return {
+        node_id: {field.decode(): float(value) for field, value in summary.items()}
+        for node_id, summary in zip(node_ids, pipe.execute())
+    }
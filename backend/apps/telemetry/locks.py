@@ -0,0 +1,48 @@
+import logging
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import LockError
+from apps.alerts import engine
+from . import anomaly
+
+logger = logging.getLogger(__name__)
+
+def state_keys(node_ids):
+    """Cache keys of the per-node state updated while storing samples"""
+    return [
+        key for node_id in node_ids
+        for key in (anomaly.state_key(node_id), engine.state_key(node_id))
+    ]
+
+@contextmanager
+def lock_node_states(node_ids):
+    """Hold the per-node state of these nodes for one write
+
+    Detector and alert rule state is read from the cache, updated in memory and saved when
+    the transaction commits. Wrapped around the transaction, the locks keep
+    concurrent writers of the same node from overwriting each other's
+    update. Locks are taken in sorted order so writers cannot deadlock, and
+    expire on their own if a writer dies. Caches without locks (local
+    memory in development and tests) serve a single process and are not
+    locked.
+    """
+    if not hasattr(cache, 'lock'):
+        yield
+        return
+
+    config = settings.TELEMETRY_STATE_LOCK
+    with ExitStack() as stack:
+        for key in sorted(set(state_keys(node_ids))):
+            lock = cache.lock(f'{key}:lock', timeout=config['timeout'], blocking_timeout=config['wait'])
+            if not lock.acquire():
+                raise LockError(f'Timed out waiting for {key}')
+            stack.callback(release, lock, key)
+        yield
+
+def release(lock, key):
+    try:
+        lock.release()
+    except LockError:
+        # Held past its timeout, another writer may have updated the state
+        logger.warning(f'Lock on {key} expired before the write finished')
@@ -0,0 +1,33 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.telemetry.pipeline import drain
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Drain the telemetry ingest stream into the database in large batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', help='Consumer name (default: host and pid)')
+        parser.add_argument('--block-ms', type=int, default=1000,
+                            help='How long to wait for new uploads per read')
+        parser.add_argument('--restart-delay', type=float, default=5,
+                            help='Seconds to wait before draining again after an error')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Draining telemetry ingest stream, Ctrl+C to stop')
+        while True:
+            try:
+                drain(consumer=options['consumer'], block_ms=options['block_ms'])
+            except KeyboardInterrupt:
+                return
+            except Exception:
+                # Database or Redis went away; pending entries are claimed again
+                logger.exception('Ingest writer failed, draining again shortly')
+                close_old_connections()
+                try:
+                    time.sleep(options['restart_delay'])
+                except KeyboardInterrupt:
+                    return
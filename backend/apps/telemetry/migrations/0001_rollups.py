@@ -0,0 +1,118 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations
+
+# Frozen: the first rollups read their series straight out of the JSON of
+# nodes_nodemetric. 0002 rebuilds them on nodes_nodemetricvalue.
+SERIES = {
+    'cpu_percent': ('cpu', 'overall_percent'),
+    'memory_percent': ('memory', 'percent_used'),
+    'swap_percent': ('memory', 'swap_percent'),
+    'disk_percent': ('disk', 'percent_used'),
+    'net_rx_bps': ('network', 'rx_bps'),
+    'net_tx_bps': ('network', 'tx_bps'),
+}
+
+LABEL = "COALESCE(data->>'mount_point', data->>'interface', '')"
+
+RESOLUTIONS = (
+    ('1m', timedelta(minutes=1), None),
+    ('1h', timedelta(hours=1), '1m'),
+    ('1d', timedelta(days=1), '1h'),
+)
+
+REFRESH = {
+    '1m': ('1 day', '1 minute', '1 minute'),
+    '1h': ('3 days', '1 hour', '30 minutes'),
+    '1d': ('30 days', '1 day', '1 hour'),
+}
+
+def view_name(resolution):
+    return f'telemetry_rollup_{resolution}'
+
+def create_rollup_sql(resolution, width, source):
+    bucket = f"time_bucket(INTERVAL '{int(width.total_seconds())} seconds', {{}})"
+    columns = []
+
+    if source is None:
+        for name, (metric_type, field) in SERIES.items():
+            value = f"CASE WHEN metric_type = '{metric_type}' THEN (data->>'{field}')::float8 END"
+            columns += [
+                f'sum({value}) AS {name}_sum',
+                f'count({value}) AS {name}_count',
+                f'min({value}) AS {name}_min',
+                f'max({value}) AS {name}_max',
+            ]
+        metric_types = ', '.join(sorted({f"'{t}'" for t, _ in SERIES.values()}))
+        return (
+            f"CREATE MATERIALIZED VIEW {view_name(resolution)} WITH (timescaledb.continuous) AS "
+            f"SELECT {bucket.format('timestamp')} AS bucket, node_id, {LABEL} AS label, "
+            f"{', '.join(columns)} "
+            f"FROM nodes_nodemetric WHERE metric_type IN ({metric_types}) "
+            f"GROUP BY {bucket.format('timestamp')}, node_id, {LABEL} "
+            f"WITH NO DATA"
+        )
+
+    for name in SERIES:
+        columns += [
+            f'sum({name}_sum) AS {name}_sum',
+            f'sum({name}_count) AS {name}_count',
+            f'min({name}_min) AS {name}_min',
+            f'max({name}_max) AS {name}_max',
+        ]
+    return (
+        f"CREATE MATERIALIZED VIEW {view_name(resolution)} WITH (timescaledb.continuous) AS "
+        f"SELECT {bucket.format('bucket')} AS bucket, node_id, label, {', '.join(columns)} "
+        f"FROM {view_name(source)} "
+        f"GROUP BY {bucket.format('bucket')}, node_id, label "
+        f"WITH NO DATA"
+    )
+
+def apply_policies(cursor):
+    for resolution, _, _ in RESOLUTIONS:
+        view = view_name(resolution)
+        start, end, schedule = REFRESH[resolution]
+        cursor.execute(
+            f"SELECT add_continuous_aggregate_policy('{view}', "
+            f"start_offset => INTERVAL %s, end_offset => INTERVAL %s, schedule_interval => INTERVAL %s)",
+            [start, end, schedule]
+        )
+
+        retention = settings.TELEMETRY_ROLLUPS.get(resolution)
+        if retention:
+            cursor.execute(f"SELECT add_retention_policy('{view}', %s::interval)", [retention])
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for resolution, width, source in RESOLUTIONS:
+            cursor.execute(create_rollup_sql(resolution, width, source))
+            # Serve the not yet materialised tail from the level below
+            cursor.execute(
+                f'ALTER MATERIALIZED VIEW {view_name(resolution)} '
+                f'SET (timescaledb.materialized_only = false)'
+            )
+            cursor.execute(f'CREATE INDEX ON {view_name(resolution)} (node_id, bucket DESC)')
+        apply_policies(cursor)
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for resolution, _, _ in reversed(RESOLUTIONS):
+            cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {view_name(resolution)}')
+
+class Migration(migrations.Migration):
+    # Continuous aggregates cannot be created inside a transaction block
+    atomic = False
+
+    dependencies = [
+        ('nodes', '0002_hypertables'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
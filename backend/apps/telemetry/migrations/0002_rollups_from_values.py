@@ -0,0 +1,120 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations
+
+# Frozen: the series and rollup layout as of this migration. Later changes
+# to apps.telemetry.series or apps.telemetry.rollups need a migration of
+# their own.
+SERIES = {
+    'cpu_percent': ('cpu', ('overall_percent',)),
+    'load_1m': ('cpu', ('load_avg', 0)),
+    'memory_percent': ('memory', ('percent_used',)),
+    'swap_percent': ('memory', ('swap_percent',)),
+    'disk_percent': ('disk', ('percent_used',)),
+    'disk_read_bytes': ('disk', ('io_stats', 'read_bytes')),
+    'disk_write_bytes': ('disk', ('io_stats', 'write_bytes')),
+    'net_rx_bps': ('network', ('rx_bps',)),
+    'net_tx_bps': ('network', ('tx_bps',)),
+}
+
+LABEL_FIELDS = {
+    'disk': 'mount_point',
+    'network': 'interface',
+}
+
+RESOLUTIONS = (
+    ('1m', timedelta(minutes=1), None),
+    ('1h', timedelta(hours=1), '1m'),
+    ('1d', timedelta(days=1), '1h'),
+)
+
+REFRESH = {
+    '1m': ('1 day', '1 minute', '1 minute'),
+    '1h': ('3 days', '1 hour', '30 minutes'),
+    '1d': ('30 days', '1 day', '1 hour'),
+}
+
+def view_name(resolution):
+    return f'telemetry_rollup_{resolution}'
+
+def backfill_sql(name):
+    metric_type, path = SERIES[name]
+    json_path = '{' + ','.join(str(key) for key in path) + '}'
+    label = f"COALESCE(data->>'{LABEL_FIELDS[metric_type]}', '')" if metric_type in LABEL_FIELDS else "''"
+    return (
+        f"INSERT INTO nodes_nodemetricvalue (node_id, timestamp, series, label, value) "
+        f"SELECT node_id, timestamp, '{name}', {label}, (data #>> '{json_path}')::float8 "
+        f"FROM nodes_nodemetric "
+        f"WHERE metric_type = '{metric_type}' "
+        f"AND jsonb_typeof(data #> '{json_path}') = 'number'"
+    )
+
+def create_rollup_sql(resolution, width, source):
+    bucket = f"time_bucket(INTERVAL '{int(width.total_seconds())} seconds', {{}})"
+
+    if source is None:
+        time_column, table = 'timestamp', 'nodes_nodemetricvalue'
+        columns = ('sum(value) AS value_sum, count(value) AS value_count, '
+                   'min(value) AS value_min, max(value) AS value_max')
+    else:
+        time_column, table = 'bucket', view_name(source)
+        columns = ('sum(value_sum) AS value_sum, sum(value_count) AS value_count, '
+                   'min(value_min) AS value_min, max(value_max) AS value_max')
+
+    return (
+        f"CREATE MATERIALIZED VIEW {view_name(resolution)} WITH (timescaledb.continuous) AS "
+        f"SELECT {bucket.format(time_column)} AS bucket, node_id, series, label, {columns} "
+        f"FROM {table} "
+        f"GROUP BY {bucket.format(time_column)}, node_id, series, label "
+        f"WITH NO DATA"
+    )
+
+def apply_policies(cursor):
+    # Retention stays configurable, as in TELEMETRY_ROLLUPS at migrate time
+    for resolution, _, _ in RESOLUTIONS:
+        view = view_name(resolution)
+        start, end, schedule = REFRESH[resolution]
+        cursor.execute(
+            f"SELECT add_continuous_aggregate_policy('{view}', "
+            f"start_offset => INTERVAL %s, end_offset => INTERVAL %s, schedule_interval => INTERVAL %s)",
+            [start, end, schedule]
+        )
+
+        retention = settings.TELEMETRY_ROLLUPS.get(resolution)
+        if retention:
+            cursor.execute(f"SELECT add_retention_policy('{view}', %s::interval)", [retention])
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        # Dropping a continuous aggregate drops its policies with it
+        for resolution, _, _ in reversed(RESOLUTIONS):
+            cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {view_name(resolution)}')
+
+        # Values of samples stored before the typed table existed
+        for name in SERIES:
+            cursor.execute(backfill_sql(name))
+
+        for resolution, width, source in RESOLUTIONS:
+            cursor.execute(create_rollup_sql(resolution, width, source))
+            cursor.execute(
+                f'ALTER MATERIALIZED VIEW {view_name(resolution)} '
+                f'SET (timescaledb.materialized_only = false)'
+            )
+            cursor.execute(f'CREATE INDEX ON {view_name(resolution)} (node_id, series, bucket DESC)')
+        apply_policies(cursor)
+
+class Migration(migrations.Migration):
+    # Continuous aggregates cannot be created inside a transaction block
+    atomic = False
+
+    dependencies = [
+        ('telemetry', '0001_rollups'),
+        ('nodes', '0003_nodemetricvalue'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,275 @@
+import csv
+import io
+import json
+import logging
+import os
+import socket
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction, InterfaceError, OperationalError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+from apps.nodes.models import Node, NodeMetric, NodeMetricValue, NodeEvent
+from .series import extract_values
+from .anomaly import detect, resolve_events
+from .locks import lock_node_states
+from apps.alerts.engine import evaluate, resolve_alerts
+
+logger = logging.getLogger(__name__)
+
+GROUP = 'writers'
+METRIC_FIELDS = ('created_at', 'updated_at', 'node', 'timestamp', 'metric_type', 'data')
+VALUE_FIELDS = ('node', 'timestamp', 'series', 'label', 'value')
+
+# Failures of the database or Redis themselves, not of the entries written;
+# entries failing with these stay pending and are never dead-lettered, and
+# uploads failing with them are refused with a retry_after. The cache API
+# wraps Redis errors in ConnectionInterrupted.
+TRANSIENT_ERRORS = (InterfaceError, OperationalError, RedisError, ConnectionInterrupted)
+
+class QueueFull(Exception):
+    """The ingest stream is over its high-water mark"""
+
+def is_queued():
+    return getattr(settings, 'TELEMETRY_INGEST_MODE', 'sync') == 'queued'
+
+def get_stream():
+    return get_redis_connection('default'), settings.TELEMETRY_QUEUE_STREAM
+
+def check_backlog():
+    """Raise QueueFull when writers are too far behind to accept more uploads"""
+    redis, stream = get_stream()
+    if redis.xlen(stream) >= settings.TELEMETRY_QUEUE_MAX_LENGTH:
+        raise QueueFull(stream)
+
+def enqueue_rows(node, metrics, seq=None):
+    """Push the rows of one upload to the ingest stream
+
+    Rows are already validated and built, so writers only have to copy
+    them into the database and run anomaly detection. A stream frame's seq
+    goes along for write_batch to skip frames queued twice.
+    """
+    check_backlog()
+    entry = {
+        'node': str(node.pk),
+        'heartbeat': timezone.now(),
+        'metrics': [(m.timestamp, m.metric_type, m.data) for m in metrics],
+    }
+    if seq is not None:
+        entry['seq'] = seq
+    redis, stream = get_stream()
+    redis.xadd(stream, {'rows': json.dumps(entry, cls=DjangoJSONEncoder)})
+
+def ensure_group(redis, stream):
+    try:
+        redis.xgroup_create(stream, GROUP, id='0', mkstream=True)
+    except Exception as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+def read_batch(redis, stream, consumer, count, block_ms):
+    """Entries left pending by dead writers first, then new ones"""
+    _, entries, *_ = redis.xautoclaim(
+        stream, GROUP, consumer,
+        min_idle_time=settings.TELEMETRY_QUEUE_CLAIM_IDLE_MS, start_id='0-0', count=count
+    )
+    if not entries:
+        response = redis.xreadgroup(GROUP, consumer, {stream: '>'}, count=count, block=block_ms)
+        entries = response[0][1] if response else []
+    # Entries deleted while pending come back without fields
+    return [(entry_id, fields.get(b'rows') if fields else None) for entry_id, fields in entries]
+
+def write_entries(entries):
+    """write_batch over entries as read from the stream"""
+    return write_batch([json.loads(rows) for rows in entries if rows is not None])
+
+def deliveries(redis, stream, entry_id):
+    """How often an entry was handed to a writer so far"""
+    pending = redis.xpending_range(stream, GROUP, min=entry_id, max=entry_id, count=1)
+    return pending[0]['times_delivered'] if pending else 1
+
+def write_one_by_one(redis, stream, batch):
+    """Write the entries of a failed batch one at a time
+
+    Entries that fail stay pending and are claimed again later, until they
+    were delivered TELEMETRY_QUEUE_MAX_DELIVERIES times; then they are
+    moved to the dead-letter stream. Returns ``(ids, stored)``: the entries
+    that are done with and the number of metric rows written.
+    """
+    dead_letter = settings.TELEMETRY_QUEUE_DEAD_LETTER_STREAM
+    done = []
+    stored = 0
+
+    for entry_id, rows in batch:
+        try:
+            stored += write_entries([rows])
+        except TRANSIENT_ERRORS:
+            # The rest stays pending; what was written is still acknowledged
+            logger.exception(f'Failed to write queued upload {entry_id}, leaving the rest pending')
+            break
+        except Exception as e:
+            attempts = deliveries(redis, stream, entry_id)
+            if attempts < settings.TELEMETRY_QUEUE_MAX_DELIVERIES:
+                logger.warning(f'Failed to write queued upload {entry_id} (attempt {attempts}): {e}')
+                continue
+            logger.error(f'Moving queued upload {entry_id} to {dead_letter} after {attempts} attempts: {e}')
+            redis.xadd(dead_letter, {'id': entry_id, 'rows': rows or b'', 'error': str(e)})
+        done.append(entry_id)
+
+    return done, stored
+
+def copy_rows(cursor, model, fields, rows):
+    """COPY rows (tuples in the order of fields) into a model's table"""
+    opts = model._meta
+    columns = [opts.get_field(name).column for name in fields]
+
+    buffer = io.StringIO()
+    # Quote every field: COPY reads a bare empty field as NULL, an empty
+    # quoted one as the empty string (e.g. the label of unlabelled series)
+    csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+    buffer.seek(0)
+
+    cursor.copy_expert(
+        f"COPY {opts.db_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def update_heartbeats(cursor, heartbeats):
+    """Move every node's heartbeat forward in one statement"""
+    table = Node._meta.db_table
+    column = Node._meta.get_field('last_heartbeat').column
+    values = ', '.join(['(%s::uuid, %s::timestamptz)'] * len(heartbeats))
+    cursor.execute(
+        f'UPDATE {table} AS n SET {column} = v.heartbeat '
+        f'FROM (VALUES {values}) AS v(id, heartbeat) '
+        f'WHERE n.id = v.id AND (n.{column} IS NULL OR n.{column} < v.heartbeat)',
+        [param for item in heartbeats.items() for param in item]
+    )
+
+def skip_duplicates(entries):
+    """Entries not stored yet, moving each node's stream_seq forward
+
+    A stream frame resent after a lost ack is queued twice; entries at or
+    below the node's stream_seq are dropped. Runs in the transaction that
+    stores the rows, with the nodes' rows locked.
+    """
+    sequenced = {entry['node'] for entry in entries if entry.get('seq') is not None}
+    if not sequenced:
+        return entries
+
+    stored = {
+        str(pk): seq for pk, seq in
+        Node.objects.select_for_update().filter(pk__in=sequenced).values_list('id', 'stream_seq')
+    }
+    fresh = []
+    advanced = {}
+    for entry in entries:
+        seq = entry.get('seq')
+        if seq is not None:
+            if seq <= stored.get(entry['node'], 0):
+                logger.info(f"Skipping frame {seq} of node {entry['node']}, already stored")
+                continue
+            stored[entry['node']] = advanced[entry['node']] = seq
+        fresh.append(entry)
+
+    for node_id, seq in advanced.items():
+        Node.objects.filter(pk=node_id).update(stream_seq=seq)
+    return fresh
+
+def write_batch(entries):
+    """Store the rows of many uploads in one transaction
+
+    Anomaly detection and alert rules run over the whole batch at once,
+    vectorised across every node and series in it.
+    """
+    now = timezone.now().isoformat()
+    metrics = []
+    values = []
+    samples = []
+    events = []
+    heartbeats = {}
+
+    with lock_node_states({entry['node'] for entry in entries}), transaction.atomic():
+        for entry in skip_duplicates(entries):
+            node_id = entry['node']
+            node_samples = []
+            for timestamp, metric_type, data in entry['metrics']:
+                metrics.append((now, now, node_id, timestamp, metric_type, json.dumps(data)))
+                values.extend(
+                    (node_id, timestamp, *value) for value in extract_values(metric_type, data)
+                )
+                node_samples.append((parse_datetime(timestamp), metric_type, data))
+            samples.append((node_id, node_samples))
+            # Entries queued before detection moved to the writers carry their events
+            events.extend(NodeEvent(node_id=node_id, **event) for event in entry.get('events', ()))
+            heartbeat = parse_datetime(entry['heartbeat'])
+            if node_id not in heartbeats or heartbeats[node_id] < heartbeat:
+                heartbeats[node_id] = heartbeat
+
+        with connection.cursor() as cursor:
+            if metrics:
+                copy_rows(cursor.cursor, NodeMetric, METRIC_FIELDS, metrics)
+            if values:
+                copy_rows(cursor.cursor, NodeMetricValue, VALUE_FIELDS, values)
+            if heartbeats:
+                update_heartbeats(cursor, heartbeats)
+        detected, resolutions = detect(samples)
+        nodes = {
+            str(pk): node
+            for pk, node in Node.objects.only('id', 'organization', 'tags').in_bulk(list(heartbeats)).items()
+        }
+        alerts, resolved_alerts = evaluate(
+            [(nodes[node_id], node_samples) for node_id, node_samples in samples if node_id in nodes]
+        )
+        events.extend(detected + alerts)
+        if events:
+            NodeEvent.objects.bulk_create(events)
+        resolve_events(resolutions)
+        resolve_alerts(resolved_alerts)
+
+    return len(metrics)
+
+def drain(max_batches=None, consumer=None, block_ms=1000):
+    """Copy queued uploads into the database in large batches
+
+    Without block_ms, returns once the stream is empty; with it, waits for
+    new entries until max_batches batches were written. Entries are
+    acknowledged only after their batch committed; a writer that dies
+    leaves them pending for another writer to claim. A batch that fails is
+    written again one entry at a time, so one bad entry does not hold the
+    others back (see write_one_by_one). Database and Redis outages are
+    raised, leaving the whole batch pending.
+    """
+    redis, stream = get_stream()
+    consumer = consumer or f'{socket.gethostname()}-{os.getpid()}'
+    ensure_group(redis, stream)
+    batch_size = settings.TELEMETRY_QUEUE_BATCH_SIZE
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        batch = read_batch(redis, stream, consumer, batch_size, block_ms)
+        if not batch:
+            if block_ms is None:
+                break
+            continue
+
+        ids = [entry_id for entry_id, _ in batch]
+        try:
+            stored = write_entries([rows for _, rows in batch])
+        except TRANSIENT_ERRORS:
+            logger.exception(f'Failed to write {len(batch)} queued uploads, leaving them pending')
+            raise
+        except Exception:
+            logger.exception(f'Failed to write {len(batch)} queued uploads, retrying them one by one')
+            ids, stored = write_one_by_one(redis, stream, batch)
+
+        if ids:
+            redis.xack(stream, GROUP, *ids)
+            redis.xdel(stream, *ids)
+        batches += 1
+        logger.debug(f'Wrote {stored} metric rows from {len(batch)} queued uploads')
+
+    return batches
@@ -0,0 +1,188 @@
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from apps.nodes.models import NodeMetricValue
+from .series import SERIES
+
+# Finest first: (name, bucket width, source the level is built from)
+RESOLUTIONS = (
+    ('1m', timedelta(minutes=1), None),
+    ('1h', timedelta(hours=1), '1m'),
+    ('1d', timedelta(days=1), '1h'),
+)
+
+# Continuous aggregate refresh: (start offset, end offset, schedule)
+REFRESH = {
+    '1m': ('1 day', '1 minute', '1 minute'),  # agents replay up to a day late
+    '1h': ('3 days', '1 hour', '30 minutes'),
+    '1d': ('30 days', '1 day', '1 hour'),
+}
+
+LEVEL_WIDTH = {name: width for name, width, _ in RESOLUTIONS}
+
+def view_name(resolution):
+    return f'telemetry_rollup_{resolution}'
+
+def create_rollup_sql(resolution, width, source):
+    """CREATE statement of one continuous aggregate level
+
+    Values are kept as sum, count, min and max so coarser levels (and
+    re-bucketed queries) can combine buckets without averaging averages.
+    The finest level reads the typed nodes_nodemetricvalue table.
+    """
+    bucket = f"time_bucket(INTERVAL '{int(width.total_seconds())} seconds', {{}})"
+
+    if source is None:
+        time_column, table = 'timestamp', 'nodes_nodemetricvalue'
+        columns = ('sum(value) AS value_sum, count(value) AS value_count, '
+                   'min(value) AS value_min, max(value) AS value_max')
+    else:
+        time_column, table = 'bucket', view_name(source)
+        columns = ('sum(value_sum) AS value_sum, sum(value_count) AS value_count, '
+                   'min(value_min) AS value_min, max(value_max) AS value_max')
+
+    return (
+        f"CREATE MATERIALIZED VIEW {view_name(resolution)} WITH (timescaledb.continuous) AS "
+        f"SELECT {bucket.format(time_column)} AS bucket, node_id, series, label, {columns} "
+        f"FROM {table} "
+        f"GROUP BY {bucket.format(time_column)}, node_id, series, label "
+        f"WITH NO DATA"
+    )
+
+def apply_rollup_policies(cursor):
+    """(Re)apply refresh and retention policies of every rollup level"""
+    for resolution, _, _ in RESOLUTIONS:
+        view = view_name(resolution)
+        start, end, schedule = REFRESH[resolution]
+
+        cursor.execute(f"SELECT remove_continuous_aggregate_policy('{view}', if_exists => true)")
+        cursor.execute(
+            f"SELECT add_continuous_aggregate_policy('{view}', "
+            f"start_offset => INTERVAL %s, end_offset => INTERVAL %s, schedule_interval => INTERVAL %s)",
+            [start, end, schedule]
+        )
+
+        retention = settings.TELEMETRY_ROLLUPS[resolution]
+        cursor.execute(f"SELECT remove_retention_policy('{view}', if_exists => true)")
+        if retention:
+            cursor.execute(f"SELECT add_retention_policy('{view}', %s::interval)", [retention])
+
+def usable_resolutions(start):
+    """Rollup levels, finest first, that still hold data back to start"""
+    now = timezone.now()
+    usable = [
+        (name, width) for name, width, _ in RESOLUTIONS
+        if not settings.TELEMETRY_ROLLUPS[name] or now - settings.TELEMETRY_ROLLUPS[name] <= start
+    ]
+    return usable or [RESOLUTIONS[-1][:2]]
+
+def choose_resolution(start, end, max_points):
+    """Pick the rollup level and bucket width for a time range
+
+    The target bucket width is the range split into max_points buckets. The
+    coarsest level not wider than that (and still holding data back to
+    start) is read, since it has the fewest rows to scan, and its buckets
+    are merged into the smallest whole multiple of the level's width that
+    keeps within max_points. Short ranges fall back to the finest usable
+    level.
+    """
+    target = (end - start) / max_points
+    usable = usable_resolutions(start)
+
+    name, width = usable[0]
+    for level, level_width in usable:
+        if level_width <= target:
+            name, width = level, level_width
+
+    return name, width * max(1, math.ceil((end - start) / width / max_points))
+
+def rollup_rows(node_ids, series, resolution, width, start, end, label=None):
+    """Rows of a rollup level re-bucketed to width, for several nodes
+
+    Returns ``(node_id, timestamp, label, avg, min, max, count)`` tuples
+    ordered by node, label and time.
+    """
+    node_ids = [str(node_id) for node_id in node_ids]
+    params = [width, node_ids, series, LEVEL_WIDTH[resolution], start, end]
+    label_filter = ''
+    if label is not None:
+        label_filter = 'AND label = %s '
+        params.append(label)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT node_id, time_bucket(%s, bucket) AS t, label, "
+            f"sum(value_sum) / NULLIF(sum(value_count), 0), "
+            f"min(value_min), max(value_max), sum(value_count) "
+            f"FROM {view_name(resolution)} "
+            f"WHERE node_id = ANY(%s::uuid[]) AND series = %s "
+            f"AND bucket >= time_bucket(%s, %s::timestamptz) AND bucket < %s "
+            f"{label_filter}"
+            f"GROUP BY node_id, t, label ORDER BY node_id, label, t",
+            params
+        )
+        return cursor.fetchall()
+
+def raw_rows(node_ids, series, start, end, label=None):
+    """Stored values in the same shape as rollup_rows, one row per sample"""
+    values = NodeMetricValue.objects.filter(
+        node_id__in=node_ids, series=series, timestamp__gte=start, timestamp__lt=end
+    )
+    if label is not None:
+        values = values.filter(label=label)
+
+    return [
+        (node_id, timestamp, row_label, value, value, value, 1)
+        for node_id, timestamp, row_label, value in values.order_by(
+            'node_id', 'label', 'timestamp'
+        ).values_list('node_id', 'timestamp', 'label', 'value')
+    ]
+
+def fetch_series(node_ids, series, start, end, budget, label=None):
+    """Rows of a series for charting, at most about budget per node and label
+
+    Ranges short enough to hold no more than budget samples at the shortest
+    agent sample interval are read from the stored values instead, so they
+    keep every sample. Returns ``(resolution, width, rows)``; resolution is
+    'raw' and width None for stored values.
+    """
+    if series not in SERIES:
+        raise ValueError(f'Unknown series: {series}')
+
+    if (end - start) / settings.TELEMETRY_RAW_INTERVAL <= budget:
+        return 'raw', None, raw_rows(node_ids, series, start, end, label)
+
+    resolution, width = choose_resolution(start, end, budget)
+    return resolution, width, rollup_rows(node_ids, series, resolution, width, start, end, label)
+
+def summarize_series(node_id, series, start, end, label=None):
+    """Average, minimum and maximum of a series over a whole time range
+
+    Reads the finest level that covers the range, so partial coarse buckets
+    at either end do not skew the result. Returns None without data.
+    """
+    if series not in SERIES:
+        raise ValueError(f'Unknown series: {series}')
+
+    resolution, _ = usable_resolutions(start)[0]
+    params = [node_id, series, start, end]
+    label_filter = ''
+    if label is not None:
+        label_filter = 'AND label = %s'
+        params.append(label)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT sum(value_sum) / NULLIF(sum(value_count), 0), "
+            f"min(value_min), max(value_max), sum(value_count) "
+            f"FROM {view_name(resolution)} "
+            f"WHERE node_id = %s AND series = %s AND bucket >= %s AND bucket < %s {label_filter}",
+            params
+        )
+        avg, low, high, count = cursor.fetchone()
+
+    if not count:
+        return None
+    return {'avg': avg, 'min': low, 'max': high, 'count': count}
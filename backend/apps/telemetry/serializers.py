@@ -1,5 +1,8 @@
 from rest_framework import serializers
+from datetime import timedelta
+from django.utils import timezone
 from apps.nodes.models import NodeMetric, NodeEvent, NodeProcess
+from .series import SERIES
 
 class MetricSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,6 +15,8 @@ class CPUMetricSerializer(serializers.Serializer):
     user_time = serializers.FloatField()
     system_time = serializers.FloatField()
     idle_time = serializers.FloatField()
+    load_avg = serializers.ListField(child=serializers.FloatField(), required=False, allow_null=True)
+    sample_interval = serializers.FloatField(required=False)
 
 class MemoryMetricSerializer(serializers.Serializer):
     total = serializers.IntegerField()
@@ -19,26 +24,41 @@ class MemoryMetricSerializer(serializers.Serializer):
     free = serializers.IntegerField()
     available = serializers.IntegerField()
     percent_used = serializers.FloatField()
+    swap_total = serializers.IntegerField(required=False)
+    swap_used = serializers.IntegerField(required=False)
+    swap_percent = serializers.FloatField(required=False)
 
 class DiskMetricSerializer(serializers.Serializer):
     total = serializers.IntegerField()
     used = serializers.IntegerField()
     free = serializers.IntegerField()
+    percent_used = serializers.FloatField(required=False)
+    device = serializers.CharField(required=False)
     mount_point = serializers.CharField()
-    fs_type = serializers.CharField()
+    fs_type = serializers.CharField(allow_blank=True)
+    io_stats = serializers.DictField(required=False, allow_null=True)
     iops = serializers.FloatField(required=False)
     latency_ms = serializers.FloatField(required=False)
 
 class NetworkMetricSerializer(serializers.Serializer):
     interface = serializers.CharField()
-    speed = serializers.IntegerField()
+    speed = serializers.IntegerField(allow_null=True)
     status = serializers.CharField()
-    bytes_sent = serializers.IntegerField()
-    bytes_recv = serializers.IntegerField()
-    packets_sent = serializers.IntegerField()
-    packets_recv = serializers.IntegerField()
-    errors_in = serializers.IntegerField()
-    errors_out = serializers.IntegerField()
+    rx_bps = serializers.FloatField(allow_null=True)
+    tx_bps = serializers.FloatField(allow_null=True)
+    rx_pps = serializers.FloatField(allow_null=True)
+    tx_pps = serializers.FloatField(allow_null=True)
+    errin = serializers.IntegerField()
+    errout = serializers.IntegerField()
+    dropin = serializers.IntegerField(required=False)
+    dropout = serializers.IntegerField(required=False)
+    ip_addresses = serializers.ListField(child=serializers.CharField(), required=False)
+
+class NetworkSectionSerializer(serializers.Serializer):
+    interfaces = NetworkMetricSerializer(many=True)
+    tcp_connections = serializers.DictField(child=serializers.IntegerField(), required=False)
+    udp_count = serializers.IntegerField(required=False)
+    listening_ports = serializers.ListField(child=serializers.DictField(), required=False)
 
 class NodeMetricBatchSerializer(serializers.Serializer):
     node_id = serializers.UUIDField()
@@ -46,9 +66,35 @@ class NodeMetricBatchSerializer(serializers.Serializer):
     cpu = CPUMetricSerializer(required=False)
     memory = MemoryMetricSerializer(required=False)
     disk = serializers.ListField(child=DiskMetricSerializer(), required=False)
-    network = serializers.ListField(child=NetworkMetricSerializer(), required=False)
-    processes = serializers.ListField(child=serializers.DictField(), required=False)
+    network = NetworkSectionSerializer(required=False)
+    processes = serializers.DictField(required=False)
     security = serializers.DictField(required=False)
     kernel = serializers.DictField(required=False)
-    containers = serializers.ListField(child=serializers.DictField(), required=False)
-    services = serializers.ListField(child=serializers.DictField(), required=False)
\ No newline at end of file
+    containers = serializers.DictField(required=False)
+    services = serializers.DictField(required=False)
+    aggregates = serializers.DictField(required=False)
+    agent = serializers.DictField(required=False)
+    # Sections resent with their last good value after missing their
+    # deadline: section -> age in seconds (None when never collected)
+    stale = serializers.DictField(child=serializers.FloatField(allow_null=True), required=False)
+    degraded = serializers.DictField(required=False)  # resource governor level and reasons
+
+class SeriesQuerySerializer(serializers.Serializer):
+    nodes = serializers.CharField(help_text='Comma-separated node ids')
+    series = serializers.ChoiceField(choices=sorted(SERIES))
+    label = serializers.CharField(required=False, help_text='Mount point or interface')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    max_points = serializers.IntegerField(min_value=10, max_value=5000, default=500)
+    method = serializers.ChoiceField(choices=['lttb', 'minmax'], default='lttb')
+    
+    def validate_nodes(self, value):
+        field = serializers.UUIDField()
+        return [field.to_internal_value(node_id.strip()) for node_id in value.split(',') if node_id.strip()]
+    
+    def validate(self, data):
+        data.setdefault('end', timezone.now())
+        data.setdefault('start', data['end'] - timedelta(hours=1))
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError('start must be before end')
+        return data
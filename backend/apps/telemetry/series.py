@@ -0,0 +1,41 @@
+# Hot numeric series extracted from NodeMetric.data at ingest
+# series: (metric_type, path into the metric's data)
+SERIES = {
+    'cpu_percent': ('cpu', ('overall_percent',)),
+    'load_1m': ('cpu', ('load_avg', 0)),
+    'memory_percent': ('memory', ('percent_used',)),
+    'swap_percent': ('memory', ('swap_percent',)),
+    'disk_percent': ('disk', ('percent_used',)),
+    'disk_read_bytes': ('disk', ('io_stats', 'read_bytes')),
+    'disk_write_bytes': ('disk', ('io_stats', 'write_bytes')),
+    'net_rx_bps': ('network', ('rx_bps',)),
+    'net_tx_bps': ('network', ('tx_bps',)),
+}
+
+# Per-item metric types are labelled with the item key, the others with ''
+LABEL_FIELDS = {
+    'disk': 'mount_point',
+    'network': 'interface',
+}
+
+BY_METRIC_TYPE = {}
+for _name, (_metric_type, _path) in SERIES.items():
+    BY_METRIC_TYPE.setdefault(_metric_type, []).append((_name, _path))
+
+def lookup(data, path):
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return data
+
+def extract_values(metric_type, data):
+    """(series, label, value) of every hot series found in one metric row"""
+    label = data.get(LABEL_FIELDS[metric_type], '') if metric_type in LABEL_FIELDS else ''
+    values = []
+    for name, path in BY_METRIC_TYPE.get(metric_type, ()):
+        value = lookup(data, path)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values.append((name, label, float(value)))
+    return values
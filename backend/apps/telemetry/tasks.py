@@ -0,0 +1,11 @@
+from celery import shared_task
+from .pipeline import drain
+
+@shared_task(ignore_result=True)
+def drain_ingest_queue(max_batches=20):
+    """Copy queued agent uploads into the database
+
+    Returns once the stream is empty or max_batches were written, so a
+    backlog is spread over several runs and worker slots.
+    """
+    return drain(max_batches=max_batches, block_ms=None)
@@ -1,3 +1,427 @@
-from django.test import TestCase
+import json
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import LockError, RedisError
+from rest_framework.test import APIRequestFactory
+from apps.core.models import Organization
+from apps.nodes.models import Node, NodeMetric, NodeMetricValue
+from .anomaly import detect
+from .delta import expand_sample
+from .downsample import lttb, minmax
+from .locks import lock_node_states
+from .ingestion import build_metrics, store_rows
+from .pipeline import copy_rows, drain, write_batch, METRIC_FIELDS, VALUE_FIELDS
+from .rollups import fetch_series
+from .views import MetricIngestionViewSet
 
-# Create your tests here.
+# Tests that keep state in the cache get their own, not the Redis one
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+def create_node(name='node-1', **fields):
+    """Node of a fresh organization"""
+    owner = User.objects.create_user(f'{name}-owner')
+    organization = Organization.objects.create(name=f'{name} org', owner=owner)
+    return Node.objects.create(
+        organization=organization, name=name, hostname=name, ip_address='10.0.0.1',
+        mac_address='00:00:00:00:00:01', os_type='linux', os_version='12',
+        kernel_version='6.1', api_key=f'{name}-key', **fields
+    )
+
+class CopyRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = create_node()
+
+    def test_empty_label_is_stored_as_empty_string(self):
+        now = timezone.now()
+        rows = [
+            (str(self.node.pk), now.isoformat(), 'cpu_percent', '', 12.5),
+            (str(self.node.pk), now.isoformat(), 'disk_percent', '/', 40.0),
+        ]
+
+        with connection.cursor() as cursor:
+            copy_rows(cursor.cursor, NodeMetricValue, VALUE_FIELDS, rows)
+
+        stored = dict(NodeMetricValue.objects.values_list('series', 'label'))
+        self.assertEqual(stored, {'cpu_percent': '', 'disk_percent': '/'})
+
+    def test_json_data_round_trips(self):
+        now = timezone.now().isoformat()
+        data = {'name': 'sshd, "quoted"', 'mount_point': '', 'count': 3}
+
+        with connection.cursor() as cursor:
+            copy_rows(cursor.cursor, NodeMetric, METRIC_FIELDS, [
+                (now, now, str(self.node.pk), now, 'service', json.dumps(data))
+            ])
+
+        self.assertEqual(NodeMetric.objects.get().data, data)
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StreamSeqTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = create_node()
+
+    def setUp(self):
+        cache.clear()
+
+    def store(self, seq):
+        metrics = [NodeMetric(node=self.node, timestamp=timezone.now(), metric_type='cpu', data={'overall_percent': 12.0})]
+        with self.captureOnCommitCallbacks(execute=True):
+            return store_rows(self.node, metrics, seq=seq)
+
+    def test_resent_frame_is_stored_once(self):
+        self.assertTrue(self.store(7))
+        self.assertFalse(self.store(7))
+
+        self.assertEqual(NodeMetric.objects.count(), 1)
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.stream_seq, 7)
+
+    def test_frame_queued_twice_is_written_once(self):
+        now = timezone.now().isoformat()
+        entry = {
+            'node': str(self.node.pk), 'heartbeat': now, 'seq': 3,
+            'metrics': [(now, 'cpu', {'overall_percent': 12.0})],
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(write_batch([entry, entry]), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(write_batch([entry, {**entry, 'seq': 4}]), 1)
+
+        self.assertEqual(NodeMetric.objects.count(), 2)
+        self.node.refresh_from_db()
+        self.assertEqual(self.node.stream_seq, 4)
+
+class BuildMetricsTests(SimpleTestCase):
+    def test_stale_sections_are_not_stored_again(self):
+        metrics = build_metrics(Node(), {
+            'timestamp': timezone.now(),
+            'cpu': {'overall_percent': 12.0},
+            'security': {'failed_logins': 3},
+            'disk': [{'mount_point': '/', 'percent_used': 40.0}],
+            'stale': {'security': 30.0, 'disk': None},
+        })
+
+        self.assertEqual(sorted(m.metric_type for m in metrics), ['agent', 'cpu'])
+
+    def test_marker_is_kept_on_the_agent_row(self):
+        metrics = build_metrics(Node(), {
+            'timestamp': timezone.now(),
+            'agent': {'rss_bytes': 1024},
+            'stale': {'kernel': 12.0},
+        })
+
+        agent, = metrics
+        self.assertEqual(agent.data, {'rss_bytes': 1024, 'stale': {'kernel': 12.0}})
+
+    def test_degraded_marker_is_kept_without_agent_section(self):
+        degraded = {'level': 2, 'reasons': ['cpu']}
+        metrics = build_metrics(Node(), {
+            'timestamp': timezone.now(),
+            'degraded': degraded,
+        })
+
+        agent, = metrics
+        self.assertEqual(agent.data, {'degraded': degraded})
+
+    def test_uptime_is_derived_from_boot_time(self):
+        metrics = build_metrics(Node(), {
+            'timestamp': datetime(2026, 1, 1, 1, tzinfo=dt_timezone.utc),
+            'kernel': {'kernel_version': '6.1', 'boot_time': '2026-01-01T00:00:00+00:00'},
+        })
+
+        kernel, = metrics
+        self.assertEqual(kernel.data['system_uptime'], 3600.0)
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ExpandSampleTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.node = Node(id=uuid.uuid4())
+        expand_sample(self.node, {
+            'timestamp': '2026-01-01T00:00:00Z',
+            'keyframe': True,
+            'security': {'failed_logins': 3},
+            'disk': [{'mount_point': '/', 'percent_used': 40.0}],
+            'inventory': {
+                'node': {'hostname': 'web-1'},
+                'disk': {'/': {'device': 'sda1', 'fs_type': 'ext4'}},
+            },
+        })
+
+    def test_unchanged_sections_are_rebuilt(self):
+        sample, resync = expand_sample(self.node, {
+            'timestamp': '2026-01-01T00:00:30Z',
+            'delta': True,
+            'unchanged': ['security'],
+            'cpu': {'overall_percent': 5.0},
+        })
+
+        self.assertFalse(resync)
+        self.assertEqual(sample['security'], {'failed_logins': 3})
+        self.assertEqual(sample['hostname'], 'web-1')
+        self.assertNotIn('disk', sample)
+
+    def test_inventory_is_merged_back_into_items(self):
+        sample, _ = expand_sample(self.node, {
+            'timestamp': '2026-01-01T00:00:30Z',
+            'delta': True,
+            'disk': [{'mount_point': '/', 'percent_used': 41.0}],
+        })
+
+        self.assertEqual(sample['disk'], [
+            {'mount_point': '/', 'device': 'sda1', 'fs_type': 'ext4', 'percent_used': 41.0}
+        ])
+
+    def test_older_sample_does_not_roll_state_back(self):
+        expand_sample(self.node, {
+            'timestamp': '2026-01-01T00:01:00Z',
+            'delta': True,
+            'security': {'failed_logins': 0},
+        })
+        expand_sample(self.node, {
+            'timestamp': '2026-01-01T00:00:30Z',
+            'delta': True,
+            'security': {'failed_logins': 7},
+        })
+
+        sample, _ = expand_sample(self.node, {
+            'timestamp': '2026-01-01T00:01:30Z',
+            'delta': True,
+            'unchanged': ['security'],
+        })
+        self.assertEqual(sample['security'], {'failed_logins': 0})
+
+    def test_delta_without_state_asks_for_resync(self):
+        sample, resync = expand_sample(Node(id=uuid.uuid4()), {
+            'timestamp': '2026-01-01T00:00:30Z',
+            'delta': True,
+            'unchanged': ['security'],
+            'cpu': {'overall_percent': 5.0},
+        })
+
+        self.assertTrue(resync)
+        self.assertNotIn('security', sample)
+        self.assertEqual(sample['cpu'], {'overall_percent': 5.0})
+
+    def test_complete_samples_pass_through(self):
+        sample = {'timestamp': '2026-01-01T00:00:30Z', 'cpu': {'overall_percent': 5.0}}
+        self.assertEqual(expand_sample(Node(id=uuid.uuid4()), sample), (sample, False))
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AnomalyDetectorTests(TestCase):
+    START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        self.node_id = uuid.uuid4()
+        self.sent = 0
+
+    def feed(self, *values):
+        """Detect over CPU samples sent 10 seconds apart, after the earlier ones"""
+        metrics = []
+        for value in values:
+            timestamp = self.START + timedelta(seconds=10 * self.sent)
+            metrics.append((timestamp, 'cpu', {'overall_percent': value}))
+            self.sent += 1
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return detect([(self.node_id, metrics)])
+
+    def warm_up(self):
+        self.feed(*[18.0, 22.0] * 30)
+
+    def test_short_spike_does_not_open(self):
+        self.warm_up()
+        events, _ = self.feed(60.0, 60.0, 20.0, 20.0)
+
+        self.assertEqual(events, [])
+
+    def test_sustained_deviation_opens_and_closes(self):
+        self.warm_up()
+        events, _ = self.feed(60.0, 60.0, 60.0)
+
+        event, = events
+        self.assertEqual(event.severity, 'warning')
+        self.assertEqual(event.data['series'], 'cpu_percent')
+        self.assertAlmostEqual(event.data['baseline'], 20.0, delta=2.0)
+
+        _, resolutions = self.feed(20.0, 20.0, 20.0, 20.0)
+        self.assertEqual(resolutions, [])
+
+        _, resolutions = self.feed(20.0)
+        self.assertEqual(resolutions, [
+            (str(self.node_id), 'cpu_percent', '', self.START + timedelta(seconds=10 * 67))
+        ])
+
+    def test_limit_opens_before_warm_up(self):
+        events, _ = self.feed(95.0, 96.0, 97.0)
+
+        event, = events
+        self.assertEqual(event.severity, 'critical')
+
+    def test_replayed_samples_are_skipped(self):
+        self.feed(95.0, 96.0)
+        self.sent = 0
+
+        events, resolutions = self.feed(95.0, 96.0)
+        self.assertEqual((events, resolutions), ([], []))
+
+        events, _ = self.feed(97.0)
+        self.assertEqual(len(events), 1)
+
+class DownsampleTests(SimpleTestCase):
+    def test_lttb_keeps_ends_and_spikes(self):
+        t = np.arange(1000)
+        v = np.zeros(1000)
+        v[500] = 100.0
+
+        selected = lttb(t, v, 50)
+
+        self.assertEqual(len(selected), 50)
+        self.assertEqual((selected[0], selected[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(selected) > 0))
+        self.assertIn(500, selected)
+
+    def test_lttb_returns_short_series_whole(self):
+        self.assertEqual(lttb([0, 1, 2], [5, 6, 7], 10).tolist(), [0, 1, 2])
+        self.assertEqual(lttb(range(10), range(10), 2).tolist(), [0, 9])
+
+    def test_minmax_keeps_extremes_of_every_bucket(self):
+        t = np.arange(101)
+        v = np.where(t % 2, t, -t)
+
+        starts, low, high = minmax(t, v, 10)
+
+        self.assertEqual(starts.tolist(), list(range(0, 100, 10)))
+        self.assertEqual(low.tolist(), [-(b + 8) for b in range(0, 90, 10)] + [-100])
+        self.assertEqual(high.tolist(), [b + 9 for b in range(0, 100, 10)])
+
+    def test_minmax_drops_empty_buckets(self):
+        starts, low, high = minmax([0, 1, 100], [3, 1, 7], 10)
+
+        self.assertEqual(starts.tolist(), [0, 90])
+        self.assertEqual((low.tolist(), high.tolist()), ([1, 7], [3, 7]))
+
+@mock.patch('apps.telemetry.rollups.rollup_rows', return_value=[])
+@mock.patch('apps.telemetry.rollups.raw_rows', return_value=[])
+class FetchSeriesTests(SimpleTestCase):
+    def setUp(self):
+        self.end = timezone.now()
+
+    def test_short_range_reads_stored_values(self, raw_rows, rollup_rows):
+        resolution, _, _ = fetch_series([uuid.uuid4()], 'cpu_percent', self.end - timedelta(minutes=30), self.end, 2000)
+
+        self.assertEqual(resolution, 'raw')
+        rollup_rows.assert_not_called()
+
+    def test_range_above_budget_reads_rollups(self, raw_rows, rollup_rows):
+        resolution, width, _ = fetch_series([uuid.uuid4()], 'cpu_percent', self.end - timedelta(hours=3), self.end, 2000)
+
+        self.assertEqual((resolution, width), ('1m', timedelta(minutes=1)))
+        raw_rows.assert_not_called()
+
+class DrainTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = mock.MagicMock()
+        self.redis.xpending_range.return_value = [{'times_delivered': 1}]
+        patcher = mock.patch('apps.telemetry.pipeline.get_stream', return_value=(self.redis, 'ingest'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def drain(self, batch):
+        """Drain one batch of (id, entry) once, writes failing for entries marked bad"""
+        def write_batch(entries):
+            if any(entry.get('bad') for entry in entries):
+                raise ValueError('bad entry')
+            return len(entries)
+
+        raw = [(entry_id, json.dumps(entry).encode()) for entry_id, entry in batch]
+        with mock.patch('apps.telemetry.pipeline.read_batch', side_effect=[raw, []]), \
+                mock.patch('apps.telemetry.pipeline.write_batch', side_effect=write_batch) as written:
+            drain(block_ms=None)
+        return written
+
+    def test_bad_entry_does_not_hold_back_the_batch(self):
+        written = self.drain([('1-0', {'node': 'a'}), ('2-0', {'bad': True}), ('3-0', {'node': 'b'})])
+
+        self.assertEqual(written.call_count, 4)
+        self.redis.xack.assert_called_once_with('ingest', 'writers', '1-0', '3-0')
+        self.redis.xadd.assert_not_called()
+
+    def test_entry_is_dead_lettered_after_max_deliveries(self):
+        self.redis.xpending_range.return_value = [{'times_delivered': 5}]
+
+        self.drain([('1-0', {'node': 'a'}), ('2-0', {'bad': True})])
+
+        self.redis.xack.assert_called_once_with('ingest', 'writers', '1-0', '2-0')
+        (stream, fields), _ = self.redis.xadd.call_args
+        self.assertEqual((stream, fields['id'], fields['error']), ('telemetry:ingest:dead', '2-0', 'bad entry'))
+
+    def test_outage_leaves_batch_pending(self):
+        with self.assertRaises(RedisError):
+            with mock.patch('apps.telemetry.pipeline.read_batch', return_value=[('1-0', b'{}')]), \
+                    mock.patch('apps.telemetry.pipeline.write_batch', side_effect=RedisError):
+                drain(block_ms=None)
+
+        self.redis.xack.assert_not_called()
+
+@mock.patch('apps.telemetry.locks.cache')
+class LockNodeStatesTests(SimpleTestCase):
+    def test_locks_are_taken_in_order_and_released(self, cache):
+        with lock_node_states(['b', 'a', 'b']):
+            cache.lock.return_value.release.assert_not_called()
+
+        keys = [call.args[0] for call in cache.lock.call_args_list]
+        self.assertEqual(keys, [
+            'alerts:state:a:lock', 'alerts:state:b:lock',
+            'telemetry:anomaly:a:lock', 'telemetry:anomaly:b:lock',
+        ])
+        self.assertEqual(cache.lock.return_value.release.call_count, 4)
+
+    def test_busy_lock_fails_the_write(self, cache):
+        cache.lock.return_value.acquire.side_effect = [True, False]
+
+        with self.assertRaises(LockError):
+            with lock_node_states(['a', 'b']):
+                self.fail('Entered without every lock')
+
+        cache.lock.return_value.release.assert_called_once()
+
+class IngestBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.node = create_node()
+
+    def post(self):
+        request = APIRequestFactory().post(
+            '/api/telemetry/ingest_batch/',
+            {'samples': [{'timestamp': timezone.now().isoformat(), 'cpu': {'overall_percent': 12.0}}]},
+            format='json', HTTP_X_NODE_API_KEY=self.node.api_key
+        )
+        return MetricIngestionViewSet.as_view({'post': 'ingest_batch'})(request)
+
+    def test_outage_is_retried_not_rejected(self):
+        for error in (ConnectionInterrupted(connection=None), RedisError('down'), OperationalError('down')):
+            with self.subTest(error=type(error).__name__):
+                with mock.patch('apps.telemetry.ingestion.expand_sample', side_effect=error):
+                    response = self.post()
+
+                self.assertEqual(response.status_code, 503)
+                self.assertIn('Retry-After', response.headers)
+
+    def test_malformed_upload_is_rejected(self):
+        with mock.patch('apps.telemetry.ingestion.expand_sample', side_effect=ValueError('bad sample')):
+            response = self.post()
+
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,11 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import MetricIngestionViewSet, SeriesViewSet
+
+router = DefaultRouter()
+router.register('series', SeriesViewSet, basename='series')
+router.register('', MetricIngestionViewSet, basename='ingest')
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
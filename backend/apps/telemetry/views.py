@@ -2,153 +2,122 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.utils import timezone
 from django.db.models import Avg, Max, Min, Count
-from cryptography.fernet import Fernet
-import base64
-import hashlib
-from apps.nodes.models import Node, NodeMetric, NodeEvent
 from apps.nodes.authentication import NodeAPIAuthentication
-from .serializers import NodeMetricBatchSerializer
+from apps.nodes.models import Node
 from django.conf import settings
-import json
+from itertools import groupby
+import numpy as np
+from .ingestion import decrypt_payload, ingest_samples
+from .pipeline import QueueFull, TRANSIENT_ERRORS, is_queued, check_backlog
+from .serializers import SeriesQuerySerializer
+from .rollups import fetch_series
+from .downsample import lttb, minmax
 
 class MetricIngestionViewSet(viewsets.GenericViewSet):
     permission_classes = []
     authentication_classes = [NodeAPIAuthentication]
     
-    def get_encryption_key(self):
-        """Derive Fernet key from fixed password"""
-        key = hashlib.sha256(settings.NODE_ENCRYPTION_KEY.encode()).digest()
-        return base64.urlsafe_b64encode(key)
-    
-    def decrypt_payload(self, encrypted_data):
-        """Decrypt node agent data"""
-        fernet = Fernet(self.get_encryption_key())
-        decrypted = fernet.decrypt(encrypted_data.encode())
-        return json.loads(decrypted)
-    
     @action(detail=False, methods=['post'])
     def ingest_batch(self, request):
         """Ingest batch of metrics from node agent"""
+        retry_after = {'Retry-After': str(settings.TELEMETRY_QUEUE_RETRY_AFTER)}
         try:
+            # Shed load before decrypting when the writers are behind
+            if is_queued():
+                check_backlog()
+            
             # Decrypt if encrypted
             if request.headers.get('X-Encrypted') == 'true':
-                data = self.decrypt_payload(request.data.get('data'))
+                data = decrypt_payload(
+                    request.data.get('data'),
+                    compression=request.headers.get('X-Compression')
+                )
             else:
                 data = request.data
             
-            serializer = NodeMetricBatchSerializer(data=data)
-            if not serializer.is_valid():
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-            
-            validated_data = serializer.validated_data
             node = request.auth  # Set by NodeAPIAuthentication
+            result = ingest_samples(node, data)
             
-            # Update node heartbeat
-            node.last_heartbeat = timezone.now()
-            node.save(update_fields=['last_heartbeat'])
-            
-            # Process different metric types
-            if 'cpu' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='cpu',
-                    data=validated_data['cpu']
-                )
-            
-            if 'memory' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='memory',
-                    data=validated_data['memory']
-                )
-            
-            if 'disk' in validated_data:
-                for disk_data in validated_data['disk']:
-                    NodeMetric.objects.create(
-                        node=node,
-                        metric_type='disk',
-                        data=disk_data
-                    )
-            
-            if 'network' in validated_data:
-                for net_data in validated_data['network']:
-                    NodeMetric.objects.create(
-                        node=node,
-                        metric_type='network',
-                        data=net_data
-                    )
-            
-            if 'processes' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='process',
-                    data={'processes': validated_data['processes']}
-                )
-            
-            if 'security' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='security',
-                    data=validated_data['security']
-                )
-            
-            if 'kernel' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='kernel',
-                    data=validated_data['kernel']
-                )
-            
-            if 'containers' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='container',
-                    data={'containers': validated_data['containers']}
-                )
-            
-            if 'services' in validated_data:
-                NodeMetric.objects.create(
-                    node=node,
-                    metric_type='service',
-                    data={'services': validated_data['services']}
-                )
-            
-            # Check for anomalies and create events if needed
-            self.check_for_anomalies(node, validated_data)
+            errors = result['errors']
+            if not result['received']:
+                return Response(errors[0] if len(errors) == 1 else errors, status=status.HTTP_400_BAD_REQUEST)
             
-            return Response({'status': 'success', 'received': len(validated_data)})
+            return Response({
+                'status': 'queued' if result['queued'] else 'success',
+                'received': result['received'],
+                'rejected': result['rejected'],
+                'resync': result['resync']
+            }, status=status.HTTP_202_ACCEPTED if result['queued'] else status.HTTP_200_OK)
             
+        except QueueFull:
+            return Response({'error': 'Ingest queue is full'},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS, headers=retry_after)
+        except TRANSIENT_ERRORS:
+            # Redis or the database is down, not the upload at fault: the
+            # agent keeps it and retries instead of setting it aside
+            return Response({'error': 'Ingest unavailable'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers=retry_after)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class SeriesViewSet(viewsets.ViewSet):
+    """Downsampled time series of one metric for one or more nodes
     
-    def check_for_anomalies(self, node, data):
-        """Check for anomalies in the data and create events"""
-        events = []
+    The response is columnar, with timestamps in epoch milliseconds, and
+    holds at most max_points points per node and label whatever the range.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    OVERSAMPLE = 4  # rows fetched per returned point, for LTTB to choose from
+    
+    def list(self, request):
+        query = SeriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        
+        node_ids = list(Node.objects.filter(
+            pk__in=params['nodes'], organization__members=request.user
+        ).values_list('pk', flat=True).distinct())
+        
+        max_points = params['max_points']
+        if params['method'] == 'lttb':
+            budget = max_points * self.OVERSAMPLE
+        else:
+            budget = max_points // 2  # every bucket yields a min and a max
         
-        # CPU anomalies
-        if 'cpu' in data:
-            cpu = data['cpu']
-            if cpu.get('overall_percent', 0) > 90:
-                events.append({
-                    'severity': 'warning',
-                    'title': 'High CPU Usage',
-                    'message': f"CPU usage is at {cpu['overall_percent']}%",
-                    'data': {'cpu': cpu}
-                })
+        resolution, width, rows = fetch_series(
+            node_ids, params['series'], params['start'], params['end'], budget, params.get('label')
+        )
         
-        # Memory anomalies
-        if 'memory' in data:
-            memory = data['memory']
-            if memory.get('percent_used', 0) > 90:
-                events.append({
-                    'severity': 'warning',
-                    'title': 'High Memory Usage',
-                    'message': f"Memory usage is at {memory['percent_used']}%",
-                    'data': {'memory': memory}
-                })
+        nodes = {str(node_id): [] for node_id in node_ids}
+        for (node_id, label), group in groupby(rows, key=lambda row: (row[0], row[2])):
+            group = list(group)
+            t = np.array([row[1].timestamp() * 1000 for row in group])
+            
+            if params['method'] == 'lttb':
+                v = np.array([row[3] for row in group])
+                keep = lttb(t, v, max_points)
+                points = {'t': t[keep].astype(np.int64).tolist(), 'v': v[keep].tolist()}
+            elif width is None:
+                bucket_t, low, high = minmax(t, np.array([row[3] for row in group]), budget)
+                points = {'t': bucket_t.astype(np.int64).tolist(), 'min': low.tolist(), 'max': high.tolist()}
+            else:
+                # Rollup buckets already carry their extremes
+                points = {
+                    't': t.astype(np.int64).tolist(),
+                    'min': [row[4] for row in group],
+                    'max': [row[5] for row in group]
+                }
+            
+            nodes[str(node_id)].append({'label': label, **points})
         
-        # Create events
-        for event_data in events:
-            NodeEvent.objects.create(node=node, **event_data)
\ No newline at end of file
+        return Response({
+            'series': params['series'],
+            'start': params['start'],
+            'end': params['end'],
+            'method': params['method'],
+            'resolution': resolution,
+            'bucket_seconds': int(width.total_seconds()) if width else None,
+            'nodes': nodes
+        })
@@ -80,6 +80,68 @@ CHANNEL_LAYERS = {
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/3')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/3')
 
+# Telemetry ingestion: 'sync' writes uploads in the request, 'queued' pushes
+# them to a Redis stream drained by the writers (run_ingest_writer or the
+# drain_ingest_queue task)
+TELEMETRY_INGEST_MODE = os.environ.get('TELEMETRY_INGEST_MODE', 'sync')
+TELEMETRY_QUEUE_STREAM = 'telemetry:ingest'
+TELEMETRY_QUEUE_MAX_LENGTH = int(os.environ.get('TELEMETRY_QUEUE_MAX_LENGTH', 50000))  # uploads, then 429
+TELEMETRY_QUEUE_BATCH_SIZE = 500          # uploads per writer transaction
+TELEMETRY_QUEUE_CLAIM_IDLE_MS = 60000     # reclaim entries of writers silent this long
+TELEMETRY_QUEUE_RETRY_AFTER = 30          # seconds, sent with 429/503
+TELEMETRY_QUEUE_MAX_DELIVERIES = 5        # attempts at an entry that fails on its own
+TELEMETRY_QUEUE_DEAD_LETTER_STREAM = 'telemetry:ingest:dead'
+
+# Per-node locks around detector and alert state updates (seconds): held
+# at most timeout, waited for at most wait before the write fails
+TELEMETRY_STATE_LOCK = {'timeout': 60, 'wait': 30}
+
+# Hypertable chunking, compression and retention (PostgreSQL intervals);
+# re-apply changes (also to TELEMETRY_ROLLUPS) with: manage.py apply_telemetry_policies
+TELEMETRY_HYPERTABLES = {
+    'nodemetric': {'chunk_interval': '1 day', 'compress_after': '2 days', 'retention': '90 days'},
+    'nodeevent': {'chunk_interval': '7 days', 'compress_after': '14 days', 'retention': '365 days'},
+    'nodeprocess': {'chunk_interval': '1 day', 'compress_after': '1 day', 'retention': '14 days'},
+    'nodemetricvalue': {'chunk_interval': '1 day', 'compress_after': '2 days', 'retention': '90 days'},
+}
+
+# Retention of the 1m/1h/1d rollups (continuous aggregates), None keeps forever
+TELEMETRY_ROLLUPS = {
+    '1m': timedelta(days=30),
+    '1h': timedelta(days=365),
+    '1d': None,
+}
+TELEMETRY_RAW_INTERVAL = timedelta(seconds=5)  # shortest agent sample interval, bounds raw series reads
+
+# Streaming anomaly detection per node and series: EWMA level and variance
+# with hour-of-day seasonality; an event opens after open_after samples
+# beyond open_z (or a fixed limit) and closes after close_after samples
+# back within close_z (and limit_margin below the limit)
+TELEMETRY_ANOMALY = {
+    'alpha': 0.05,
+    'seasonal_alpha': 0.01,
+    'relative_std': 0.05,
+    'warmup': 60,               # samples before statistical deviations count
+    'open_z': 4.0,
+    'close_z': 2.0,
+    'open_after': 3,
+    'close_after': 5,
+    'limit_margin': 5.0,
+    'limits': {
+        'cpu_percent': 90,
+        'memory_percent': 90,
+        'disk_percent': 95,
+    },
+}
+
+if TELEMETRY_INGEST_MODE == 'queued':
+    CELERY_BEAT_SCHEDULE = {
+        'drain-ingest-queue': {
+            'task': 'apps.telemetry.tasks.drain_ingest_queue',
+            'schedule': 5.0,
+        },
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
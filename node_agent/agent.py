@@ -10,12 +10,17 @@ import json
 import time
 import socket
 import hashlib
+import heapq
 import base64
 import logging
 import argparse
 import platform
 import subprocess
-from datetime import datetime
+import threading
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
 from pathlib import Path
 
 import requests
@@ -23,6 +28,10 @@ import psutil
 from cryptography.fernet import Fernet
 import netifaces
 
+from spool import Spool, ReplayLimiter
+from stats import AgentStats
+from transport import WebSocketTransport
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,6 +43,7 @@ class Config:
     """Configuration management"""
     
     CONFIG_FILE = '/etc/satori-agent/config.json'
+    STATE_DIR = '/var/lib/satori-agent'
     
     @classmethod
     def load(cls):
@@ -51,6 +61,9 @@ class Config:
             'server_url': input('Enter server URL (e.g., http://localhost:8000): '),
             'transmission_interval': int(input('Enter transmission interval (seconds): ')),
             'api_key': input('Enter node API key: '),
+            'compression': 'zlib',
+            'transport': 'http',
+            'keyframe_interval': 600,
             'node_name': socket.gethostname(),
             'encryption_key': 'bluematrix',  # Fixed password
             'collect_metrics': {
@@ -62,7 +75,42 @@ class Config:
                 'security': True,
                 'kernel': True,
                 'containers': True,
-                'services': True
+                'services': True,
+                'aggregates': True,
+                'agent': True
+            },
+            'process_top_n': 20,
+            'collector_intervals': {
+                'cpu': 5,
+                'memory': 5,
+                'disk': 30,
+                'network': 30,
+                'processes': 30,
+                'security': 60,
+                'kernel': 300,
+                'containers': 30,
+                'services': 300,
+                'agent': 60
+            },
+            'window_sample_rate': 1.0,
+            'collector_workers': 4,
+            'stats_port': 9465,
+            'resource_budget': {
+                'cpu_percent': 5,
+                'rss_mb': 200,
+                'host_cpu_percent': 90,
+                'host_memory_percent': 90
+            },
+            'collector_timeouts': {
+                'cpu': 2,
+                'memory': 2,
+                'disk': 5,
+                'network': 5,
+                'processes': 5,
+                'security': 5,
+                'kernel': 5,
+                'containers': 10,
+                'services': 10
             }
         }
         
@@ -85,44 +133,714 @@ class Config:
         return config
 
 class Encryptor:
-    """Data encryption using fixed password"""
+    """Data encryption using fixed password, with optional compression"""
     
-    def __init__(self, password):
+    def __init__(self, password, compression=None, stats=None):
         self.password = password
+        self.stats = stats
         self.key = self._derive_key()
         self.fernet = Fernet(self.key)
+        self.compression = compression
+        self._zstd = None
+        
+        if compression == 'zstd':
+            try:
+                import zstandard
+                self._zstd = zstandard.ZstdCompressor(level=3)
+            except ImportError:
+                logger.warning("zstandard is not installed, falling back to zlib")
+                self.compression = 'zlib'
     
     def _derive_key(self):
         """Derive Fernet key from password"""
         key = hashlib.sha256(self.password.encode()).digest()
         return base64.urlsafe_b64encode(key)
     
+    def _compress(self, raw):
+        """Compress serialised data before encryption"""
+        if self.compression == 'zstd':
+            return self._zstd.compress(raw)
+        if self.compression == 'zlib':
+            return zlib.compress(raw, 6)
+        return raw
+    
     def encrypt(self, data):
         """Encrypt data"""
-        json_str = json.dumps(data)
-        return self.fernet.encrypt(json_str.encode()).decode()
+        if self.stats is None:
+            json_str = json.dumps(data, separators=(',', ':'))
+            return self.fernet.encrypt(self._compress(json_str.encode())).decode()
+        
+        with self.stats.timer('serialize'):
+            raw = json.dumps(data, separators=(',', ':')).encode()
+        with self.stats.timer('compress'):
+            compressed = self._compress(raw)
+        with self.stats.timer('encrypt'):
+            encrypted = self.fernet.encrypt(compressed).decode()
+        
+        self.stats.gauge('payload_bytes_raw', len(raw))
+        self.stats.gauge('payload_bytes_compressed', len(compressed))
+        self.stats.gauge('payload_bytes_encrypted', len(encrypted))
+        return encrypted
     
     def decrypt(self, encrypted_data):
         """Decrypt data"""
         decrypted = self.fernet.decrypt(encrypted_data.encode())
+        if self.compression == 'zstd':
+            import zstandard
+            decrypted = zstandard.ZstdDecompressor().decompress(decrypted)
+        elif self.compression == 'zlib':
+            decrypted = zlib.decompress(decrypted)
         return json.loads(decrypted)
 
+class CpuSampler:
+    """Stateful CPU sampler computing utilisation from cpu_times deltas"""
+    
+    def __init__(self):
+        self._last_time = time.monotonic()
+        self._last_total = psutil.cpu_times()
+        self._last_per_core = psutil.cpu_times(percpu=True)
+    
+    @staticmethod
+    def _busy_and_total(times):
+        """Split a cpu_times snapshot into busy and total time"""
+        total = sum(times)
+        # guest time is already accounted for in user/nice on Linux
+        total -= getattr(times, 'guest', 0) + getattr(times, 'guest_nice', 0)
+        idle = times.idle + getattr(times, 'iowait', 0)
+        return total - idle, total
+    
+    @classmethod
+    def _percent(cls, previous, current):
+        """Utilisation percentage between two cpu_times snapshots"""
+        busy_prev, total_prev = cls._busy_and_total(previous)
+        busy_cur, total_cur = cls._busy_and_total(current)
+        
+        total_delta = total_cur - total_prev
+        if total_delta <= 0:
+            return 0.0
+        
+        busy_delta = max(busy_cur - busy_prev, 0.0)
+        return round(min(100.0, 100.0 * busy_delta / total_delta), 1)
+    
+    def sample(self):
+        """Return utilisation since the previous sample without sleeping"""
+        now = time.monotonic()
+        total = psutil.cpu_times()
+        per_core = psutil.cpu_times(percpu=True)
+        
+        overall_percent = self._percent(self._last_total, total)
+        if len(per_core) == len(self._last_per_core):
+            per_core_percent = [
+                self._percent(prev, cur) for prev, cur in zip(self._last_per_core, per_core)
+            ]
+        else:
+            # CPU hotplug changed the core count, restart the per-core baseline
+            per_core_percent = [0.0] * len(per_core)
+        
+        sample = {
+            'overall_percent': overall_percent,
+            'per_core': per_core_percent,
+            'user_time': total.user,
+            'system_time': total.system,
+            'idle_time': total.idle,
+            'sample_interval': round(now - self._last_time, 3)
+        }
+        
+        self._last_time = now
+        self._last_total = total
+        self._last_per_core = per_core
+        
+        return sample
+
+class RingBuffer:
+    """Fixed-size, array-backed ring buffer of floats"""
+    
+    def __init__(self, size):
+        self.values = array('d', bytes(8 * size))
+        self.size = size
+        self.pos = 0
+        self.unread = 0
+    
+    def append(self, value):
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.unread = min(self.unread + 1, self.size)
+    
+    def drain(self):
+        """Values appended since the previous drain, oldest first"""
+        start = (self.pos - self.unread) % self.size
+        if start + self.unread <= self.size:
+            values = self.values[start:start + self.unread]
+        else:
+            values = self.values[start:] + self.values[:self.pos]
+        self.unread = 0
+        return values
+
+class WindowSampler(threading.Thread):
+    """Samples hot series at a high rate and summarises them per window
+    
+    CPU and memory utilisation and host-wide disk and NIC byte rates are
+    sampled every 1/rate seconds into ring buffers; summarize() reports
+    min/max/mean/p95 of everything sampled since the previous call.
+    """
+    
+    SERIES = (
+        'cpu_percent', 'memory_percent',
+        'disk_read_bps', 'disk_write_bps', 'net_rx_bps', 'net_tx_bps'
+    )
+    
+    def __init__(self, rate=1.0, capacity=3600):
+        super().__init__(name='window-sampler', daemon=True)
+        self.period = 1.0 / rate
+        self.lock = threading.Lock()
+        self.buffers = {name: RingBuffer(capacity) for name in self.SERIES}
+        self.stopped = threading.Event()
+        self.cpu_sampler = CpuSampler()
+        self._last = None  # (monotonic, disk counters, net counters)
+    
+    def _rates(self):
+        """Disk and NIC byte rates since the previous tick"""
+        now = time.monotonic()
+        disk = psutil.disk_io_counters()
+        net = psutil.net_io_counters()
+        previous, self._last = self._last, (now, disk, net)
+        
+        if previous is None or disk is None or net is None:
+            return None
+        
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return None
+        
+        def rate(current, last):
+            return max(current - last, 0) / elapsed
+        
+        return {
+            'disk_read_bps': rate(disk.read_bytes, previous[1].read_bytes),
+            'disk_write_bps': rate(disk.write_bytes, previous[1].write_bytes),
+            'net_rx_bps': rate(net.bytes_recv, previous[2].bytes_recv),
+            'net_tx_bps': rate(net.bytes_sent, previous[2].bytes_sent)
+        }
+    
+    def tick(self):
+        """Take one sample of every series"""
+        values = {
+            'cpu_percent': self.cpu_sampler.sample()['overall_percent'],
+            'memory_percent': psutil.virtual_memory().percent
+        }
+        rates = self._rates()
+        if rates:
+            values.update(rates)
+        
+        with self.lock:
+            for name, value in values.items():
+                self.buffers[name].append(value)
+    
+    def run(self):
+        next_tick = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.warning(f"Window sampler error: {e}")
+            
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Fell behind, don't burst to catch up
+                next_tick = time.monotonic()
+                delay = 0
+            self.stopped.wait(delay)
+    
+    def stop(self):
+        self.stopped.set()
+    
+    def summarize(self):
+        """Summaries of the samples taken since the previous call"""
+        with self.lock:
+            drained = {name: buffer.drain() for name, buffer in self.buffers.items()}
+        
+        summaries = {}
+        for name, values in drained.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            summaries[name] = {
+                'count': len(ordered),
+                'min': round(ordered[0], 2),
+                'max': round(ordered[-1], 2),
+                'mean': round(sum(ordered) / len(ordered), 2),
+                'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                'last': round(values[-1], 2)
+            }
+        
+        return {'sample_period': self.period, 'series': summaries}
+
+class LogTailer:
+    """Incremental log reader with cursors that survive restarts and rotation"""
+    
+    MAX_READ_BYTES = 16 * 1024 * 1024  # per file per cycle
+    
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.lock = threading.Lock()
+        state = self._load()
+        self.cursors = state.get('cursors', {})
+        self.totals = state.get('totals', {})
+    
+    def _load(self):
+        """Load cursors and cumulative counters from disk"""
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save(self):
+        """Atomically persist cursors and cumulative counters"""
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            tmp_file = f'{self.state_file}.tmp'
+            with open(tmp_file, 'w') as f:
+                json.dump({'cursors': self.cursors, 'totals': self.totals}, f)
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save log cursors: {e}")
+    
+    def _read_from(self, f, offset, size):
+        """Read complete lines from offset, returning (lines, new offset)"""
+        if size <= offset:
+            return [], offset
+        
+        f.seek(offset)
+        chunk = f.read(min(size - offset, self.MAX_READ_BYTES))
+        
+        # Leave a trailing partial line for the next cycle, unless a single
+        # line is longer than the whole read window
+        end = chunk.rfind(b'\n') + 1
+        if end == 0 and len(chunk) == self.MAX_READ_BYTES:
+            end = len(chunk)
+        
+        return chunk[:end].decode('utf-8', errors='replace').splitlines(), offset + end
+    
+    def read_new_lines(self, path):
+        """Return the lines appended to path since the previous call"""
+        lines = []
+        
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return lines
+        
+        with f, self.lock:
+            stat = os.fstat(f.fileno())
+            cursor = self.cursors.get(path)
+            
+            if cursor is None:
+                # First sight of this file: start at the end instead of
+                # replaying its whole history
+                offset = stat.st_size
+            elif cursor['inode'] != stat.st_ino:
+                # Rotated: finish the previous file if it is still around
+                lines.extend(self._drain_rotated(path, cursor))
+                offset = 0
+            elif stat.st_size < cursor['offset']:
+                # Truncated in place (copytruncate)
+                offset = 0
+            else:
+                offset = cursor['offset']
+            
+            new_lines, offset = self._read_from(f, offset, stat.st_size)
+            lines.extend(new_lines)
+            
+            self.cursors[path] = {'inode': stat.st_ino, 'offset': offset}
+            self._save()
+        
+        return lines
+    
+    def _drain_rotated(self, path, cursor):
+        """Read what is left of a rotated log after our cursor"""
+        rotated = f'{path}.1'
+        try:
+            with open(rotated, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != cursor['inode']:
+                    return []
+                return self._read_from(f, cursor['offset'], stat.st_size)[0]
+        except OSError:
+            return []
+    
+    def accumulate(self, group, counts):
+        """Add per-interval counts to the cumulative totals of a group"""
+        with self.lock:
+            totals = self.totals.setdefault(group, {})
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+            self._save()
+            return dict(totals)
+
+class SocketTable:
+    """Socket counts read straight from /proc/net
+    
+    psutil.net_connections() maps every socket to its process by walking
+    the fd table of every pid, which dominates the network collector on
+    hosts with many sockets. States and listeners only need the kernel's
+    socket tables; owners are resolved for new listening sockets only.
+    """
+    
+    TCP_STATES = {
+        '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV',
+        '04': 'FIN_WAIT1', '05': 'FIN_WAIT2', '06': 'TIME_WAIT',
+        '07': 'CLOSE', '08': 'CLOSE_WAIT', '09': 'LAST_ACK',
+        '0A': 'LISTEN', '0B': 'CLOSING', '0C': 'NEW_SYN_RECV'
+    }
+    
+    def __init__(self, proc_net=None):
+        self.proc_net = proc_net or os.path.join(psutil.PROCFS_PATH, 'net')
+        self._owners = {}  # listening socket inode -> pid (None if unknown)
+    
+    def _read(self, name):
+        """Rows of a /proc/net socket table, without the header"""
+        try:
+            with open(os.path.join(self.proc_net, name), 'rb') as f:
+                return f.read().splitlines()[1:]
+        except OSError:
+            return []
+    
+    def _resolve_owners(self, inodes):
+        """Map socket inodes to pids with a single scan of /proc/*/fd"""
+        targets = {f'socket:[{inode}]': inode for inode in inodes}
+        owners = dict.fromkeys(inodes)
+        
+        for pid in psutil.pids():
+            fd_dir = f'{psutil.PROCFS_PATH}/{pid}/fd'
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    inode = targets.get(os.readlink(f'{fd_dir}/{fd}'))
+                except OSError:
+                    continue
+                if inode is not None and owners[inode] is None:
+                    owners[inode] = pid
+                    if all(owner is not None for owner in owners.values()):
+                        return owners
+        
+        return owners
+    
+    def collect(self):
+        """TCP state counts, UDP socket count and listening ports"""
+        tcp_states = {}
+        listeners = []
+        
+        for table in ('tcp', 'tcp6'):
+            for row in self._read(table):
+                fields = row.split()
+                if len(fields) < 10:
+                    continue
+                state = self.TCP_STATES.get(fields[3].decode(), 'NONE')
+                tcp_states[state] = tcp_states.get(state, 0) + 1
+                if state == 'LISTEN':
+                    port = int(fields[1].rsplit(b':', 1)[1], 16)
+                    listeners.append((port, int(fields[9])))
+        
+        udp_count = len(self._read('udp')) + len(self._read('udp6'))
+        
+        # Only sockets that appeared since the last cycle need an fd scan
+        inodes = {inode for _, inode in listeners}
+        unknown = inodes - self._owners.keys()
+        if unknown:
+            self._owners.update(self._resolve_owners(unknown))
+        self._owners = {inode: pid for inode, pid in self._owners.items() if inode in inodes}
+        
+        return {
+            'tcp_connections': tcp_states,
+            'udp_count': udp_count,
+            'listening_ports': [
+                {'port': port, 'pid': self._owners.get(inode)} for port, inode in listeners
+            ]
+        }
+
+class CollectorScheduler:
+    """Runs collectors concurrently with a deadline per collector"""
+    
+    DEFAULT_TIMEOUT = 10
+    
+    def __init__(self, max_workers=4, timeouts=None, stats=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='collector')
+        self.timeouts = timeouts or {}
+        self.stats = stats
+        self._overdue = {}  # name -> future still running after its deadline
+        self._started_at = {}  # name -> monotonic time its current run started
+        self._last_good = {}  # name -> (monotonic timestamp, result)
+    
+    def _timeout(self, name):
+        return self.timeouts.get(name, self.DEFAULT_TIMEOUT)
+    
+    def _submit(self, name, func):
+        """Submit a collector, or return None while its previous run is still in flight"""
+        overdue = self._overdue.get(name)
+        if overdue is not None:
+            if not overdue.done():
+                # Never stack threads behind a hung collector
+                return None
+            del self._overdue[name]
+            self._record(name, overdue)
+        started = threading.Event()
+        future = self.executor.submit(self._execute, name, func, started)
+        future.started = started
+        return future
+    
+    def _execute(self, name, func, started):
+        self._started_at[name] = time.monotonic()
+        started.set()
+        if self.stats is None:
+            return func()
+        with self.stats.timer(f'collector.{name}'):
+            return func()
+    
+    def _wait(self, name, future, submitted):
+        """Wait for a collector run, returning False once it missed its deadline
+        
+        The deadline counts from when the collector started executing, so
+        time spent queued behind other collectors does not count against it;
+        a run still queued when its deadline passed since submission misses
+        it as well, which bounds the cycle when every worker is busy.
+        """
+        timeout = self._timeout(name)
+        if not future.started.wait(max(submitted + timeout - time.monotonic(), 0)):
+            return False
+        
+        try:
+            future.result(timeout=max(self._started_at[name] + timeout - time.monotonic(), 0))
+        except FutureTimeoutError:
+            return False
+        except Exception:
+            pass
+        return True
+    
+    def _record(self, name, future):
+        """Remember the result of a finished collector run"""
+        try:
+            result = future.result(timeout=0)
+        except Exception as e:
+            logger.warning(f"Collector {name} failed: {e}")
+            return False
+        self._last_good[name] = (time.monotonic(), result)
+        return True
+    
+    def run(self, collectors):
+        """Run collectors, returning (results, stale) once all finish or time out
+        
+        Collectors that miss their deadline or fail are reported with their last
+        good value and listed in ``stale`` with its age in seconds (None when no
+        value has ever been collected). A collector whose previous run is still
+        overdue is reported stale right away instead of being waited on again.
+        """
+        submitted = time.monotonic()
+        futures = {name: self._submit(name, func) for name, func in collectors.items()}
+        
+        results = {}
+        stale = {}
+        
+        # Wait in deadline order so the cycle ends when the slowest collector
+        # finishes or the longest deadline expires, whichever comes first
+        for name in sorted(futures, key=self._timeout):
+            future = futures[name]
+            if future is None:
+                logger.warning(f"Collector {name} is still running past its deadline")
+            elif not self._wait(name, future, submitted):
+                logger.warning(f"Collector {name} missed its {self._timeout(name)}s deadline")
+                self._overdue[name] = future
+            
+            if future is not None and future.done():
+                self._overdue.pop(name, None)
+            
+            if future is not None and future.done() and self._record(name, future):
+                results[name] = self._last_good[name][1]
+            elif name in self._last_good:
+                collected_at, result = self._last_good[name]
+                results[name] = result
+                stale[name] = round(time.monotonic() - collected_at, 1)
+            else:
+                stale[name] = None
+        
+        # Keep sections in the order the collectors were given
+        results = {name: results[name] for name in collectors if name in results}
+        return results, stale
+
+class CollectorQueue:
+    """Priority queue of collectors ordered by when they are next due"""
+    
+    def __init__(self, intervals):
+        self.intervals = intervals
+        self.scale = 1  # stretches every interval, see ResourceGovernor
+        now = time.monotonic()
+        self._heap = [(now, name) for name in intervals]
+        heapq.heapify(self._heap)
+    
+    def pop_due(self, now):
+        """Return the collectors due at now and schedule their next run"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, name = heapq.heappop(self._heap)
+            due.append(name)
+            
+            # Keep a fixed rate, but don't try to catch up on missed runs
+            interval = self.intervals[name] * self.scale
+            next_at = at + interval
+            if next_at <= now:
+                next_at = now + interval
+            heapq.heappush(self._heap, (next_at, name))
+        return due
+    
+    def next_due(self):
+        """Monotonic time at which the next collector is due"""
+        return self._heap[0][0] if self._heap else float('inf')
+
+class ResourceGovernor:
+    """Keeps the agent within its CPU and memory budget
+    
+    Every ``check_interval`` seconds the agent's own CPU and RSS and the
+    host's CPU and memory are compared to the budget. Each check over budget
+    raises the degradation level by one, up to MAX_LEVEL; a check comfortably
+    under budget (below RECOVERY_RATIO of every limit) lowers it by one.
+    
+    Level 1 and up stretch collection intervals by 2**level and shrink the
+    process top-N; level 2 and up also skip EXPENSIVE_COLLECTORS.
+    """
+    
+    EXPENSIVE_COLLECTORS = ('processes', 'network', 'services', 'containers')
+    MAX_LEVEL = 3
+    RECOVERY_RATIO = 0.8
+    
+    def __init__(self, budget=None, check_interval=10, stats=None):
+        budget = budget or {}
+        self.limits = {
+            'agent_cpu_percent': budget.get('cpu_percent', 5),
+            'agent_rss_mb': budget.get('rss_mb', 200),
+            'host_cpu_percent': budget.get('host_cpu_percent', 90),
+            'host_memory_percent': budget.get('host_memory_percent', 90)
+        }
+        self.check_interval = check_interval
+        self.stats = stats
+        self.level = 0
+        self.reasons = []
+        
+        self.process = psutil.Process()
+        self._last_check = (time.monotonic(), self._agent_cpu_time())
+        psutil.cpu_percent(None)
+    
+    def _agent_cpu_time(self):
+        cpu_times = self.process.cpu_times()
+        return cpu_times.user + cpu_times.system
+    
+    def _usage(self, now):
+        """Agent and host usage since the previous check"""
+        last_time, last_cpu = self._last_check
+        cpu = self._agent_cpu_time()
+        self._last_check = (now, cpu)
+        
+        return {
+            'agent_cpu_percent': (cpu - last_cpu) / max(now - last_time, 1e-6) * 100,
+            'agent_rss_mb': self.process.memory_info().rss / (1024 * 1024),
+            'host_cpu_percent': psutil.cpu_percent(None),
+            'host_memory_percent': psutil.virtual_memory().percent
+        }
+    
+    def check(self):
+        """Re-evaluate the degradation level if a check is due"""
+        now = time.monotonic()
+        if now - self._last_check[0] < self.check_interval:
+            return self.level
+        
+        try:
+            usage = self._usage(now)
+        except psutil.Error:
+            return self.level
+        
+        over = [
+            f'{name} {usage[name]:.1f} > {limit}'
+            for name, limit in self.limits.items() if usage[name] > limit
+        ]
+        level = self.level
+        if over:
+            level = min(self.level + 1, self.MAX_LEVEL)
+        elif all(usage[name] < limit * self.RECOVERY_RATIO for name, limit in self.limits.items()):
+            level = max(self.level - 1, 0)
+        
+        if level != self.level:
+            if level > self.level:
+                logger.warning(f"Entering degraded mode level {level}: {', '.join(over)}")
+            else:
+                logger.info(f"Degraded mode level lowered to {level}")
+            self.level = level
+        if over or not level:
+            self.reasons = over
+        
+        if self.stats is not None:
+            self.stats.gauge('degraded_level', self.level)
+            self.stats.gauge('degraded_reasons', self.reasons)
+        
+        return self.level
+    
+    @property
+    def scale(self):
+        """Factor applied to collection intervals"""
+        return 2 ** self.level
+    
+    def allows(self, name):
+        """Whether a collector may run at the current level"""
+        return self.level < 2 or name not in self.EXPENSIVE_COLLECTORS
+    
+    def top_n(self, base):
+        """Process top-N size at the current level"""
+        return max(5, base >> self.level)
+    
+    def status(self):
+        return {'level': self.level, 'reasons': self.reasons}
+
 class MetricCollector:
     """Collects all system metrics"""
     
-    def __init__(self, config):
+    COLLECTORS = (
+        'cpu', 'memory', 'disk', 'network', 'processes',
+        'security', 'kernel', 'containers', 'services', 'aggregates', 'agent'
+    )
+    
+    AUTH_LOGS = ('/var/log/auth.log', '/var/log/secure')
+    KERN_LOG = '/var/log/kern.log'
+    SYSLOG = '/var/log/syslog'
+    
+    def __init__(self, config, stats=None):
         self.config = config
+        self.stats = stats
+        self.cpu_sampler = CpuSampler()
+        self.window_sampler = WindowSampler(config.get('window_sample_rate', 1.0))
+        self._unit_memory_files = {}
+        self._docker = None
+        self._image_tags = {}
+        self._container_cpu = {}
+        self._processes = {}
+        self._last_net_io = None
+        self.socket_table = SocketTable()
+        self.process_top_n = config.get('process_top_n', 20)
+        self.log_tailer = LogTailer(
+            os.path.join(config.get('state_dir', Config.STATE_DIR), 'log_cursors.json')
+        )
+        self.scheduler = CollectorScheduler(
+            max_workers=config.get('collector_workers', 4),
+            timeouts=config.get('collector_timeouts', {}),
+            stats=stats
+        )
     
     def collect_cpu(self):
         """Collect CPU metrics"""
-        return {
-            'overall_percent': psutil.cpu_percent(interval=1),
-            'per_core': psutil.cpu_percent(interval=1, percpu=True),
-            'user_time': psutil.cpu_times().user,
-            'system_time': psutil.cpu_times().system,
-            'idle_time': psutil.cpu_times().idle,
-            'load_avg': psutil.getloadavg() if hasattr(psutil, 'getloadavg') else None
-        }
+        cpu = self.cpu_sampler.sample()
+        cpu['load_avg'] = psutil.getloadavg() if hasattr(psutil, 'getloadavg') else None
+        return cpu
     
     def collect_memory(self):
         """Collect memory metrics"""
@@ -182,36 +900,34 @@ class MetricCollector:
     def collect_network(self):
         """Collect network metrics"""
         networks = []
+        now = time.monotonic()
         net_io = psutil.net_io_counters(pernic=True)
-        net_connections = psutil.net_connections()
+        if_stats = psutil.net_if_stats()
+        previous, self._last_net_io = self._last_net_io, (now, net_io)
         
-        # Connection counts
-        tcp_states = {}
-        for conn in net_connections:
-            if conn.type == socket.SOCK_STREAM:
-                state = conn.status
-                tcp_states[state] = tcp_states.get(state, 0) + 1
+        elapsed = previous and now - previous[0]
+        
+        def rate(interface, field):
+            """Per-second rate of a counter since the previous cycle"""
+            last = previous and previous[1].get(interface)
+            if not last or elapsed <= 0:
+                return None
+            return round(max(getattr(net_io[interface], field) - getattr(last, field), 0) / elapsed, 1)
         
         for interface, addrs in psutil.net_if_addrs().items():
             if interface in net_io:
                 io = net_io[interface]
-                
-                # Get interface speed (if available)
-                speed = None
-                try:
-                    with open(f'/sys/class/net/{interface}/speed', 'r') as f:
-                        speed = int(f.read().strip())
-                except:
-                    pass
+                stats = if_stats.get(interface)
                 
                 networks.append({
                     'interface': interface,
-                    'speed': speed,
-                    'status': 'up' if psutil.net_if_stats()[interface].isup else 'down',
-                    'bytes_sent': io.bytes_sent,
-                    'bytes_recv': io.bytes_recv,
-                    'packets_sent': io.packets_sent,
-                    'packets_recv': io.packets_recv,
+                    # psutil reports 0 when the speed cannot be determined
+                    'speed': (stats.speed or None) if stats else None,
+                    'status': 'up' if stats and stats.isup else 'down',
+                    'rx_bps': rate(interface, 'bytes_recv'),
+                    'tx_bps': rate(interface, 'bytes_sent'),
+                    'rx_pps': rate(interface, 'packets_recv'),
+                    'tx_pps': rate(interface, 'packets_sent'),
                     'errin': io.errin,
                     'errout': io.errout,
                     'dropin': io.dropin,
@@ -219,51 +935,71 @@ class MetricCollector:
                     'ip_addresses': [addr.address for addr in addrs if addr.family == socket.AF_INET]
                 })
         
-        # Get listening ports
-        listening_ports = []
-        for conn in net_connections:
-            if conn.status == 'LISTEN' and conn.laddr:
-                listening_ports.append({
-                    'port': conn.laddr.port,
-                    'pid': conn.pid
-                })
-        
-        return {
-            'interfaces': networks,
-            'tcp_connections': tcp_states,
-            'udp_count': sum(1 for conn in net_connections if conn.type == socket.SOCK_DGRAM),
-            'listening_ports': listening_ports
-        }
+        return {'interfaces': networks, **self.socket_table.collect()}
     
     def collect_processes(self):
         """Collect process metrics"""
         processes = []
+        status_counts = {}
+        cached = {}
         
-        # Get top CPU and memory processes
-        for proc in psutil.process_iter(['pid', 'ppid', 'name', 'cpu_percent', 'memory_percent', 'status', 'cmdline']):
+        for pid in psutil.pids():
+            proc = self._processes.get(pid)
             try:
-                pinfo = proc.info
-                processes.append({
-                    'pid': pinfo['pid'],
-                    'ppid': pinfo['ppid'],
-                    'name': pinfo['name'],
-                    'cpu_percent': pinfo['cpu_percent'],
-                    'memory_percent': pinfo['memory_percent'],
-                    'status': pinfo['status'],
-                    'cmdline': ' '.join(pinfo['cmdline'])[:200] if pinfo['cmdline'] else ''
-                })
+                if proc is None or not proc.is_running():
+                    # New process (or a reused pid): start its CPU baseline now,
+                    # it reports a real percentage from the next cycle on
+                    proc = psutil.Process(pid)
+                    proc.cpu_percent(None)
+                
+                with proc.oneshot():
+                    processes.append((
+                        proc.cpu_percent(None),
+                        proc.memory_percent(),
+                        pid,
+                        proc.ppid(),
+                        proc.name(),
+                        proc.status()
+                    ))
             except (psutil.NoSuchProcess, psutil.AccessDenied):
                 continue
+            
+            cached[pid] = proc
+            status = processes[-1][5]
+            status_counts[status] = status_counts.get(status, 0) + 1
+        
+        self._processes = cached
         
-        # Sort and limit
-        processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
+        # Top N selection, no full sort
+        top_cpu = heapq.nlargest(self.process_top_n, processes, key=lambda p: p[0])
+        top_memory = heapq.nlargest(self.process_top_n, processes, key=lambda p: p[1])
+        
+        # Command lines only for processes that are actually reported
+        cmdlines = {}
+        for _, _, pid, _, _, _ in top_cpu + top_memory:
+            if pid not in cmdlines:
+                try:
+                    cmdlines[pid] = ' '.join(cached[pid].cmdline())[:200]
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    cmdlines[pid] = ''
+        
+        def entry(p):
+            return {
+                'pid': p[2],
+                'ppid': p[3],
+                'name': p[4],
+                'cpu_percent': p[0],
+                'memory_percent': p[1],
+                'status': p[5],
+                'cmdline': cmdlines[p[2]]
+            }
         
         return {
             'total_processes': len(processes),
-            'running': sum(1 for p in processes if p['status'] == 'running'),
-            'sleeping': sum(1 for p in processes if p['status'] == 'sleeping'),
-            'top_cpu': processes[:20],
-            'top_memory': sorted(processes, key=lambda x: x['memory_percent'], reverse=True)[:20]
+            'running': status_counts.get(psutil.STATUS_RUNNING, 0),
+            'sleeping': status_counts.get(psutil.STATUS_SLEEPING, 0),
+            'top_cpu': [entry(p) for p in top_cpu],
+            'top_memory': [entry(p) for p in top_memory]
         }
     
     def collect_security(self):
@@ -278,27 +1014,25 @@ class MetricCollector:
             'ssh_connections': 0
         }
         
-        # Parse auth.log if available
-        auth_logs = ['/var/log/auth.log', '/var/log/secure']
-        for log_file in auth_logs:
-            if os.path.exists(log_file):
-                try:
-                    with open(log_file, 'r') as f:
-                        lines = f.readlines()[-100:]  # Last 100 lines
-                        
-                        for line in lines:
-                            if 'Failed password' in line:
-                                security_data['failed_login_attempts'] += 1
-                            elif 'Accepted password' in line:
-                                security_data['successful_logins'] += 1
-                            elif 'sudo:' in line and 'COMMAND' in line:
-                                security_data['sudo_usage'] += 1
-                            elif 'new user' in line:
-                                security_data['new_users'].append(line.strip())
-                            elif 'sshd' in line and 'Accepted' in line:
-                                security_data['ssh_connections'] += 1
-                except:
-                    pass
+        # Only look at auth log lines written since the previous cycle
+        for log_file in self.AUTH_LOGS:
+            for line in self.log_tailer.read_new_lines(log_file):
+                if 'Failed password' in line:
+                    security_data['failed_login_attempts'] += 1
+                elif 'Accepted password' in line:
+                    security_data['successful_logins'] += 1
+                elif 'sudo:' in line and 'COMMAND' in line:
+                    security_data['sudo_usage'] += 1
+                elif 'new user' in line:
+                    security_data['new_users'].append(line.strip())
+                elif 'sshd' in line and 'Accepted' in line:
+                    security_data['ssh_connections'] += 1
+        
+        security_data['totals'] = self.log_tailer.accumulate('security', {
+            key: security_data[key]
+            for key in ('failed_login_attempts', 'successful_logins', 'sudo_usage',
+                        'root_login_attempts', 'ssh_connections')
+        })
         
         # Get active users
         try:
@@ -311,102 +1045,211 @@ class MetricCollector:
     
     def collect_kernel(self):
         """Collect kernel metrics"""
+        kernel_panics = self._check_kernel_panics()
+        oom_kills = self._check_oom_kills()
+        
         return {
             'kernel_version': platform.release(),
-            'system_uptime': time.time() - psutil.boot_time(),
-            'boot_time': datetime.fromtimestamp(psutil.boot_time()).isoformat(),
-            'kernel_panics': self._check_kernel_panics(),
-            'oom_kills': self._check_oom_kills()
+            # The server derives the uptime: sent here, it would change the
+            # section on every sample and defeat delta suppression
+            'boot_time': datetime.fromtimestamp(psutil.boot_time(), timezone.utc).isoformat(),
+            'kernel_panics': kernel_panics,
+            'oom_kills': oom_kills,
+            'totals': self.log_tailer.accumulate('kernel', {
+                'kernel_panics': kernel_panics,
+                'oom_kills': oom_kills
+            })
         }
     
     def _check_kernel_panics(self):
-        """Check for kernel panics in logs"""
-        try:
-            if os.path.exists('/var/log/kern.log'):
-                with open('/var/log/kern.log', 'r') as f:
-                    lines = f.readlines()[-1000:]
-                    return sum(1 for l in lines if 'Kernel panic' in l)
-        except:
-            pass
-        return 0
+        """Count kernel panics logged since the previous cycle"""
+        lines = self.log_tailer.read_new_lines(self.KERN_LOG)
+        return sum(1 for l in lines if 'Kernel panic' in l)
     
     def _check_oom_kills(self):
-        """Check for OOM kills"""
-        try:
-            if os.path.exists('/var/log/syslog'):
-                with open('/var/log/syslog', 'r') as f:
-                    lines = f.readlines()[-1000:]
-                    return sum(1 for l in lines if 'Out of memory' in l or 'oom-killer' in l)
-        except:
-            pass
-        return 0
+        """Count OOM kills logged since the previous cycle"""
+        lines = self.log_tailer.read_new_lines(self.SYSLOG)
+        return sum(1 for l in lines if 'Out of memory' in l or 'oom-killer' in l)
     
     def collect_containers(self):
         """Collect container metrics"""
         containers = []
         
         try:
-            import docker
-            client = docker.from_env()
-            
-            for container in client.containers.list():
-                stats = container.stats(stream=False)
-                containers.append({
-                    'id': container.id[:12],
-                    'name': container.name,
-                    'image': container.image.tags[0] if container.image.tags else '',
-                    'status': container.status,
-                    'cpu_usage': stats['cpu_stats']['cpu_usage']['total_usage'],
-                    'memory_usage': stats['memory_stats']['usage'] if 'usage' in stats['memory_stats'] else 0,
-                    'network_rx': stats['networks']['eth0']['rx_bytes'] if 'eth0' in stats.get('networks', {}) else 0,
-                    'network_tx': stats['networks']['eth0']['tx_bytes'] if 'eth0' in stats.get('networks', {}) else 0
-                })
+            client = self._docker_client()
+            running = client.containers.list()
         except:
-            pass
+            self._docker = None
+            running = []
+        
+        # Read counters straight from the cgroup filesystem, and only ask the
+        # Docker API (which samples for 1-2s per call) when that fails
+        fallback = []
+        for container in running:
+            counters = self._cgroup_container_counters(container.attrs.get('State', {}).get('Pid'))
+            if counters is None:
+                fallback.append(container)
+            else:
+                containers.append(self._container_entry(container, counters))
+        
+        if fallback:
+            with ThreadPoolExecutor(max_workers=min(len(fallback), 8)) as pool:
+                for container, counters in zip(fallback, pool.map(self._docker_api_counters, fallback)):
+                    if counters is not None:
+                        containers.append(self._container_entry(container, counters))
+        
+        # Forget CPU baselines of containers that are gone
+        running_ids = {c.id for c in running}
+        for container_id in set(self._container_cpu) - running_ids:
+            del self._container_cpu[container_id]
         
         return {
             'running_containers': len(containers),
             'containers': containers
         }
     
+    def _docker_client(self):
+        """Reuse one Docker client across cycles"""
+        if self._docker is None:
+            import docker
+            self._docker = docker.from_env()
+        return self._docker
+    
+    def _container_entry(self, container, counters):
+        """Build the payload entry for one container"""
+        cpu_usage, memory_usage, network_rx, network_tx = counters
+        
+        # CPU rate from the delta since the previous cycle, in percent of one
+        # core like 'docker stats'
+        now = time.monotonic()
+        cpu_percent = None
+        previous = self._container_cpu.get(container.id)
+        if previous and now > previous[0] and cpu_usage >= previous[1]:
+            cpu_percent = round((cpu_usage - previous[1]) / ((now - previous[0]) * 1e9) * 100, 2)
+        self._container_cpu[container.id] = (now, cpu_usage)
+        
+        return {
+            'id': container.id[:12],
+            'name': container.name,
+            'image': self._container_image(container),
+            'status': container.status,
+            'cpu_usage': cpu_usage,
+            'cpu_percent': cpu_percent,
+            'memory_usage': memory_usage,
+            'network_rx': network_rx,
+            'network_tx': network_tx
+        }
+    
+    def _container_image(self, container):
+        """Image tag of a container, cached per image id"""
+        image_id = container.attrs.get('Image')
+        if image_id not in self._image_tags:
+            try:
+                tags = container.image.tags
+                self._image_tags[image_id] = tags[0] if tags else ''
+            except:
+                return ''
+        return self._image_tags[image_id]
+    
+    @staticmethod
+    def _cgroup_container_counters(pid):
+        """(cpu ns, memory bytes, rx bytes, tx bytes) of a container's init process
+        
+        Returns None when the cgroup files cannot be read.
+        """
+        if not pid:
+            return None
+        
+        try:
+            with open(f'/proc/{pid}/cgroup', 'r') as f:
+                cgroup_lines = f.read().splitlines()
+            
+            v1_paths = {}
+            v2_path = None
+            for line in cgroup_lines:
+                hierarchy, controllers, path = line.split(':', 2)
+                if hierarchy == '0' and not controllers:
+                    v2_path = path
+                for controller in controllers.split(','):
+                    v1_paths[controller] = path
+            
+            if 'cpuacct' in v1_paths and 'memory' in v1_paths:
+                with open(f"/sys/fs/cgroup/cpuacct{v1_paths['cpuacct']}/cpuacct.usage", 'r') as f:
+                    cpu_usage = int(f.read())
+                with open(f"/sys/fs/cgroup/memory{v1_paths['memory']}/memory.usage_in_bytes", 'r') as f:
+                    memory_usage = int(f.read())
+            elif v2_path is not None:
+                with open(f'/sys/fs/cgroup{v2_path}/cpu.stat', 'r') as f:
+                    cpu_stat = dict(l.split() for l in f if l.strip())
+                cpu_usage = int(cpu_stat['usage_usec']) * 1000
+                with open(f'/sys/fs/cgroup{v2_path}/memory.current', 'r') as f:
+                    memory_usage = int(f.read())
+            else:
+                return None
+            
+            # The container's network namespace, seen through its init process
+            network_rx = network_tx = 0
+            with open(f'/proc/{pid}/net/dev', 'r') as f:
+                for line in f.readlines()[2:]:
+                    interface, counters = line.split(':', 1)
+                    if interface.strip() == 'lo':
+                        continue
+                    fields = counters.split()
+                    network_rx += int(fields[0])
+                    network_tx += int(fields[8])
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        
+        return cpu_usage, memory_usage, network_rx, network_tx
+    
+    @staticmethod
+    def _docker_api_counters(container):
+        """Same counters as _cgroup_container_counters, from the Docker API"""
+        try:
+            stats = container.stats(stream=False)
+        except:
+            return None
+        
+        networks = stats.get('networks', {})
+        return (
+            stats['cpu_stats']['cpu_usage']['total_usage'],
+            stats['memory_stats'].get('usage', 0),
+            sum(n['rx_bytes'] for n in networks.values()),
+            sum(n['tx_bytes'] for n in networks.values())
+        )
+    
     def collect_services(self):
         """Collect systemd service metrics"""
         services = []
         
         try:
-            import systemd.daemon
-            from systemd import journal
-            
-            # Get all services
-            output = subprocess.check_output(['systemctl', 'list-units', '--type=service', '--all', '--no-pager'], 
-                                           text=True)
+            # Get all services in one call
+            output = subprocess.check_output(
+                ['systemctl', 'list-units', '--type=service', '--all', '--no-pager', '--plain', '--no-legend'],
+                text=True
+            )
             
-            for line in output.split('\n')[1:-7]:  # Skip headers and footer
+            for line in output.splitlines():
                 parts = line.split()
                 if len(parts) >= 4:
-                    service = {
+                    services.append({
                         'name': parts[0],
                         'load': parts[1],
                         'active': parts[2],
                         'sub': parts[3],
                         'description': ' '.join(parts[4:])
-                    }
-                    
-                    # Get memory usage
-                    try:
-                        mem = subprocess.check_output(
-                            ['systemctl', 'show', parts[0], '--property=MemoryCurrent'],
-                            text=True
-                        ).strip()
-                        if '=' in mem:
-                            service['memory_usage'] = int(mem.split('=')[1])
-                    except:
-                        pass
-                    
-                    services.append(service)
+                    })
         except:
             pass
         
+        # Get memory usage of units that can hold any
+        memory = self._service_memory(
+            [s['name'] for s in services if s['active'] not in ('inactive', 'failed')]
+        )
+        for service in services:
+            if service['name'] in memory:
+                service['memory_usage'] = memory[service['name']]
+        
         return {
             'total_services': len(services),
             'failed': [s for s in services if s['active'] == 'failed'],
@@ -414,50 +1257,290 @@ class MetricCollector:
             'services': services[:50]  # Limit to 50 services
         }
     
-    def collect_all(self):
-        """Collect all metrics"""
+    def _service_memory(self, units):
+        """Memory usage per unit, read from cgroup files where possible
+        
+        The cgroup memory file of each unit is cached across cycles. Units
+        without a cached file are resolved with a single batched
+        ``systemctl show`` covering all of them.
+        """
+        memory = {}
+        unresolved = []
+        
+        for unit in units:
+            memory_file = self._unit_memory_files.get(unit)
+            if memory_file:
+                try:
+                    with open(memory_file, 'r') as f:
+                        memory[unit] = int(f.read().strip())
+                    continue
+                except (OSError, ValueError):
+                    # Unit restarted into a new cgroup, resolve it again
+                    del self._unit_memory_files[unit]
+            unresolved.append(unit)
+        
+        # Forget units that disappeared
+        for unit in set(self._unit_memory_files) - set(units):
+            del self._unit_memory_files[unit]
+        
+        if not unresolved:
+            return memory
+        
+        try:
+            output = subprocess.check_output(
+                ['systemctl', 'show', '--property=Id,ControlGroup,MemoryCurrent', '--'] + unresolved,
+                text=True
+            )
+        except:
+            return memory
+        
+        # One block of Key=Value lines per unit, separated by blank lines
+        for block in output.split('\n\n'):
+            props = dict(l.split('=', 1) for l in block.splitlines() if '=' in l)
+            unit = props.get('Id')
+            if not unit:
+                continue
+            
+            try:
+                value = int(props.get('MemoryCurrent', ''))
+                if value < 2 ** 64 - 1:  # UINT64_MAX means "not set"
+                    memory[unit] = value
+            except ValueError:
+                pass
+            
+            memory_file = self._cgroup_memory_file(props.get('ControlGroup'))
+            if memory_file:
+                self._unit_memory_files[unit] = memory_file
+        
+        return memory
+    
+    @staticmethod
+    def _cgroup_memory_file(control_group):
+        """Locate the memory usage file of a cgroup (v2 or v1)"""
+        if not control_group:
+            return None
+        
+        for memory_file in (
+            f'/sys/fs/cgroup{control_group}/memory.current',
+            f'/sys/fs/cgroup/memory{control_group}/memory.usage_in_bytes'
+        ):
+            if os.path.exists(memory_file):
+                return memory_file
+        return None
+    
+    def collect_aggregates(self):
+        """Collect windowed summaries of the high-rate samples"""
+        # The sampler starts on first use, so the first summary is empty
+        if self.window_sampler.ident is None:
+            self.window_sampler.start()
+        return self.window_sampler.summarize()
+    
+    def collect_agent(self):
+        """Collect the agent's own timings, payload sizes and resource usage"""
+        return self.stats.snapshot() if self.stats is not None else {}
+    
+    def enabled_collectors(self):
+        """Names of the collectors switched on in the config"""
+        # Agent self-metrics are on unless explicitly switched off
+        return [
+            name for name in self.COLLECTORS
+            if self.config['collect_metrics'].get(name, name == 'agent')
+        ]
+    
+    def collect_all(self, names=None):
+        """Collect all metrics, or only the named collectors"""
+        if names is None:
+            names = self.enabled_collectors()
+        
         metrics = {
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'hostname': socket.gethostname(),
             'node_name': self.config.get('node_name', socket.gethostname())
         }
         
-        if self.config['collect_metrics']['cpu']:
-            metrics['cpu'] = self.collect_cpu()
+        collectors = {
+            name: getattr(self, f'collect_{name}')
+            for name in self.COLLECTORS
+            if name in names
+        }
         
-        if self.config['collect_metrics']['memory']:
-            metrics['memory'] = self.collect_memory()
+        results, stale = self.scheduler.run(collectors)
+        metrics.update(results)
+        if stale:
+            metrics['stale'] = stale
         
-        if self.config['collect_metrics']['disk']:
-            metrics['disk'] = self.collect_disk()
+        return metrics
+
+class DeltaEncoder:
+    """Suppresses payload sections that did not change since the last upload
+    
+    Static inventory (hostname, kernel version, boot time, interface speeds
+    and addresses, filesystem types, service descriptions) is moved out of
+    the volatile sections into an ``inventory`` section. Each section is
+    fingerprinted and only sent when its fingerprint differs from the one the
+    server last acknowledged; deltas list the sections they left out under
+    ``unchanged``. A full keyframe is sent every
+    ``keyframe_interval`` seconds and whenever the server asks for a resync.
+    """
+    
+    # section: (lists holding the items, item key, static fields)
+    # lists is None when the static fields sit on the section itself and ()
+    # when the section is the list of items
+    INVENTORY_FIELDS = {
+        'kernel': (None, None, ('kernel_version', 'boot_time')),
+        'disk': ((), 'mount_point', ('device', 'fs_type')),
+        'network': (('interfaces',), 'interface', ('speed', 'ip_addresses')),
+        'services': (('services', 'failed', 'running'), 'name', ('load', 'description')),
+    }
+    NODE_FIELDS = ('hostname', 'node_name')
+    META_FIELDS = ('timestamp', 'stale', 'degraded')
+    
+    def __init__(self, keyframe_interval=600):
+        self.keyframe_interval = keyframe_interval
+        self._acked = {}  # section -> fingerprint acknowledged by the server
+        self._pending = {}  # section -> fingerprint sent in the batch in flight
+        self._last_keyframe = None
+    
+    @staticmethod
+    def _fingerprint(value):
+        return hashlib.blake2b(
+            json.dumps(value, sort_keys=True, separators=(',', ':')).encode(),
+            digest_size=8
+        ).hexdigest()
+    
+    @classmethod
+    def split_inventory(cls, sample):
+        """Return a copy of sample with its static fields under 'inventory'"""
+        sample = dict(sample)
+        inventory = {'node': {f: sample.pop(f) for f in cls.NODE_FIELDS if f in sample}}
         
-        if self.config['collect_metrics']['network']:
-            metrics['network'] = self.collect_network()
+        for section, (lists, key, fields) in cls.INVENTORY_FIELDS.items():
+            if section not in sample:
+                continue
+            
+            static = {}
+            
+            def strip(item):
+                item = dict(item)
+                static[item[key]] = {f: item.pop(f) for f in fields if f in item}
+                return item
+            
+            value = sample[section]
+            if lists is None:
+                value = dict(value)
+                static = {f: value.pop(f) for f in fields if f in value}
+            elif lists == ():
+                value = [strip(item) for item in value]
+            else:
+                value = dict(value)
+                for name in lists:
+                    value[name] = [strip(item) for item in value.get(name, [])]
+            
+            sample[section] = value
+            inventory[section] = static
         
-        if self.config['collect_metrics']['processes']:
-            metrics['processes'] = self.collect_processes()
+        sample['inventory'] = inventory
+        return sample
+    
+    def encode(self, sample):
+        """Encode one sample as a keyframe or a delta against the previous one"""
+        sample = self.split_inventory(sample)
         
-        if self.config['collect_metrics']['security']:
-            metrics['security'] = self.collect_security()
+        # Samples of different collectors carry different inventory
+        # subsections, so each one is fingerprinted on its own
+        sections = {k: v for k, v in sample.items() if k not in self.META_FIELDS + ('inventory',)}
+        sections.update((f'inventory.{name}', value) for name, value in sample['inventory'].items())
+        fingerprints = {name: self._fingerprint(value) for name, value in sections.items()}
         
-        if self.config['collect_metrics']['kernel']:
-            metrics['kernel'] = self.collect_kernel()
+        now = time.monotonic()
+        keyframe = (
+            self._last_keyframe is None or
+            now - self._last_keyframe >= self.keyframe_interval
+        )
         
-        if self.config['collect_metrics']['containers']:
-            metrics['containers'] = self.collect_containers()
+        encoded = {k: sample[k] for k in self.META_FIELDS if k in sample}
+        if keyframe:
+            # The server restarts from the keyframe, earlier state is void
+            self._last_keyframe = now
+            self._acked = {}
+            self._pending = {}
+            encoded['keyframe'] = True
+            changed = sections
+        else:
+            baseline = {**self._acked, **self._pending}
+            encoded['delta'] = True
+            changed = {
+                name: value for name, value in sections.items()
+                if fingerprints[name] != baseline.get(name)
+            }
+            # Tell the server which collected sections to rebuild from its state
+            unchanged = [
+                name for name in sections
+                if name not in changed and not name.startswith('inventory.')
+            ]
+            if unchanged:
+                encoded['unchanged'] = unchanged
         
-        if self.config['collect_metrics']['services']:
-            metrics['services'] = self.collect_services()
+        for name, value in changed.items():
+            if name.startswith('inventory.'):
+                encoded.setdefault('inventory', {})[name.split('.', 1)[1]] = value
+            else:
+                encoded[name] = value
         
-        return metrics
+        self._pending.update(fingerprints)
+        return encoded
+    
+    def acknowledge(self, resync=False):
+        """The batch in flight was stored by the server"""
+        self._acked.update(self._pending)
+        self._pending = {}
+        if resync:
+            self.reject()
+    
+    def reject(self):
+        """The server lost track of our state: start over with a keyframe"""
+        self._acked = {}
+        self._pending = {}
+        self._last_keyframe = None
+
+class UploadRejected(Exception):
+    """The server refused an upload for good: resending it cannot succeed"""
+    
+    def __init__(self, status, error):
+        super().__init__(f"{status or 'nack'}: {error}")
+        self.status = status
 
 class NodeAgent:
     """Main node agent class"""
     
     def __init__(self):
         self.config = Config.load()
-        self.encryptor = Encryptor(self.config['encryption_key'])
-        self.collector = MetricCollector(self.config)
+        self.stats = AgentStats()
+        self.encryptor = Encryptor(
+            self.config['encryption_key'],
+            self.config.get('compression', 'zlib'),
+            stats=self.stats
+        )
+        self.collector = MetricCollector(self.config, stats=self.stats)
+        self.governor = ResourceGovernor(self.config.get('resource_budget'), stats=self.stats)
+        self.delta = DeltaEncoder(self.config.get('keyframe_interval', 600))
+        self.spool = Spool(
+            os.path.join(self.config.get('state_dir', Config.STATE_DIR), 'spool.db'),
+            max_bytes=self.config.get('spool_max_bytes', 64 * 1024 * 1024),
+            max_age=self.config.get('spool_max_age', 24 * 3600)
+        )
+        self.replay_limiter = ReplayLimiter(
+            rate=self.config.get('spool_replay_rate', 0.5),
+            jitter=self.config.get('spool_replay_jitter', 30)
+        )
+        self.replay_limiter.reset()
+        self.transport = None
+        if self.config.get('transport') == 'websocket':
+            self.transport = WebSocketTransport(
+                self.config.get('stream_url') or
+                self.config['server_url'].replace('http', 'ws', 1).rstrip('/') + '/ws/agent/',
+                self.config['api_key']
+            )
         self.session = requests.Session()
         self.session.headers.update({
             'X-Node-API-Key': self.config['api_key'],
@@ -503,31 +1586,134 @@ class NodeAgent:
         except:
             return '0.0.0.0'
     
-    def send_metrics(self, metrics):
-        """Send metrics to server"""
+    def upload(self, samples):
+        """Upload a batch of metric samples in one request
+        
+        Returns the server's response body, or None when the upload failed
+        for a reason that may go away (network errors, 408, 429, 5xx and
+        load-shedding nacks). Raises UploadRejected when the server refused
+        the payload itself (other 4xx, nacks without retry_after).
+        """
         try:
             # Encrypt metrics
             encrypted = self.encryptor.encrypt({
                 'node_id': self.config.get('node_id'),
-                'timestamp': metrics['timestamp'],
-                'data': metrics
+                'samples': samples
             })
             
-            response = self.session.post(
-                f"{self.config['server_url']}/api/telemetry/ingest_batch/",
-                json={'data': encrypted},
-                headers={'X-Encrypted': 'true'}
-            )
+            if self.transport is not None:
+                return self._stream(encrypted, len(samples))
             
-            if response.status_code == 200:
-                logger.debug("Metrics sent successfully")
-                return True
+            headers = {'X-Encrypted': 'true'}
+            if self.encryptor.compression:
+                headers['X-Compression'] = self.encryptor.compression
+            
+            with self.stats.timer('http'):
+                response = self.session.post(
+                    f"{self.config['server_url']}/api/telemetry/ingest_batch/",
+                    json={'data': encrypted},
+                    headers=headers
+                )
+            
+            if response.ok:
+                logger.debug(f"Sent {len(samples)} metric samples")
+                self.stats.incr('uploads')
+                self.stats.incr('samples_sent', len(samples))
+                return response.json()
             else:
                 logger.error(f"Failed to send metrics: {response.text}")
-                return False
+                self.stats.incr('upload_failures')
+                if response.status_code in (429, 503):
+                    # Server is shedding load, hold replay back as long as it asks
+                    self.replay_limiter.defer(response.headers.get('Retry-After'))
+                elif 400 <= response.status_code < 500 and response.status_code != 408:
+                    raise UploadRejected(response.status_code, response.text)
+                return None
+        except UploadRejected:
+            raise
         except Exception as e:
             logger.error(f"Send error: {e}")
-            return False
+            self.stats.incr('upload_failures')
+            return None
+    
+    def _stream(self, encrypted, count):
+        """Upload over the persistent WebSocket transport"""
+        with self.stats.timer('stream'):
+            reply = self.transport.send(encrypted, self.encryptor.compression)
+        
+        if reply is None or reply.get('type') != 'ack':
+            self.stats.incr('upload_failures')
+            if reply is None:
+                return None
+            if reply.get('retry_after') is None:
+                raise UploadRejected(None, reply.get('error'))
+            # A server shedding load nacks with how long to hold replay back
+            self.replay_limiter.defer(reply['retry_after'])
+            return None
+        
+        logger.debug(f"Streamed {count} metric samples")
+        self.stats.incr('uploads')
+        self.stats.incr('samples_sent', count)
+        return reply
+    
+    def send_metrics(self, samples):
+        """Send a batch of samples to server, spooling them locally on failure"""
+        try:
+            result = self.upload([self.delta.encode(sample) for sample in samples])
+        except UploadRejected as e:
+            # Replay sends the full samples, and sets them aside if refused again
+            logger.error(f"Server rejected {len(samples)} samples: {e}")
+            result = None
+        if result is not None:
+            self.delta.acknowledge(resync=result.get('resync', False))
+            return True
+        
+        # Spool full samples, replay must not depend on server-side state
+        self.delta.reject()
+        self.spool.push_many(samples)
+        self.replay_limiter.reset()
+        self._update_spool_depth()
+        return False
+    
+    def _update_spool_depth(self):
+        count, size = self.spool.depth()
+        self.stats.gauge('spool_samples', count)
+        self.stats.gauge('spool_bytes', size)
+    
+    def replay_spool(self):
+        """Upload spooled samples in batches, as fast as the limiter allows
+        
+        Batches the server refuses for good are set aside in the spool's
+        dead-letter table so they do not hold back the samples behind them;
+        too large batches are split first. Replay only backs off when the
+        upload may succeed later.
+        """
+        batch_size = self.config.get('spool_replay_batch', 50)
+        
+        while self.replay_limiter.acquire():
+            ids, samples = self.spool.peek(batch_size)
+            if not samples:
+                return
+            
+            try:
+                result = self.upload(samples)
+            except UploadRejected as e:
+                if e.status == 413 and len(samples) > 1:
+                    batch_size = len(samples) // 2
+                    continue
+                logger.error(f"Server rejected {len(samples)} spooled samples, setting them aside: {e}")
+                self.spool.dead_letter(ids, str(e))
+                self.stats.incr('samples_rejected', len(samples))
+                self._update_spool_depth()
+                continue
+            
+            if result is None:
+                self.replay_limiter.reset()
+                return
+            
+            self.spool.ack(ids)
+            self._update_spool_depth()
+            logger.info(f"Replayed {len(samples)} spooled samples")
     
     def run(self):
         """Main run loop"""
@@ -541,22 +1727,64 @@ class NodeAgent:
         
         interval = self.config['transmission_interval']
         
+        # Local stats endpoint, agent metrics are also shipped as 'agent'
+        stats_port = self.config.get('stats_port', 9465)
+        if stats_port:
+            self.stats.serve(stats_port)
+        self._update_spool_depth()
+        
+        # Every collector runs on its own schedule (collector_intervals,
+        # defaulting to sample_interval). Uploads carry whatever samples were
+        # collected since the previous one.
+        sample_interval = min(self.config.get('sample_interval', interval), interval)
+        intervals = self.config.get('collector_intervals', {})
+        # Windowed aggregates summarise one upload interval each
+        intervals = {'aggregates': interval, **intervals}
+        queue = CollectorQueue({
+            name: intervals.get(name, sample_interval)
+            for name in self.collector.enabled_collectors()
+        })
+        top_n = self.collector.process_top_n
+        samples = []
+        next_upload = time.monotonic()
+        
         while True:
             try:
-                # Collect metrics
-                metrics = self.collector.collect_all()
+                now = time.monotonic()
+                
+                # Back off when the agent or the host is under pressure
+                if self.governor.check():
+                    queue.scale = self.governor.scale
+                    self.collector.process_top_n = self.governor.top_n(top_n)
+                else:
+                    queue.scale = 1
+                    self.collector.process_top_n = top_n
+                
+                # Collect metrics that are due
+                due = [name for name in queue.pop_due(now) if self.governor.allows(name)]
+                if due:
+                    with self.stats.timer('collect'):
+                        sample = self.collector.collect_all(due)
+                    if self.governor.level:
+                        sample['degraded'] = self.governor.status()
+                    samples.append(sample)
                 
-                # Send to server
-                self.send_metrics(metrics)
+                if now >= next_upload:
+                    # Send to server, then catch up on anything spooled
+                    if samples and self.send_metrics(samples):
+                        self.replay_spool()
+                    samples = []
+                    next_upload = now + interval
                 
-                # Wait for next collection
-                time.sleep(interval)
+                # Wait for the next collector or upload
+                time.sleep(max(0, min(queue.next_due(), next_upload) - time.monotonic()))
             except KeyboardInterrupt:
                 logger.info("Shutting down...")
                 break
             except Exception as e:
                 logger.error(f"Error in main loop: {e}")
-                time.sleep(interval)
+                samples = []
+                time.sleep(sample_interval)
 
 def main():
     parser = argparse.ArgumentParser(description='SATORI Node Agent')
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+SATORI Node Agent collector benchmark
+Measures the latency, allocations and payload size of each collector,
+against the live host or against recorded /proc, network interface and log fixtures
+
+    python3 bench.py live
+    python3 bench.py record /tmp/fixture
+    python3 bench.py synthesize /tmp/fixture --processes 5000 --sockets 50000
+    python3 bench.py fixture /tmp/fixture --json > baseline.json
+    python3 bench.py fixture /tmp/fixture --compare baseline.json
+"""
+
+import os
+import sys
+import json
+import socket
+import collections
+import time
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import zlib
+
+import psutil
+
+# Collectors that only read /proc, log files and the host state recorded
+# below, and can therefore run against a fixture; the others need docker,
+# systemd or a live host
+FIXTURE_COLLECTORS = ('cpu', 'memory', 'network', 'processes', 'security', 'kernel')
+
+PROC_FILES = ('stat', 'meminfo', 'vmstat', 'uptime', 'loadavg',
+              'net/dev', 'net/tcp', 'net/tcp6', 'net/udp', 'net/udp6')
+# psutil.net_if_stats and net_if_addrs (ioctls, getifaddrs and /sys/class/net)
+NET_IF_FILE = 'net_if.json'
+
+# What collectors still read from the live host when run against a
+# fixture; the report lists them next to the figures
+LIVE_READS = {
+    'disk': ('statvfs', '/sys/block'),
+    'security': ('who',),
+    'kernel': ('uname',),
+    'containers': ('docker', '/proc/<pid>/cgroup', '/sys/fs/cgroup'),
+    'services': ('systemctl', '/sys/fs/cgroup'),
+    'aggregates': ('/sys/block',),
+}
+PID_FILES = ('stat', 'statm', 'status', 'cmdline')
+LOG_FILES = ('auth.log', 'secure', 'kern.log', 'syslog')
+MAX_LOG_BYTES = 64 * 1024 * 1024
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def load_net_if(path):
+    """net_if_stats and net_if_addrs results recorded in a fixture"""
+    with open(path, 'r') as f:
+        interfaces = json.load(f)
+
+    def record(name, fields):
+        return collections.namedtuple(name, fields)(**fields)
+
+    stats = {
+        interface: record('snicstats', recorded['stats'])
+        for interface, recorded in interfaces.items() if recorded['stats']
+    }
+    addrs = {
+        interface: [record('snicaddr', addr) for addr in recorded['addrs']]
+        for interface, recorded in interfaces.items()
+    }
+    return stats, addrs
+
+def redirect_host(fixture):
+    """Serve psutil's host reads outside /proc from fixture
+
+    Returns the reads left on the live host, per collector, because the
+    fixture was recorded without them.
+    """
+    live = {}
+
+    loadavg = os.path.join(fixture, 'proc', 'loadavg')
+    if os.path.exists(loadavg):
+        def getloadavg():
+            with open(loadavg, 'r') as f:
+                return tuple(float(value) for value in f.read().split()[:3])
+        psutil.getloadavg = getloadavg
+    else:
+        live['cpu'] = ('loadavg',)
+
+    net_if = os.path.join(fixture, NET_IF_FILE)
+    if os.path.exists(net_if):
+        stats, addrs = load_net_if(net_if)
+        psutil.net_if_stats = lambda: dict(stats)
+        psutil.net_if_addrs = lambda: dict(addrs)
+    else:
+        live['network'] = ('net_if_stats', 'net_if_addrs')
+
+    return live
+
+def make_collector(fixture=None):
+    """MetricCollector reading from fixture instead of the live host
+
+    Returns the collector, its state directory and what its collectors
+    still read from the live host (see LIVE_READS).
+    """
+    live = {}
+    if fixture is not None:
+        # Must happen before psutil objects are created: psutil resolves
+        # the procfs path when a Process is instantiated
+        psutil.PROCFS_PATH = os.path.join(fixture, 'proc')
+        live = {**LIVE_READS, **redirect_host(fixture)}
+
+    from agent import MetricCollector
+
+    state_dir = tempfile.mkdtemp(prefix='satori-bench-')
+    collector = MetricCollector({'state_dir': state_dir, 'collect_metrics': {}})
+
+    if fixture is not None:
+        log_dir = os.path.join(fixture, 'log')
+        collector.AUTH_LOGS = (os.path.join(log_dir, 'auth.log'), os.path.join(log_dir, 'secure'))
+        collector.KERN_LOG = os.path.join(log_dir, 'kern.log')
+        collector.SYSLOG = os.path.join(log_dir, 'syslog')
+
+    return collector, state_dir, live
+
+def rewind_logs(collector):
+    """Point every log cursor at the start of its file
+
+    Log collectors only read what was appended since the previous cycle;
+    rewinding makes every iteration parse the whole fixture log.
+    """
+    tailer = collector.log_tailer
+    for path in (*collector.AUTH_LOGS, collector.KERN_LOG, collector.SYSLOG):
+        try:
+            tailer.cursors[path] = {'inode': os.stat(path).st_ino, 'offset': 0}
+        except OSError:
+            pass
+
+def bench_collector(collector, name, iterations, warmup, rewind):
+    """Latency, allocation and payload figures of one collector"""
+    func = getattr(collector, f'collect_{name}')
+
+    cold_started = time.perf_counter()
+    if rewind:
+        rewind_logs(collector)
+    result = func()
+    cold = time.perf_counter() - cold_started
+
+    for _ in range(warmup):
+        if rewind:
+            rewind_logs(collector)
+        func()
+
+    durations = []
+    for _ in range(iterations):
+        if rewind:
+            rewind_logs(collector)
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+
+    # Allocation tracing slows every call down, so it gets its own pass
+    peaks = []
+    retained = []
+    tracemalloc.start()
+    try:
+        for _ in range(max(1, iterations // 4)):
+            if rewind:
+                rewind_logs(collector)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+
+    raw = json.dumps(result, separators=(',', ':'), default=str).encode()
+
+    return {
+        'iterations': iterations,
+        'cold_ms': round(cold * 1000, 3),
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+        'max_ms': round(durations[-1] * 1000, 3),
+        'alloc_peak_kb': round(max(peaks) / 1024, 1),
+        'alloc_retained_kb': round(max(retained) / 1024, 1),
+        'payload_bytes': len(raw),
+        'payload_zlib_bytes': len(zlib.compress(raw, 6))
+    }
+
+def run(fixture, names, iterations, warmup):
+    collector, state_dir, live = make_collector(fixture)
+    try:
+        if names is None:
+            names = FIXTURE_COLLECTORS if fixture else [
+                name for name in collector.COLLECTORS if name != 'agent'
+            ]
+        report = {}
+        for name in names:
+            report[name] = bench_collector(collector, name, iterations, warmup, rewind=fixture is not None)
+            if live.get(name):
+                report[name]['live_reads'] = list(live[name])
+        return report
+    finally:
+        collector.window_sampler.stop()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+def print_report(report):
+    columns = ('cold_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+               'alloc_peak_kb', 'alloc_retained_kb', 'payload_bytes', 'payload_zlib_bytes')
+    print(f"{'collector':<12}" + ''.join(f'{c:>19}' for c in columns))
+    for name, figures in report.items():
+        print(f'{name:<12}' + ''.join(f'{figures[c]:>19}' for c in columns))
+
+    live = {name: figures['live_reads'] for name, figures in report.items() if figures.get('live_reads')}
+    if live:
+        print('\nRead from the live host, not the fixture:')
+        for name, reads in live.items():
+            print(f"  {name:<12}{', '.join(reads)}")
+
+def compare(report, baseline, threshold):
+    """Figures that grew by more than threshold relative to a baseline report
+
+    Growth smaller than the field's noise floor is ignored, so sub-millisecond
+    collectors do not flag scheduling jitter.
+    """
+    noise = {'p95_ms': 0.5, 'alloc_peak_kb': 16, 'payload_bytes': 0}
+    regressions = []
+    for name, figures in report.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for field, floor in noise.items():
+            if figures[field] - base[field] > max(base[field] * threshold, floor):
+                regressions.append(f'{name}.{field}: {base[field]} -> {figures[field]}')
+    return regressions
+
+# Fixtures
+
+def copy_file(src, dst, max_bytes=None):
+    """Copy a /proc file (st_size is 0, so stat-based copies read nothing)"""
+    try:
+        with open(src, 'rb') as f:
+            if max_bytes is not None and os.path.getsize(src) > max_bytes:
+                f.seek(-max_bytes, os.SEEK_END)
+                f.readline()  # drop the partial first line
+            data = f.read()
+    except OSError:
+        return False
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with open(dst, 'wb') as f:
+        f.write(data)
+    return True
+
+def link_socket_fds(pid_dir, fds):
+    """Recreate the socket entries of a process fd directory"""
+    fd_dir = os.path.join(pid_dir, 'fd')
+    os.makedirs(fd_dir, exist_ok=True)
+    for fd, target in fds:
+        os.symlink(target, os.path.join(fd_dir, str(fd)))
+
+def write_net_if(fixture, interfaces):
+    """Store {interface: {'stats', 'addrs'}} for load_net_if"""
+    os.makedirs(fixture, exist_ok=True)
+    with open(os.path.join(fixture, NET_IF_FILE), 'w') as f:
+        json.dump(interfaces, f, indent=2)
+
+def record(fixture):
+    """Snapshot the live host's /proc, interfaces and logs into a fixture directory"""
+    proc = os.path.join(fixture, 'proc')
+    for name in PROC_FILES:
+        copy_file(f'/proc/{name}', os.path.join(proc, name))
+
+    stats = psutil.net_if_stats()
+    write_net_if(fixture, {
+        interface: {
+            'stats': stats[interface]._asdict() if interface in stats else None,
+            'addrs': [addr._asdict() for addr in addrs],
+        }
+        for interface, addrs in psutil.net_if_addrs().items()
+    })
+
+    recorded = 0
+    for pid in psutil.pids():
+        pid_dir = os.path.join(proc, str(pid))
+        if not all(copy_file(f'/proc/{pid}/{name}', os.path.join(pid_dir, name)) for name in PID_FILES):
+            shutil.rmtree(pid_dir, ignore_errors=True)
+            continue
+        recorded += 1
+
+        # Only socket fds matter to the collectors
+        fds = []
+        try:
+            for fd in os.listdir(f'/proc/{pid}/fd'):
+                try:
+                    target = os.readlink(f'/proc/{pid}/fd/{fd}')
+                except OSError:
+                    continue
+                if target.startswith('socket:'):
+                    fds.append((fd, target))
+        except OSError:
+            pass
+        link_socket_fds(pid_dir, fds)
+
+    logs = 0
+    for name in LOG_FILES:
+        logs += copy_file(f'/var/log/{name}', os.path.join(fixture, 'log', name), MAX_LOG_BYTES)
+
+    return {'source': 'recorded', 'processes': recorded, 'logs': logs}
+
+def synthesize(fixture, processes, sockets, auth_lines, seed=0):
+    """Generate a fixture for a large host
+
+    Host-wide files (/proc/stat, meminfo, ...) are copied from the live
+    host so psutil parses them as usual; processes, sockets and logs are
+    generated at the requested scale.
+    """
+    rng = random.Random(seed)
+    proc = os.path.join(fixture, 'proc')
+    for name in ('stat', 'meminfo', 'vmstat', 'uptime', 'loadavg'):
+        copy_file(f'/proc/{name}', os.path.join(proc, name))
+
+    interfaces = ['lo'] + [f'eth{i}' for i in range(4)]
+    os.makedirs(os.path.join(proc, 'net'), exist_ok=True)
+    with open(os.path.join(proc, 'net', 'dev'), 'w') as f:
+        f.write('Inter-|   Receive                                                |  Transmit\n')
+        f.write(' face |bytes    packets errs drop fifo frame compressed multicast|'
+                'bytes    packets errs drop fifo colls carrier compressed\n')
+        for interface in interfaces:
+            rx, tx = rng.randrange(1 << 40), rng.randrange(1 << 40)
+            f.write(f'{interface:>6}: {rx} {rx // 900} 0 0 0 0 0 0 {tx} {tx // 900} 0 0 0 0 0 0\n')
+
+    write_net_if(fixture, {
+        interface: {
+            'stats': {'isup': True, 'duplex': 2, 'speed': 0 if i == 0 else 10000, 'mtu': 1500, 'flags': 'up,running'},
+            'addrs': [{'family': socket.AF_INET, 'address': f'10.0.0.{i}' if i else '127.0.0.1',
+                       'netmask': '255.255.255.0', 'broadcast': None, 'ptp': None}],
+        }
+        for i, interface in enumerate(interfaces)
+    })
+
+    # Sockets: mostly established, a listener every 50th, some TIME_WAIT
+    header = ('  sl  local_address rem_address   st tx_queue rx_queue tr tm->when '
+              'retrnsmt   uid  timeout inode\n')
+    listeners = []
+    with open(os.path.join(proc, 'net', 'tcp'), 'w') as tcp:
+        tcp.write(header)
+        for i in range(sockets):
+            inode = 100000 + i
+            if i % 50 == 0:
+                state, remote = '0A', '00000000:0000'
+                listeners.append(inode)
+            else:
+                state = rng.choice(('01', '01', '01', '06', '08'))
+                remote = f'{rng.randrange(1 << 32):08X}:{rng.randrange(1 << 16):04X}'
+            tcp.write(f'{i:>4}: 0100007F:{1024 + i % 60000:04X} {remote} {state} '
+                      f'00000000:00000000 00:00000000 00000000     0        0 {inode} '
+                      f'1 0000000000000000 20 4 30 10 -1\n')
+    for name in ('tcp6', 'udp', 'udp6'):
+        with open(os.path.join(proc, 'net', name), 'w') as f:
+            f.write(header)
+
+    boot_ticks = 100 * 3600
+    for pid in range(1, processes + 1):
+        pid_dir = os.path.join(proc, str(pid))
+        os.makedirs(pid_dir)
+        name = rng.choice(('nginx', 'postgres', 'python3', 'java', 'sshd', 'kworker/0:1-events'))
+        fields = ['S', str(max(1, pid // 10)), str(pid), str(pid), '0', '-1', '4194560',
+                  '0', '0', '0', '0', str(rng.randrange(100000)), str(rng.randrange(10000)),
+                  '0', '0', '20', '0', '1', '0', str(boot_ticks + pid)] + ['0'] * 32
+        with open(os.path.join(pid_dir, 'stat'), 'w') as f:
+            f.write(f"{pid} ({name[:15]}) {' '.join(fields)}\n")
+        with open(os.path.join(pid_dir, 'statm'), 'w') as f:
+            f.write(f'{rng.randrange(1 << 20)} {rng.randrange(1 << 16)} 512 64 0 2048 0\n')
+        with open(os.path.join(pid_dir, 'status'), 'w') as f:
+            f.write(f'Name:\t{name[:15]}\nState:\tS (sleeping)\nPid:\t{pid}\n'
+                    f'Uid:\t0\t0\t0\t0\nGid:\t0\t0\t0\t0\nThreads:\t1\n')
+        with open(os.path.join(pid_dir, 'cmdline'), 'w') as f:
+            f.write(f'/usr/bin/{name}\0--serve\0')
+
+        # Spread the listening sockets over the first processes
+        owned = listeners[pid - 1::processes]
+        link_socket_fds(pid_dir, [(3 + i, f'socket:[{inode}]') for i, inode in enumerate(owned)])
+
+    log_dir = os.path.join(fixture, 'log')
+    os.makedirs(log_dir, exist_ok=True)
+    templates = (
+        'sshd[{pid}]: Failed password for invalid user admin from 10.0.{a}.{b} port {port} ssh2',
+        'sshd[{pid}]: Accepted password for deploy from 10.0.{a}.{b} port {port} ssh2',
+        'sudo:   deploy : TTY=pts/0 ; PWD=/srv ; USER=root ; COMMAND=/usr/bin/systemctl restart app',
+        'CRON[{pid}]: pam_unix(cron:session): session opened for user root by (uid=0)',
+    )
+    with open(os.path.join(log_dir, 'auth.log'), 'w') as f:
+        for i in range(auth_lines):
+            line = rng.choice(templates).format(
+                pid=rng.randrange(1, 1 << 16), a=rng.randrange(256), b=rng.randrange(256),
+                port=rng.randrange(1024, 65536)
+            )
+            f.write(f'Oct 17 12:{i // 60 % 60:02d}:{i % 60:02d} host {line}\n')
+    with open(os.path.join(log_dir, 'kern.log'), 'w') as f:
+        for i in range(auth_lines // 10):
+            f.write(f'Oct 17 12:00:00 host kernel: [{i}.000000] eth0: link up\n')
+    with open(os.path.join(log_dir, 'syslog'), 'w') as f:
+        for i in range(auth_lines // 10):
+            f.write(f'Oct 17 12:00:00 host kernel: Out of memory: Killed process {i}\n'
+                    if i % 1000 == 0 else f'Oct 17 12:00:00 host systemd[1]: Started session {i}.\n')
+
+    return {'source': 'synthetic', 'processes': processes, 'sockets': sockets, 'auth_lines': auth_lines}
+
+def main():
+    parser = argparse.ArgumentParser(description='SATORI Node Agent collector benchmark')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for command in ('live', 'fixture'):
+        p = sub.add_parser(command, help=f'Benchmark collectors against the {command} host'
+                           if command == 'live' else 'Benchmark collectors against a fixture')
+        if command == 'fixture':
+            p.add_argument('path', help='Fixture directory')
+        p.add_argument('--collectors', help='Comma-separated collector names')
+        p.add_argument('--iterations', type=int, default=50)
+        p.add_argument('--warmup', type=int, default=3)
+        p.add_argument('--json', action='store_true', help='Print the report as JSON')
+        p.add_argument('--compare', help='Baseline report (JSON) to check for regressions')
+        p.add_argument('--threshold', type=float, default=0.2,
+                       help='Relative growth counted as a regression (default 0.2)')
+
+    p = sub.add_parser('record', help='Record the live host into a fixture')
+    p.add_argument('path', help='Fixture directory')
+
+    p = sub.add_parser('synthesize', help='Generate a fixture for a large host')
+    p.add_argument('path', help='Fixture directory')
+    p.add_argument('--processes', type=int, default=5000)
+    p.add_argument('--sockets', type=int, default=50000)
+    p.add_argument('--auth-lines', type=int, default=200000)
+    p.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command in ('record', 'synthesize'):
+        if os.path.exists(args.path) and os.listdir(args.path):
+            parser.error(f'{args.path} is not empty')
+        if args.command == 'record':
+            meta = record(args.path)
+        else:
+            meta = synthesize(args.path, args.processes, args.sockets, args.auth_lines, args.seed)
+        with open(os.path.join(args.path, 'fixture.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        print(json.dumps(meta))
+        return 0
+
+    # Collector warnings (missing docker, systemctl, ...) are not results
+    logging.getLogger('satori-agent').setLevel(logging.ERROR)
+
+    names = args.collectors.split(',') if args.collectors else None
+    report = run(getattr(args, 'path', None), names, args.iterations, args.warmup)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,11 +20,15 @@ apt-get install -y python3 python3-pip python3-venv
 mkdir -p /opt/satori-agent
 mkdir -p /etc/satori-agent
 mkdir -p /var/log/satori-agent
+mkdir -p /var/lib/satori-agent
 
 # Copy agent files
 cp agent.py /opt/satori-agent/
 cp collector.py /opt/satori-agent/
 cp encryptor.py /opt/satori-agent/
+cp spool.py /opt/satori-agent/
+cp stats.py /opt/satori-agent/
+cp transport.py /opt/satori-agent/
 cp requirements.txt /opt/satori-agent/
 
 # Create virtual environment
@@ -0,0 +1,157 @@
+"""
+SATORI Node Agent spool
+Durable, bounded local queue for payloads the server could not accept
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger('satori-agent')
+
+class Spool:
+    """Append-only SQLite (WAL) queue with size and age eviction"""
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_age=24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS spool ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'created REAL NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'payload TEXT NOT NULL)'
+        )
+        # Payloads the server refused for good, kept for inspection
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS dead_letter ('
+            'id INTEGER PRIMARY KEY, '
+            'created REAL NOT NULL, '
+            'rejected REAL NOT NULL, '
+            'error TEXT NOT NULL, '
+            'payload TEXT NOT NULL)'
+        )
+
+    def push(self, payload):
+        """Persist a payload, evicting the oldest entries over the bounds"""
+        self.push_many([payload])
+
+    def push_many(self, payloads):
+        """Persist several payloads in one transaction"""
+        now = time.time()
+        rows = [(now, len(data), data) for data in map(json.dumps, payloads)]
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.executemany('INSERT INTO spool (created, size, payload) VALUES (?, ?, ?)', rows)
+            self.db.execute('COMMIT')
+            self._evict()
+
+    def peek(self, limit):
+        """Return up to limit of the oldest entries as (ids, payloads)"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT id, payload FROM spool ORDER BY id LIMIT ?', (limit,)
+            ).fetchall()
+        return [r[0] for r in rows], [json.loads(r[1]) for r in rows]
+
+    def ack(self, ids):
+        """Drop entries that were delivered"""
+        if not ids:
+            return
+        with self.lock:
+            self.db.execute(
+                f"DELETE FROM spool WHERE id IN ({','.join('?' * len(ids))})", ids
+            )
+
+    def dead_letter(self, ids, error):
+        """Move entries the server refused for good out of the queue"""
+        if not ids:
+            return
+        placeholders = ','.join('?' * len(ids))
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.execute(
+                f'INSERT OR REPLACE INTO dead_letter (id, created, rejected, error, payload) '
+                f'SELECT id, created, ?, ?, payload FROM spool WHERE id IN ({placeholders})',
+                [time.time(), error, *ids]
+            )
+            self.db.execute(f'DELETE FROM spool WHERE id IN ({placeholders})', ids)
+            self.db.execute('COMMIT')
+
+    def depth(self):
+        """Number of spooled entries and their total size in bytes"""
+        with self.lock:
+            count, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM spool').fetchone()
+        return count, size
+
+    def _evict(self):
+        """Drop entries older than max_age, then the oldest beyond max_bytes"""
+        expired = self.db.execute(
+            'DELETE FROM spool WHERE created < ?', (time.time() - self.max_age,)
+        ).rowcount
+        self.db.execute('DELETE FROM dead_letter WHERE rejected < ?', (time.time() - self.max_age,))
+
+        # Keep the newest entries whose cumulative size fits in max_bytes
+        overflow = self.db.execute(
+            'DELETE FROM spool WHERE id IN ('
+            'SELECT id FROM (SELECT id, SUM(size) OVER (ORDER BY id DESC) AS newer FROM spool) '
+            'WHERE newer > ?)',
+            (self.max_bytes,)
+        ).rowcount
+
+        if expired or overflow:
+            logger.warning(f"Spool full, dropped {expired} expired and {overflow} oldest payloads")
+
+class ReplayLimiter:
+    """Token bucket pacing spool replay, with a random start delay
+
+    The jitter spreads the first replay of a fleet that reconnects at the
+    same moment across ``jitter`` seconds.
+    """
+
+    def __init__(self, rate=0.5, burst=2, jitter=30):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.not_before = 0.0
+
+    def reset(self):
+        """Start a fresh jitter window, e.g. after the server was unreachable
+
+        A later start requested through defer() is kept.
+        """
+        self.tokens = 0.0
+        self.not_before = max(self.not_before, time.monotonic() + random.uniform(0, self.jitter))
+
+    def defer(self, retry_after):
+        """Hold replay back for the server's Retry-After (in seconds)"""
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            return
+        self.not_before = max(self.not_before, time.monotonic() + delay + random.uniform(0, self.jitter))
+
+    def acquire(self):
+        """Take one token if replay is allowed right now"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if now < self.not_before or self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
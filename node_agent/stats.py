@@ -0,0 +1,143 @@
+"""
+SATORI Node Agent self-instrumentation
+Timings, sizes and resource usage of the agent itself
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+logger = logging.getLogger('satori-agent')
+
+class AgentStats:
+    """Thread-safe registry of agent timers and gauges"""
+
+    WINDOW = 120  # samples kept per timer for percentiles
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.timers = {}
+        self.gauges = {}
+        self.counters = {}
+        self.process = psutil.Process()
+        self._cpu_sample = (time.monotonic(), sum(self.process.cpu_times()[:2]))
+        self._cpu_percent = 0.0
+
+    def record(self, name, seconds):
+        """Record one duration of the named timer"""
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = {'count': 0, 'total': 0.0, 'window': deque(maxlen=self.WINDOW)}
+            timer['count'] += 1
+            timer['total'] += seconds
+            timer['window'].append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def gauge(self, name, value):
+        """Set the current value of a gauge"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def incr(self, name, value=1):
+        """Increment a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _own_cpu_percent(self, cpu_times):
+        """Agent CPU usage, refreshed at most once a second
+
+        Several readers (stats endpoint, shipped snapshots) must not shrink
+        each other's measurement window.
+        """
+        now = time.monotonic()
+        used = cpu_times.user + cpu_times.system
+        last_time, last_used = self._cpu_sample
+        if now - last_time >= 1:
+            self._cpu_percent = round((used - last_used) / (now - last_time) * 100, 2)
+            self._cpu_sample = (now, used)
+        return self._cpu_percent
+
+    @staticmethod
+    def _summary(timer):
+        window = sorted(timer['window'])
+        return {
+            'count': timer['count'],
+            'mean_ms': round(timer['total'] / timer['count'] * 1000, 3),
+            'last_ms': round(timer['window'][-1] * 1000, 3),
+            'p50_ms': round(window[len(window) // 2] * 1000, 3),
+            'p95_ms': round(window[min(len(window) - 1, int(len(window) * 0.95))] * 1000, 3),
+            'max_ms': round(window[-1] * 1000, 3)
+        }
+
+    def snapshot(self):
+        """Current stats, including the agent's own CPU and memory usage"""
+        with self.lock:
+            timers = {name: self._summary(timer) for name, timer in self.timers.items()}
+            gauges = dict(self.gauges)
+            counters = dict(self.counters)
+
+        try:
+            with self.process.oneshot():
+                cpu_times = self.process.cpu_times()
+                process = {
+                    'rss': self.process.memory_info().rss,
+                    'cpu_percent': self._own_cpu_percent(cpu_times),
+                    'cpu_user': cpu_times.user,
+                    'cpu_system': cpu_times.system,
+                    'threads': self.process.num_threads()
+                }
+        except psutil.Error:
+            process = {}
+
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'process': process,
+            'timers': timers,
+            'gauges': gauges,
+            'counters': counters
+        }
+
+    def serve(self, port, host='127.0.0.1'):
+        """Expose snapshot() as JSON on a loopback HTTP endpoint"""
+        stats = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/stats'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(stats.snapshot()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logger.warning(f"Could not start stats endpoint on {host}:{port}: {e}")
+            return None
+
+        threading.Thread(target=server.serve_forever, name='stats-endpoint', daemon=True).start()
+        logger.info(f"Agent stats available at http://{host}:{port}/stats")
+        return server
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+SATORI Node Agent tests
+
+    python3 -m unittest tests
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from agent import CollectorScheduler, DeltaEncoder, NodeAgent, UploadRejected
+from spool import Spool, ReplayLimiter
+from stats import AgentStats
+from transport import WebSocketTransport
+
+def sample(**sections):
+    """Collected sample of a web node, with sections overridden"""
+    return {
+        'timestamp': '2026-01-01T00:00:00+00:00',
+        'hostname': 'web-1',
+        'cpu': {'overall_percent': 12.0},
+        'kernel': {'kernel_version': '6.1', 'boot_time': 1000, 'uptime': 60},
+        'disk': [{'mount_point': '/', 'device': 'sda1', 'fs_type': 'ext4', 'percent_used': 40.0}],
+        **sections,
+    }
+
+class DeltaEncoderTests(unittest.TestCase):
+    def setUp(self):
+        self.encoder = DeltaEncoder()
+        self.first = self.encoder.encode(sample())
+        self.encoder.acknowledge()
+
+    def test_first_sample_is_a_keyframe_with_inventory(self):
+        self.assertTrue(self.first['keyframe'])
+        self.assertEqual(self.first['disk'], [{'mount_point': '/', 'percent_used': 40.0}])
+        self.assertEqual(self.first['inventory'], {
+            'node': {'hostname': 'web-1'},
+            'kernel': {'kernel_version': '6.1', 'boot_time': 1000},
+            'disk': {'/': {'device': 'sda1', 'fs_type': 'ext4'}},
+        })
+
+    def test_delta_lists_unchanged_sections(self):
+        encoded = self.encoder.encode(sample(cpu={'overall_percent': 30.0}))
+
+        self.assertTrue(encoded['delta'])
+        self.assertEqual(encoded['cpu'], {'overall_percent': 30.0})
+        self.assertEqual(encoded['unchanged'], ['kernel', 'disk'])
+        self.assertNotIn('inventory', encoded)
+
+    def test_only_changed_inventory_subsection_is_sent(self):
+        encoded = self.encoder.encode(sample(
+            disk=[{'mount_point': '/', 'device': 'sdb1', 'fs_type': 'ext4', 'percent_used': 40.0}]
+        ))
+
+        self.assertEqual(encoded['inventory'], {'disk': {'/': {'device': 'sdb1', 'fs_type': 'ext4'}}})
+        self.assertIn('disk', encoded['unchanged'])
+
+    def test_samples_of_other_collectors_do_not_resend_inventory(self):
+        cpu_only = sample()
+        del cpu_only['disk']
+
+        for encoded in (self.encoder.encode(cpu_only), self.encoder.encode(sample())):
+            self.assertNotIn('inventory', encoded)
+
+    def test_batch_in_flight_is_the_baseline(self):
+        changed = sample(cpu={'overall_percent': 30.0})
+        self.encoder.encode(changed)
+
+        encoded = self.encoder.encode(changed)
+        self.assertNotIn('cpu', encoded)
+        self.assertIn('cpu', encoded['unchanged'])
+
+    def test_rejected_batch_is_resent_as_keyframe(self):
+        self.encoder.encode(sample(cpu={'overall_percent': 30.0}))
+        self.encoder.reject()
+
+        encoded = self.encoder.encode(sample(cpu={'overall_percent': 30.0}))
+        self.assertTrue(encoded['keyframe'])
+        self.assertIn('inventory', encoded)
+
+    def test_resync_sends_keyframe(self):
+        self.encoder.encode(sample())
+        self.encoder.acknowledge(resync=True)
+
+        self.assertTrue(self.encoder.encode(sample())['keyframe'])
+
+    def test_keyframe_every_interval(self):
+        encoder = DeltaEncoder(keyframe_interval=0)
+        encoder.encode(sample())
+        encoder.acknowledge()
+
+        self.assertTrue(encoder.encode(sample())['keyframe'])
+
+class CollectorSchedulerTests(unittest.TestCase):
+    def test_deadline_starts_when_collector_runs(self):
+        scheduler = CollectorScheduler(max_workers=1, timeouts={'first': 0.3, 'second': 0.3})
+
+        def collect():
+            time.sleep(0.2)
+            return {'ok': True}
+
+        results, stale = scheduler.run({'first': collect, 'second': collect})
+
+        self.assertEqual(results, {'first': {'ok': True}, 'second': {'ok': True}})
+        self.assertEqual(stale, {})
+
+    def test_overdue_collector_is_not_waited_on_again(self):
+        scheduler = CollectorScheduler(timeouts={'hung': 0.1})
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def collect():
+            release.wait(5)
+            return {'ok': True}
+
+        self.assertEqual(scheduler.run({'hung': collect}), ({}, {'hung': None}))
+
+        started = time.monotonic()
+        self.assertEqual(scheduler.run({'hung': collect}), ({}, {'hung': None}))
+        self.assertLess(time.monotonic() - started, 0.05)
+
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(scheduler.run({'hung': collect}), ({'hung': {'ok': True}}, {}))
+
+class SpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix='satori-test-')
+        self.addCleanup(shutil.rmtree, self.state_dir)
+
+    def test_missing_state_dir_is_created(self):
+        path = os.path.join(self.state_dir, 'first-run', 'spool.db')
+        Spool(path).db.close()
+
+        self.assertTrue(os.path.exists(path))
+
+class ReplaySpoolTests(unittest.TestCase):
+    def setUp(self):
+        state_dir = tempfile.mkdtemp(prefix='satori-test-')
+        self.addCleanup(shutil.rmtree, state_dir)
+
+        # Only what replay_spool touches
+        self.agent = NodeAgent.__new__(NodeAgent)
+        self.agent.config = {'spool_replay_batch': 2}
+        self.agent.spool = Spool(os.path.join(state_dir, 'spool.db'))
+        self.agent.replay_limiter = ReplayLimiter(rate=1000, burst=1000, jitter=0)
+        self.agent.replay_limiter.tokens = 1000
+        self.agent.stats = AgentStats()
+        self.agent.spool.push_many([{'n': n} for n in range(5)])
+
+    def replay(self, upload):
+        self.agent.upload = mock.Mock(side_effect=upload)
+        self.agent.replay_spool()
+        return [[sample['n'] for sample in call.args[0]] for call in self.agent.upload.call_args_list]
+
+    def test_rejected_batch_is_set_aside(self):
+        def upload(samples):
+            if samples[0]['n'] == 0:
+                raise UploadRejected(400, 'malformed')
+            return {}
+
+        self.assertEqual(self.replay(upload), [[0, 1], [2, 3], [4]])
+        self.assertEqual(self.agent.spool.depth()[0], 0)
+        rejected, = self.agent.spool.db.execute('SELECT COUNT(*) FROM dead_letter').fetchone()
+        self.assertEqual(rejected, 2)
+
+    def test_too_large_batch_is_split(self):
+        def upload(samples):
+            if len(samples) > 1:
+                raise UploadRejected(413, 'too large')
+            return {}
+
+        self.assertEqual(self.replay(upload), [[0, 1], [0], [1], [2], [3], [4]])
+        self.assertEqual(self.agent.spool.depth()[0], 0)
+
+    def test_transient_failure_stops_replay(self):
+        self.assertEqual(self.replay(lambda samples: None), [[0, 1]])
+        self.assertEqual(self.agent.spool.depth()[0], 5)
+
+class FakeSocket:
+    """Connection answering every frame with one canned reply"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.sent = []
+
+    def send(self, frame):
+        self.sent.append(json.loads(frame))
+
+    def recv(self):
+        return json.dumps({**self.reply, 'seq': self.sent[-1]['seq']})
+
+class WebSocketTransportTests(unittest.TestCase):
+    def test_nack_is_returned_with_retry_after(self):
+        transport = WebSocketTransport('ws://server/ws/agent/', 'key')
+        transport.ws = FakeSocket({'type': 'nack', 'error': 'Ingest queue is full', 'retry_after': 30})
+
+        reply = transport.send('payload')
+
+        self.assertEqual((reply['type'], reply['retry_after']), ('nack', 30))
+        self.assertEqual(transport.last_acked, 0)
+
+if __name__ == '__main__':
+    unittest.main()
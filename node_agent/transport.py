@@ -0,0 +1,94 @@
+"""
+SATORI Node Agent WebSocket transport
+Streams encrypted uploads over one persistent, authenticated connection
+"""
+
+import json
+import logging
+
+logger = logging.getLogger('satori-agent')
+
+class WebSocketTransport:
+    """Persistent upload channel to the server's agent stream consumer
+
+    Each upload is sent as a ``{'seq', 'data', 'compression'}`` frame and
+    acknowledged by the server with the same sequence number. On connect
+    the server announces the last sequence it stored; a frame lost with a
+    dropped connection is resent once after reconnecting, unless that
+    announcement shows it was already stored. The server checks the
+    sequence again in the transaction storing the rows, so a frame whose
+    ack timed out while it was being stored is not stored twice. A frame the server refused
+    is answered with a nack, which may carry a ``retry_after`` in seconds
+    when the server is shedding load.
+    """
+
+    def __init__(self, url, api_key, timeout=10):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.ws = None
+        self.seq = 0
+        self.last_acked = 0
+
+    def _connect(self):
+        """Open the connection and resume from the server's last sequence"""
+        import websocket
+
+        self.ws = websocket.create_connection(
+            self.url,
+            header=[f'X-Node-API-Key: {self.api_key}'],
+            timeout=self.timeout
+        )
+        hello = json.loads(self.ws.recv())
+        self.last_acked = hello.get('last_seq') or 0
+        self.seq = max(self.seq, self.last_acked)
+        logger.info(f"Streaming to {self.url}, resuming after frame {self.last_acked}")
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+    def _exchange(self, seq, frame):
+        """Send a frame and wait for its acknowledgement"""
+        self.ws.send(frame)
+        while True:
+            reply = json.loads(self.ws.recv())
+            if reply.get('seq') == seq:
+                return reply
+
+    def send(self, encrypted, compression=None):
+        """Send one encrypted upload, returning the server's ack or nack, or None"""
+        seq = None
+        frame = None
+
+        for attempt in range(2):
+            try:
+                if self.ws is None:
+                    self._connect()
+                    if seq is not None and self.last_acked >= seq:
+                        # Stored before the connection dropped
+                        return {'type': 'ack', 'seq': seq, 'duplicate': True}
+
+                if seq is None:
+                    self.seq += 1
+                    seq = self.seq
+                    frame = json.dumps({'seq': seq, 'data': encrypted, 'compression': compression})
+
+                reply = self._exchange(seq, frame)
+            except Exception as e:
+                logger.warning(f"WebSocket upload failed: {e}")
+                self.close()
+                continue
+
+            if reply.get('type') == 'ack':
+                self.last_acked = seq
+                return reply
+
+            logger.error(f"Server rejected frame {seq}: {reply.get('error')}")
+            return reply
+
+        return None